@@ -0,0 +1,357 @@
+"""HTTP API for converting maps without the Streamlit page.
+
+Every converter format (json, toml, yaml, cypher, graph, gml) is served
+from map text, an onlinewardleymaps.com map ID or a path in the GitHub map
+repository. Conversions run in a bounded process pool and are written to
+the content-addressed export cache (see ParsedMap.export), so a map is
+converted once per format no matter how often or by whom it is requested,
+and concurrent requests for the same output share one conversion.
+
+    GET  /health
+    GET  /formats
+    GET  /convert/<format>?map_id=<OWM id>  or  ?path=<repository path>
+    POST /convert/<format>   body: map text, or JSON {"text" | "map_id" | "path": ...}
+    POST /bulk               body: JSON {"formats": [...], "maps": [{"id": ..., "text" | "map_id" | "path": ...}]}
+
+Each /bulk result has the map's "outputs" by format, an "error" if the map
+could not be read, and "errors" by format for conversions that failed.
+
+    python api_server.py --port 8502 --workers 4
+
+The map sources are passed to ConversionService, so tests can run the
+service with stub OWM and GitHub clients and no network access. With a
+map_loader.MapLoader, the maps of a bulk request are fetched concurrently
+and each one is converted as soon as it arrives.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from converters import CONVERTERS
+from map_cache import ParsedMap, export_path, map_hash
+
+MAX_BODY_BYTES = 50 * 1024 * 1024
+MAX_BULK_MAPS = 500
+COPY_CHUNK = 64 * 1024
+CONTENT_TYPES = {
+    "json": "application/json",
+    "toml": "application/toml",
+    "yaml": "application/yaml",
+    "cypher": "text/plain",
+    "graph": "application/json",
+    "gml": "text/plain",
+}
+
+
+def export_map(map_text, fmt):
+    """Convert map_text to fmt in a worker process; return the export file path."""
+    return ParsedMap(map_text).export(fmt)
+
+
+def _read_when_done(future):
+    """Return a Future of the text of the export file that future resolves to.
+
+    The file is read as soon as the conversion finishes, before the exports
+    of a large bulk request can prune it from the export cache.
+    """
+    text = Future()
+
+    def read(done):
+        try:
+            with open(done.result(), "r", encoding="utf-8") as file:
+                text.set_result(file.read())
+        except Exception as e:  # pylint: disable=broad-except
+            text.set_exception(e)
+
+    future.add_done_callback(read)
+    return text
+
+
+class ConversionService:
+    """Resolve map sources and convert them through a process pool and the export cache."""
+
+    def __init__(self, owm_client=None, repo=None, workers=None, loader=None):
+        self.owm_client = owm_client
+        self.repo = repo
+        self.loader = loader
+        # Spawned workers do not inherit the server's threads and locks
+        self._pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, request):
+        """Return the map text for a request dict with "text", "map_id" or "path"."""
+        if isinstance(request.get("text"), str):
+            return request["text"]
+        if request.get("map_id"):
+            if self.owm_client is None:
+                raise LookupError("Fetching maps by ID is not enabled")
+            map_text = self.owm_client.get(request["map_id"])
+            if not isinstance(map_text, str):
+                raise LookupError(f"Map {request['map_id']} could not be fetched")
+            return map_text
+        if request.get("path"):
+            if self.repo is None:
+                raise LookupError("Reading maps from the repository is not enabled")
+            try:
+                return self.repo.read(request["path"])
+            except KeyError:
+                raise LookupError(f"No map at {request['path']}") from None
+        raise ValueError('Give the map as "text", "map_id" or "path"')
+
+    def _forget(self, key):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def submit(self, map_text, fmt):
+        """Return (content hash, Future of the export path) for map_text in fmt."""
+        if fmt not in CONVERTERS:
+            raise LookupError(f"Unknown format {fmt}; choose from {', '.join(sorted(CONVERTERS))}")
+        digest = map_hash(map_text)
+        path = export_path(digest, fmt)
+        if os.path.exists(path):
+            done = Future()
+            done.set_result(path)
+            return digest, done
+        key = (digest, fmt)
+        with self._lock:
+            future = self._inflight.get(key)
+            started = future is None
+            if started:
+                future = self._pool.submit(export_map, map_text, fmt)
+                self._inflight[key] = future
+        if started:
+            # Outside the lock: a future that is already done runs the callback right here
+            future.add_done_callback(lambda _: self._forget(key))
+        return digest, future
+
+    def open(self, map_text, fmt):
+        """Return (content hash, open binary file) of map_text converted to fmt."""
+        for _ in range(2):
+            digest, future = self.submit(map_text, fmt)
+            try:
+                return digest, open(future.result(), "rb")  # pylint: disable=consider-using-with
+            except FileNotFoundError:
+                continue  # Pruned from the export cache meanwhile; convert again
+        raise OSError(f"Could not keep the {fmt} export of {digest} on disk")
+
+    def _source(self, item):
+        """Return the map_loader source of a bulk item to fetch, or None to resolve it here."""
+        if self.loader is None or not isinstance(item, dict) or isinstance(item.get("text"), str):
+            return None
+        if item.get("map_id") and self.owm_client is not None:
+            return f"owm:{item['map_id']}"
+        if item.get("path") and self.repo is not None:
+            return f"github:{item['path']}"
+        return None
+
+    def bulk(self, request):
+        """Convert many maps to many formats; return one result dict per map."""
+        formats = request.get("formats") or sorted(CONVERTERS)
+        maps = request.get("maps")
+        if not isinstance(maps, list) or not maps:
+            raise ValueError('"maps" must be a non-empty list')
+        if len(maps) > MAX_BULK_MAPS:
+            raise ValueError(f"At most {MAX_BULK_MAPS} maps per request")
+
+        # Submit everything first so the pool works on all maps at once
+        pending = [None] * len(maps)
+
+        def start(i, item, record=None):
+            result = {"id": item.get("id", i) if isinstance(item, dict) else i}
+            map_text, texts = None, {}
+            try:
+                if record is None:
+                    map_text = self.resolve(item)
+                elif "error" in record:
+                    raise LookupError(f"{record['source']} could not be fetched: {record['error']}")
+                else:
+                    map_text = record["text"]
+                for fmt in formats:
+                    result["hash"], future = self.submit(map_text, fmt)
+                    texts[fmt] = _read_when_done(future)
+            except (LookupError, ValueError, AttributeError) as e:
+                result["error"] = str(e)
+                texts = {}
+            pending[i] = (result, map_text, texts)
+
+        fetch = {}
+        for i, item in enumerate(maps):
+            source = self._source(item)
+            if source is None:
+                start(i, item)
+            else:
+                fetch[i] = source
+        if fetch:
+            # Fetched concurrently, each map is converted as soon as it arrives
+            rows = list(fetch)
+            self.loader.load(
+                [fetch[i] for i in rows], on_result=lambda k, record: start(rows[k], maps[rows[k]], record)
+            )
+
+        results = []
+        for result, map_text, texts in pending:
+            outputs, errors = {}, {}
+            for fmt, text in texts.items():
+                try:
+                    try:
+                        outputs[fmt] = text.result()
+                    except FileNotFoundError:
+                        # Pruned before it could be read; convert it again
+                        with self.open(map_text, fmt)[1] as file:
+                            outputs[fmt] = file.read().decode("utf-8")
+                except Exception as e:  # pylint: disable=broad-except
+                    errors[fmt] = f"{type(e).__name__}: {e}"
+            if texts:
+                result["outputs"] = outputs
+            if errors:
+                result["errors"] = errors
+            results.append(result)
+        return results
+
+    def close(self):
+        self._pool.shutdown(cancel_futures=True)
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Routes requests to the ConversionService of the server."""
+
+    server_version = "wm2many"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, error):
+        if isinstance(error, LookupError):
+            status = 404
+        elif isinstance(error, ValueError):
+            status = 400
+        else:
+            status = 500
+        self._send_json(status, {"error": str(error)})
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            raise ValueError(f"Request body over {MAX_BODY_BYTES} bytes")
+        return self.rfile.read(length)
+
+    def _read_request(self):
+        body = self._read_body()
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            request = json.loads(body)
+            if not isinstance(request, dict):
+                raise ValueError("Expected a JSON object")
+            return request
+        return {"text": body.decode("utf-8", errors="replace")}
+
+    def _send_conversion(self, fmt, request):
+        digest, file = self.service.open(self.service.resolve(request), fmt)
+        with file:
+            etag = f'"{digest}-{fmt}"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPES[fmt] + "; charset=utf-8")
+            self.send_header("Content-Length", str(os.fstat(file.fileno()).st_size))
+            self.send_header("ETag", etag)
+            self.send_header("X-Content-Hash", digest)
+            self.end_headers()
+            # Stream the export file instead of loading it into memory
+            for chunk in iter(lambda: file.read(COPY_CHUNK), b""):
+                self.wfile.write(chunk)
+
+    def _route(self, method):
+        url = urlsplit(self.path)
+        try:
+            if method == "GET" and url.path == "/health":
+                self._send_json(200, {"status": "ok"})
+            elif method == "GET" and url.path == "/formats":
+                self._send_json(200, {"formats": sorted(CONVERTERS)})
+            elif url.path.startswith("/convert/"):
+                fmt = url.path[len("/convert/"):]
+                if method == "GET":
+                    request = {key: values[0] for key, values in parse_qs(url.query).items()}
+                else:
+                    request = self._read_request()
+                self._send_conversion(fmt, request)
+            elif method == "POST" and url.path == "/bulk":
+                request = json.loads(self._read_body())
+                if not isinstance(request, dict):
+                    raise ValueError("Expected a JSON object")
+                self._send_json(200, {"results": self.service.bulk(request)})
+            else:
+                self._send_json(404, {"error": f"No route for {method} {url.path}"})
+        except Exception as e:  # pylint: disable=broad-except
+            self._send_error(e)
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+
+def make_server(host, port, service):
+    """Return a threaded HTTP server answering with service."""
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve Wardley Map conversions over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8502)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Conversion processes")
+    parser.add_argument("--repo", default="swardley/MAP-REPOSITORY", help="GitHub map repository")
+    parser.add_argument("--no-fetch", action="store_true", help="Only convert map text sent in requests")
+    args = parser.parse_args(argv)
+
+    owm_client = repo = loader = None
+    if not args.no_fetch:
+        from github_snapshot import RepoSnapshot
+        from map_loader import MapLoader
+        from owm_client import OWMClient
+
+        owm_client = OWMClient()
+        repo = RepoSnapshot(args.repo, os.environ.get("GITHUB_TOKEN")).start()
+        loader = MapLoader(
+            repo=args.repo, token=os.environ.get("GITHUB_TOKEN"), owm_client=owm_client, snapshot=repo
+        )
+
+    service = ConversionService(owm_client, repo, args.workers, loader)
+    server = make_server(args.host, args.port, service)
+    print(f"Serving conversions on http://{args.host}:{server.server_port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,27 +1,21 @@
-import os, re, json, toml, base64
+# Heavy dependencies (wardley_map, networkx, pyvis, toml, yaml, requests) are
+# imported where a conversion first needs them, keeping cold starts fast
+import os
+from functools import partial
 import streamlit as st
 import streamlit.components.v1 as components
 from streamlit_option_menu import option_menu
-from pyvis.network import Network
-import yaml
-import networkx as nx
-from github import Github
-from wardley_map import (
-    create_wardley_map_plot,
-    get_owm_map,
-    convert_owm2json,
-    convert_owm2toml,
-    convert_owm2cypher,
-    convert_owm2graph,
-    convert_owm2yaml,
-    parse_wardley_map
-)
+from map_cache import cache_stats, get_parsed_map, read_lines
+import instrumentation
 
 API_ENDPOINT = "https://api.onlinewardleymaps.com/v1/maps/fetch?id="
-GITHUB = st.secrets["GITHUB"]
 GITHUBREPO = "swardley/MAP-REPOSITORY"
-DEBUG = True  # True to overwrite files that already exist
+DEBUG = os.environ.get("WM2MANY_DEBUG") == "1"  # Show the timing and profiling panel
 MAP_ID = None
+PREVIEW_LINES = 500  # Lines of converted output shown per preview page
+PREFETCH_NEIGHBOURS = 2  # Repository maps prepared either side of the selected one
+SYNC_SECONDS = 300  # How often the cross-map indexes pick up changed maps
+CLUSTER_ABOVE = 500  # Graph nodes above which the graph view starts clustered
 
 # Dictionary of map IDs with user-friendly names
 map_dict = {
@@ -46,6 +40,9 @@ def reset_map():
 
 st.set_page_config(page_title="Convert Wardley Map", layout="wide")
 
+# Time each stage of this rerun; profile it if asked to from the debug panel
+RUN = instrumentation.Run(profile=DEBUG and st.session_state.pop("profile_run", False))
+
 if "map_text" not in st.session_state:
     st.session_state["map_text"] = []
 
@@ -63,18 +60,132 @@ with st.sidebar:
             "WM to CYPHER",
             "WM to GML",
             "JSON to TOML",
+            "WM to PARQUET",
+            "Across All Maps",
         ],
-        icons=["gear"] * 6,
+        icons=["gear"] * 8 + ["diagram-3"],
         menu_icon="robot",
         default_index=0,
     )
 
-try:
-    g = Github(GITHUB)
-    REPO = g.get_repo(GITHUBREPO)
-except GithubException as e:
-    st.error(f"An error occurred contacting GitHub: {e}")
-    REPO = None
+
+# One snapshot of the map repository, shared by every session and kept current in the background
+@st.cache_resource
+def get_repo_snapshot():
+    from github_snapshot import RepoSnapshot
+
+    return RepoSnapshot(GITHUBREPO, st.secrets.get("GITHUB")).start()
+
+
+# Background worker that parses and draws the maps next to the current selection
+@st.cache_resource
+def get_prefetcher():
+    from concurrent.futures import ThreadPoolExecutor
+
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+
+
+def prefetch_map(map_text, images):
+    get_parsed_map(map_text)
+    images.get(map_text)
+
+
+# One cached OWM client for every session, warmed with the predefined maps
+@st.cache_resource
+def get_owm_client():
+    from owm_client import OWMClient
+
+    client = OWMClient(API_ENDPOINT)
+    client.prefetch(map_dict.values())
+    return client
+
+
+# Loader fetching many maps concurrently, sharing the OWM cache and the repository snapshot
+@st.cache_resource
+def get_map_loader():
+    from map_loader import MapLoader
+
+    return MapLoader(
+        owm_url=API_ENDPOINT,
+        repo=GITHUBREPO,
+        token=st.secrets.get("GITHUB"),
+        owm_client=get_owm_client(),
+        snapshot=get_repo_snapshot(),
+    )
+
+
+# Sidebar images drawn once per map text, pre-rendered for the predefined maps
+@st.cache_resource
+def get_map_images():
+    from map_images import MapImages
+
+    images = MapImages()
+    client = get_owm_client()
+    images.prewarm(partial(client.get, map_id) for map_id in map_dict.values())
+    return images
+
+
+# Repository maps pre-rendered in the background, once, when the GitHub source is first selected
+@st.cache_resource
+def prewarm_repository_images():
+    repo = get_repo_snapshot()
+
+    def repository_maps():
+        for path in repo.paths():
+            yield partial(repo.read, path)
+
+    return get_map_images().prewarm(repository_maps())
+
+
+# Run sync() now and then every interval seconds in a daemon thread
+def keep_in_sync(name, sync, interval=SYNC_SECONDS):
+    import threading
+    import time
+
+    def sync_forever():
+        while True:
+            try:
+                sync()
+            except Exception as e:  # pylint: disable=broad-except
+                print(f"Error updating the {name}: {e}")
+            time.sleep(interval)
+
+    threading.Thread(target=sync_forever, name=name.replace(" ", "-"), daemon=True).start()
+
+
+# Merged graph of every repository and predefined map, kept up to date in the background
+@st.cache_resource
+def get_knowledge_graph():
+    from knowledge_graph import KnowledgeGraph
+
+    graph = KnowledgeGraph()
+    repo = get_repo_snapshot()
+    client = get_owm_client()
+
+    def sync():
+        graph.update("github", sorted(repo.head()[1].items()))
+        graph.update("owm", ((map_id, client.get(map_id)) for map_id in map_dict.values()))
+
+    keep_in_sync("knowledge graph", sync)
+    return graph
+
+
+# Search index of the repository maps, re-indexed whenever the head commit changes
+@st.cache_resource
+def get_search_index():
+    from search_index import SearchIndex
+
+    index = SearchIndex()
+    repo = get_repo_snapshot()
+
+    def sync():
+        # The SHA and the maps are taken together, so a refresh in between cannot mix them
+        sha, files = repo.head()
+        index.update("github", sorted(files.items()), sha=sha)
+
+    keep_in_sync("search index", sync)
+    return index
+
 
 map_selection = st.sidebar.radio(
     "Map Selection",
@@ -88,30 +199,51 @@ if map_selection == "Select from List":
     MAP_ID = map_dict[selected_name]
 
 elif map_selection == "Select from GitHub":
+    import requests
+
+    REPO = get_repo_snapshot()
+    SEARCH = get_search_index()  # Starts indexing in the background on first use
+    prewarm_repository_images()
     with st.spinner("Fetching latest maps from GitHub"):
-        if "file_list" not in st.session_state:
-            st.session_state.file_list = []
-            contents = REPO.get_contents("")
-            while contents:
-                file_item = contents.pop(0)
-                if file_item.type == "dir":
-                    contents.extend(REPO.get_contents(file_item.path))
-                else:
-                    file_name = file_item.name
-                    # Check if the file name starts with a '.', has no extension, or is named 'LICENSE'
-                    if (
-                        not file_name.startswith(".")
-                        and os.path.splitext(file_name)[1] == ""
-                        and file_name.lower() != "license"
-                    ):
-                        st.session_state.file_list.append(file_item.path)
+        try:
+            with RUN.stage("github_index"):
+                st.session_state.file_list = REPO.paths()
+        except requests.RequestException as e:
+            st.error(f"An error occurred contacting GitHub: {e}")
 
     if "file_list" in st.session_state:
-        selected_file = st.sidebar.selectbox("Select a Map", st.session_state.file_list)
-        file_item = REPO.get_contents(selected_file)
-        file_content = base64.b64decode(file_item.content).decode("utf-8")
+        file_list = st.session_state.file_list
+        query = st.sidebar.text_input(
+            "Search maps",
+            key="map_search",
+            help="Words from map titles, components, pipelines, notes or annotations",
+        )
+        if query:
+            from search_index import SEARCH_LIMIT
+
+            with RUN.stage("search"):
+                # One more than is shown, to tell whether the results were cut off
+                matches = [hit["key"] for hit in SEARCH.search(query, source="github", limit=SEARCH_LIMIT + 1)]
+            if len(matches) > SEARCH_LIMIT:
+                matches = matches[:SEARCH_LIMIT]
+                st.sidebar.caption(f"Showing the best {SEARCH_LIMIT} matches; add words to narrow the search")
+            if matches:
+                file_list = matches
+            else:
+                st.sidebar.caption("No maps match the search")
+        selected_file = st.sidebar.selectbox("Select a Map", file_list)
         MAP_ID = selected_file
-        st.session_state["file_content"] = file_content
+        with RUN.stage("github_read"):
+            try:
+                st.session_state["file_content"] = REPO.read(selected_file)
+            except KeyError:
+                # A search hit indexed from an older snapshot of the repository
+                st.session_state["file_content"] = []
+                st.sidebar.warning(f"{selected_file} is no longer in the repository")
+        if st.session_state.get("current_map_id") != MAP_ID:
+            # Have the maps either side of the selection ready before they are chosen
+            for neighbour in REPO.neighbours(selected_file, PREFETCH_NEIGHBOURS):
+                get_prefetcher().submit(prefetch_map, REPO.read(neighbour), get_map_images())
 else:
     MAP_ID = st.sidebar.text_input("Enter Map ID:", key="map_id_input")
     selected_name = MAP_ID
@@ -121,54 +253,183 @@ if map_selection != "Select from GitHub":
         reset_map()
         del st.session_state["messages"]
         st.session_state["current_map_id"] = MAP_ID
-        st.session_state["map_text"] = get_owm_map(MAP_ID)
+        with RUN.stage("owm_fetch"):
+            st.session_state["map_text"] = get_owm_client().get(MAP_ID)
 
 if map_selection == "Select from GitHub":
     if st.session_state.get("current_map_id") != MAP_ID:
         reset_map()
         st.session_state["current_map_id"] = MAP_ID
-        st.session_state["map_text"] = st.session_state["file_content"]
+    # Pick up new revisions of the selected map as the repository index refreshes
+    st.session_state["map_text"] = st.session_state.get("file_content", [])
 
 # Display the map in the sidebar
 if "map_text" in st.session_state:
     with st.sidebar:
-        TITLE = "No Title"
-        map_text = st.session_state["map_text"]
-        for line in map_text.split("\n"):
-            if line.startswith("title"):
-                TITLE = line.split("title ")[1]
+        # Parse the map once; every view below reuses the shared parse
+        # A new revision of the same map only re-parses the lines that changed
+        previous = None
+        if st.session_state.get("parsed_map_id") == st.session_state["current_map_id"]:
+            previous = st.session_state.get("parsed_map")
+        with RUN.stage("parse"):
+            parsed = get_parsed_map(st.session_state["map_text"], previous=previous)
+        st.session_state["parsed_map"] = parsed
+        st.session_state["parsed_map_id"] = st.session_state["current_map_id"]
+        TITLE = parsed.title
         if TITLE:
             st.markdown(f"### {TITLE}")
 
-        # Get the Wardley Map
-        map, map_plot = create_wardley_map_plot(map_text)
+        # Get the Wardley Map, drawn at most once per map text
+        with RUN.stage("plot"):
+            map_image, map_warnings = get_map_images().get(parsed.text)
+        st.image(map_image)
 
         # Display any warnings drawing the map
-        if map.warnings:
+        if map_warnings:
             st.write("Warnings parsing and the drawing map")
-            for map_message in map.warnings:
+            for map_message in map_warnings:
                 st.warning(map_message)
 
+
+# Show a paged preview of a text file, with a download that reads it when clicked
+def show_file(path, total_lines, label, file_name, key, read, mime=None, language=None):
+    # The file is only read when the button is clicked, so no session holds its content
+    st.download_button(label, data=read, file_name=file_name, mime=mime, on_click="ignore")
+
+    pages = max(1, -(-total_lines // PREVIEW_LINES))
+    page = 1
+    if pages > 1:
+        page = st.number_input(
+            f"Preview page (of {pages}, {PREVIEW_LINES} lines each)",
+            min_value=1,
+            max_value=pages,
+            key=f"preview_page_{key}",
+        )
+    with RUN.stage("render_output"):
+        st.code(read_lines(path, (page - 1) * PREVIEW_LINES, PREVIEW_LINES), language=language)
+
+
+def read_file(path):
+    with open(path, "rb") as file:
+        return file.read()
+
+
+# Show a paged preview of a converted output, with a download read from its export file
+def show_output(fmt, label, file_name, mime=None, language=None):
+    with RUN.stage(f"convert_{fmt}"):
+        path = parsed.export(fmt)
+        total_lines = parsed.line_count(fmt)
+
+    # Exported again if the file was pruned from the cache meanwhile
+    def read_export():
+        return read_file(parsed.export(fmt))
+
+    show_file(path, total_lines, label, file_name, fmt, read_export, mime, language)
+
+
+# Show the component graph: PyVis HTML, or clusters expanded on demand for large maps
+def show_graph(node_size):
+    with RUN.stage("graph_build"):
+        graph_nodes = parsed.graph().number_of_nodes()
+    # Unkeyed, so the default is applied again when a map of the other size is shown
+    clustered = st.toggle(
+        "Cluster by pipeline and evolution stage", value=graph_nodes > CLUSTER_ABOVE
+    )
+    if not clustered:
+        with RUN.stage("pyvis_html"):
+            html_content = parsed.graph_html(node_size=node_size)
+        components.html(html_content, height=1200)
+        return
+
+    from graph_lod import lod_graph
+
+    with RUN.stage("graph_clusters"):
+        lod = parsed.graph_lod()
+    # Each map starts with the clusters that fit the level-of-detail budget expanded
+    if st.session_state.get("lod_map") != parsed.digest:
+        st.session_state["lod_map"] = parsed.digest
+        st.session_state["lod_expanded"] = lod.default_expanded()
+    if st.button("Collapse all clusters"):
+        st.session_state["lod_expanded"] = set()
+    with RUN.stage("graph_payload"):
+        payload = lod.payload(st.session_state["lod_expanded"], node_size=node_size)
+    event = lod_graph(payload, key="lod_graph")
+    if event and event["event"] != st.session_state.get("lod_event"):
+        st.session_state["lod_event"] = event["event"]
+        if event["action"] == "expand":
+            st.session_state["lod_expanded"].add(event["cluster"])
+        else:
+            st.session_state["lod_expanded"].discard(event["cluster"])
+        st.rerun()
+
+
 if selected == "JSON to TOML":
     st.title("JSON to TOML file converter")
     st.write("			")
     st.write("Let's convert your Wardley Map in JSON to TOML")
     st.write("			")
 
-    json_file = st.file_uploader("UPLOAD JSON FILE")
-    st.info("👆 Upload your json file.")
+    json_files = st.file_uploader("UPLOAD JSON FILES", accept_multiple_files=True)
+    st.info("👆 Upload your json file, or several to get a zip of TOML files.")
+
+    # Uploads are converted as a stream into the export cache, never held as TOML in memory
+    from json_toml import export_upload, export_uploads_zip
+    from map_cache import count_lines
 
-    if json_file is not None:
-        json_text = json_file.read()
-        st.sidebar.write("JSON CONTENT")
-        toml_content = toml.dumps(json.loads(json_text))
-        st.write("TOML FILE CONTENT")
-        st.code(toml_content, language="toml")
-        toml_file_name = json_file.name.replace(".json", ".toml")
+    if len(json_files) == 1:
+        json_file = json_files[0]
+        try:
+            with RUN.stage("convert_upload"):
+                toml_path = export_upload(json_file)
+        except ValueError as e:
+            st.error(f"Could not convert {json_file.name}: {e}")
+        else:
+            st.write("TOML FILE CONTENT")
+            toml_file_name = json_file.name.replace(".json", ".toml")
+            show_file(
+                toml_path,
+                count_lines(toml_path),
+                "DOWNLOAD TOML FILE",
+                toml_file_name,
+                "upload_toml",
+                partial(read_file, toml_path),
+                language="toml",
+            )
+    elif json_files:
+        with RUN.stage("convert_uploads"):
+            zip_path, records = export_uploads_zip(json_files)
+        st.dataframe(records)
         st.download_button(
-            "DOWNLOAD TOML FILE", data=toml_content, file_name=toml_file_name
+            "DOWNLOAD TOML FILES",
+            data=partial(read_file, zip_path),
+            file_name="toml_files.zip",
+            mime="application/zip",
+            on_click="ignore",
         )
-        st.code(json.loads(json_text))
+
+elif selected == "Across All Maps":
+    st.title("Components Across All Maps")
+    st.write("Find where a component is used in the research repository and the predefined maps")
+
+    knowledge = get_knowledge_graph()
+    st.caption(
+        "Indexed {maps} maps with {components} distinct components".format(**knowledge.stats())
+    )
+    prefix = st.text_input("Component name starts with")
+    names = knowledge.names(prefix)
+    if names:
+        component_name = st.selectbox("Component", names)
+        st.write("MAPS USING THIS COMPONENT")
+        st.dataframe(knowledge.maps_using(component_name))
+        st.write("LINKED COMPONENTS ACROSS MAPS")
+        st.dataframe(
+            [
+                {"direction": n["direction"], "name": n["name"], "maps": len(n["maps"])}
+                for n in knowledge.neighbours(component_name)
+            ]
+        )
+    else:
+        st.info("No matching components indexed yet.")
 
 elif selected == "WM to TOML":
     st.title("WM to TOML Converter")
@@ -176,15 +437,10 @@ elif selected == "WM to TOML":
     st.write("Let's convert your Wardley Map in WM to TOML			")
     st.write("			")
 
-    wardley_map_toml = convert_owm2toml(st.session_state.map_text)
     st.write("TOML FILE CONTENT")
 
     toml_file_name = MAP_ID + ".toml"
-    st.download_button(
-        "DOWNLOAD TOML FILE", data=wardley_map_toml, file_name=toml_file_name
-    )
-
-    st.code(wardley_map_toml, language="toml")
+    show_output("toml", "DOWNLOAD TOML FILE", toml_file_name, language="toml")
 
 elif selected == "WM to JSON":
     st.title("WM to JSON File Converter")
@@ -192,290 +448,53 @@ elif selected == "WM to JSON":
     st.write("Let's convert your Wardley Map in WM to JSON")
     st.write("			")
 
-    wardley_map_json = convert_owm2json(st.session_state.map_text)
     st.write("JSON FILE CONTENT")
 
     json_file_name = MAP_ID + ".json"
-    st.download_button(
-        "DOWNLOAD JSON FILE", data=wardley_map_json, file_name=json_file_name
-    )
-
-    st.code(wardley_map_json, language="json")
+    show_output("json", "DOWNLOAD JSON FILE", json_file_name, language="json")
 
 elif selected == "WM to CYPHER":
     st.title("WM to CYPHER Converter")
     st.write("Let's convert your Wardley Map in WM to Cypher queries for Neo4j")
 
     NODE_SIZE = 5  # Adjust this value as needed to make the nodes smaller or larger
-    FONT_SIZE = 6
-
-    # Convert the Wardley map text to JSON (using your existing conversion logic)
-    parsed_map = parse_wardley_map(st.session_state.map_text)
-
-    # Initialize Cypher query list
-    cypher_queries = []
-
-    # Initialize the graph
-    G = nx.DiGraph()
-
-    # Define a color mapping for evolution stages
-    evolution_colors = {
-        "genesis": "#FF5733",
-        "custom": "#33FF57",
-        "product": "#3357FF",
-        "commodity": "#F333FF",
-    }
-
-    # Add nodes with stage (evolution) and visibility
-    for component in parsed_map["components"]:
-        pos_str = component.get("pos", "[0, 0]")
-        x, y = json.loads(pos_str)
-        stage = component.get(
-            "evolution", "unknown"
-        )  # Default to 'unknown' if not specified
-        node_color = evolution_colors.get(
-            stage, "#f68b24"
-        )  # Use a default color if the stage is not found
-        G.add_node(
-            component["name"],
-            stage=stage,
-            visibility=component["visibility"],
-            pos=(x, y),
-            color=node_color,
-        )
-
-    # Add edges with a check for existence of nodes
-    for link in parsed_map["links"]:
-        src, tgt = link["src"], link["tgt"]
-        if src in G and tgt in G:
-            G.add_edge(src, tgt)
-
-    # Process pipelines
-    for pipeline in parsed_map["pipelines"]:
-        # Extract pipeline details
-        pipeline_name = pipeline["name"]
-        pipeline_x = pipeline["x"]  # Left side of the bounding box
-        pipeline_right_side = pipeline["y"]  # Right side of the bounding box
-
-        # Determine the pipeline's vertical position and height
-        matching_component = next(
-            (
-                comp
-                for comp in parsed_map["components"]
-                if comp["name"] == pipeline["name"]
-            ),
-            None,
-        )
-        if matching_component:
-            _, pipeline_y = json.loads(
-                matching_component["pos"]
-            )  # Use the y position of the matching component for the pipeline
-            pipeline_bottom = (
-                pipeline_y - 0.01
-            )  # Assuming the bounding box is 10 units high
-
-        # Ensure the pipeline node exists in the graph
-        try:
-            if pipeline_name not in G.nodes:
-                G.add_node(pipeline_name, type="pipeline", pos=(pipeline_x, pipeline_y))
-        except:
-            st.sidebar.warning("Could not process pipeline")
-
-        # Iterate over components in the pipeline and link them to the pipeline
-        for component_name in pipeline["components"]:
-            # Skip adding an edge to itself if the pipeline is named after a component
-            if component_name == pipeline_name:
-                continue
-
-            if component_name in G.nodes:  # Check if the component node exists
-                component_pos = G.nodes[component_name]["pos"]
-                component_x, component_y = component_pos
-
-                # Check if the component is within the pipeline's bounding box
-                if (
-                    pipeline_x <= component_x <= pipeline_right_side
-                    and pipeline_bottom <= component_y <= pipeline_y
-                ):
-                    # Link the pipeline to the component
-                    G.add_edge(pipeline_name, component_name)
-
-    # Visualization with PyVis
-    net = Network(height="1200px", width="100%", font_color="black")
-    net.toggle_physics(False)
-
-    # Add nodes to the PyVis network with colors based on their stage
-    for node, node_attrs in G.nodes(data=True):
-        pos = node_attrs.get("pos", (0, 0))
-        x, y = pos
-        node_color = node_attrs.get(
-            "color", "#f68b24"
-        )  # Use the color assigned based on the stage
-        net.add_node(
-            node, label=node, x=x * 1700, y=-y * 1000, color=node_color, size=NODE_SIZE
-        )
-
-    # Add edges to the PyVis network
-    for src, tgt in G.edges():
-        net.add_edge(src, tgt)
-
-    # Save and display the network
-    OUTPUT_PATH = "graph.html"
-    net.save_graph(OUTPUT_PATH)
-    with open(OUTPUT_PATH, "r", encoding="utf-8") as file:
-        html_content = file.read()
-    components.html(html_content, height=1200)
 
-    # Generate Cypher queries for nodes
-    cypher_script = convert_owm2cypher(st.session_state.map_text)
+    # Display the component graph, clustered for large maps
+    show_graph(NODE_SIZE)
 
     # Display Cypher script
     st.write("CYPHER FILE CONTENT")
 
     # Add a download button for the Cypher script
+    show_output(
+        "cypher", "Download Cypher Script", "wardley_map_to_cypher.cql", "text/plain", "cypher"
+    )
+
+    # Batched UNWIND script for loading into Neo4j with cypher-shell, built when clicked
+    from cypher_bulk import bulk_cypher_script
+
     st.download_button(
-        label="Download Cypher Script",
-        data=cypher_script,
-        file_name="wardley_map_to_cypher.cql",
+        label="Download Bulk Cypher Script",
+        data=lambda: bulk_cypher_script([(MAP_ID, parsed.text)]),
+        file_name="wardley_map_bulk.cypher",
         mime="text/plain",
+        on_click="ignore",
     )
 
-    st.code(cypher_script, language="cypher")
-
 elif selected == "WM to GRAPH":
 
     st.title("WM to GRAPH Converter")
     st.write("Let's convert your Wardley Map in WM to GRAPH and visualize it.")
 
     NODE_SIZE = 5  # Adjust this value as needed to make the nodes smaller or larger
-    FONT_SIZE = 6
-
-    # Convert the Wardley map text to GRAPH
-    parsed_map = parse_wardley_map(st.session_state.map_text)
-
-    # Initialize the graph
-    G = nx.DiGraph()
-
-    # Define a color mapping for evolution stages
-    evolution_colors = {
-        "genesis": "#FF5733",
-        "custom": "#33FF57",
-        "product": "#3357FF",
-        "commodity": "#F333FF",
-    }
-
-    # Add nodes with stage (evolution) and visibility
-    for component in parsed_map["components"]:
-        pos_str = component.get("pos", "[0, 0]")
-        x, y = json.loads(pos_str)
-        stage = component.get(
-            "evolution", "unknown"
-        )  # Default to 'unknown' if not specified
-        node_color = evolution_colors.get(
-            stage, "#f68b24"
-        )  # Use a default color if the stage is not found
-        G.add_node(
-            component["name"],
-            stage=stage,
-            visibility=component["visibility"],
-            pos=(x, y),
-            color=node_color,
-        )
-
-    # Add edges with a check for existence of nodes
-    for link in parsed_map["links"]:
-        src, tgt = link["src"], link["tgt"]
-        if src in G and tgt in G:
-            G.add_edge(src, tgt)
-
-    # Process pipelines
-    for pipeline in parsed_map["pipelines"]:
-        # Extract pipeline details
-        pipeline_name = pipeline["name"]
-        pipeline_x = pipeline["x"]  # Left side of the bounding box
-        pipeline_right_side = pipeline["y"]  # Right side of the bounding box
-
-        # Determine the pipeline's vertical position and height
-        matching_component = next(
-            (
-                comp
-                for comp in parsed_map["components"]
-                if comp["name"] == pipeline["name"]
-            ),
-            None,
-        )
-        if matching_component:
-            _, pipeline_y = json.loads(
-                matching_component["pos"]
-            )  # Use the y position of the matching component for the pipeline
-            pipeline_bottom = (
-                pipeline_y - 0.01
-            )  # Assuming the bounding box is 10 units high
-
-        # Ensure the pipeline node exists in the graph
-        try:
-            if pipeline_name not in G.nodes:
-                G.add_node(pipeline_name, type="pipeline", pos=(pipeline_x, pipeline_y))
-        except:
-            st.sidebar.warning("Could not process pipeline")
-
-        # Iterate over components in the pipeline and link them to the pipeline
-        for component_name in pipeline["components"]:
-            # Skip adding an edge to itself if the pipeline is named after a component
-            if component_name == pipeline_name:
-                continue
-
-            if component_name in G.nodes:  # Check if the component node exists
-                component_pos = G.nodes[component_name]["pos"]
-                component_x, component_y = component_pos
-
-                # Check if the component is within the pipeline's bounding box
-                if (
-                    pipeline_x <= component_x <= pipeline_right_side
-                    and pipeline_bottom <= component_y <= pipeline_y
-                ):
-                    # Link the pipeline to the component
-                    G.add_edge(pipeline_name, component_name)
-
-    # Visualization with PyVis
-    net = Network(height="1200px", width="100%", font_color="black")
-    net.toggle_physics(False)
-
-    # Add nodes to the PyVis network with colors based on their stage
-    for node, node_attrs in G.nodes(data=True):
-        pos = node_attrs.get("pos", (0, 0))
-        x, y = pos
-        node_color = node_attrs.get(
-            "color", "#f68b24"
-        )  # Use the color assigned based on the stage
-        net.add_node(
-            node, label=node, x=x * 1700, y=-y * 1000, color=node_color, size=NODE_SIZE
-        )
-
-    # Add edges to the PyVis network
-    for src, tgt in G.edges():
-        net.add_edge(src, tgt)
 
-    # Save and display the network
-    OUTPUT_PATH = "graph.html"
-    net.save_graph(OUTPUT_PATH)
-    with open(OUTPUT_PATH, "r", encoding="utf-8") as file:
-        html_content = file.read()
-    components.html(html_content, height=1200)
-
-    # Convert the graph to a JSON format for download
-    graph_json_str = convert_owm2graph(st.session_state.map_text)
+    # Display the component graph, clustered for large maps
+    show_graph(NODE_SIZE)
 
     st.write("JSON FILE CONTENT")
 
-    # Add a download button for the JSON file
-    st.download_button(
-        label="Download Graph JSON",
-        data=graph_json_str,
-        file_name="graph.json",
-        mime="application/json",
-    )
-
-    st.code(graph_json_str, language="json")
+    # Add a download button for the graph in node-link JSON format
+    show_output("graph", "Download Graph JSON", "graph.json", "application/json", "json")
 
 # Handle "WM to GML" option
 elif selected == "WM to GML":
@@ -484,156 +503,114 @@ elif selected == "WM to GML":
     st.write("Let's convert your Wardley Map in WM to GML format and visualize it.")
 
     NODE_SIZE = 5  # Adjust this value as needed to make the nodes smaller or larger
-    FONT_SIZE = 6
-
-    # Convert the Wardley map text to JSON
-    parsed_map = parse_wardley_map(st.session_state.map_text)
-
-    # Initialize the graph
-    G = nx.DiGraph()
-
-    # Define a color mapping for evolution stages
-    evolution_colors = {
-        "genesis": "#FF5733",
-        "custom": "#33FF57",
-        "product": "#3357FF",
-        "commodity": "#F333FF",
-    }
-
-    # Add nodes with stage (evolution) and visibility
-    for component in parsed_map["components"]:
-        pos_str = component.get("pos", "[0, 0]")
-        x, y = json.loads(pos_str)
-        stage = component.get(
-            "evolution", "unknown"
-        )  # Default to 'unknown' if not specified
-        node_color = evolution_colors.get(
-            stage, "#f68b24"
-        )  # Use a default color if the stage is not found
-        G.add_node(
-            component["name"],
-            stage=stage,
-            visibility=component["visibility"],
-            pos=(x, y),
-            color=node_color,
-        )
 
-    # Add edges with a check for existence of nodes
-    for link in parsed_map["links"]:
-        src, tgt = link["src"], link["tgt"]
-        if src in G and tgt in G:
-            G.add_edge(src, tgt)
-
-    # Process pipelines
-    for pipeline in parsed_map["pipelines"]:
-        # Extract pipeline details
-        pipeline_name = pipeline["name"]
-        pipeline_x = pipeline["x"]  # Left side of the bounding box
-        pipeline_right_side = pipeline["y"]  # Right side of the bounding box
-
-        # Determine the pipeline's vertical position and height
-        matching_component = next(
-            (
-                comp
-                for comp in parsed_map["components"]
-                if comp["name"] == pipeline["name"]
-            ),
-            None,
-        )
-        if matching_component:
-            _, pipeline_y = json.loads(
-                matching_component["pos"]
-            )  # Use the y position of the matching component for the pipeline
-            pipeline_bottom = (
-                pipeline_y - 0.01
-            )  # Assuming the bounding box is 10 units high
-
-        # Ensure the pipeline node exists in the graph
-        try:
-            if pipeline_name not in G.nodes:
-                G.add_node(pipeline_name, type="pipeline", pos=(pipeline_x, pipeline_y))
-        except:
-            st.sidebar.warning("Could not process pipeline")
-
-        # Iterate over components in the pipeline and link them to the pipeline
-        for component_name in pipeline["components"]:
-            # Skip adding an edge to itself if the pipeline is named after a component
-            if component_name == pipeline_name:
-                continue
-
-            if component_name in G.nodes:  # Check if the component node exists
-                component_pos = G.nodes[component_name]["pos"]
-                component_x, component_y = component_pos
-
-                # Check if the component is within the pipeline's bounding box
-                if (
-                    pipeline_x <= component_x <= pipeline_right_side
-                    and pipeline_bottom <= component_y <= pipeline_y
-                ):
-                    # Link the pipeline to the component
-                    G.add_edge(pipeline_name, component_name)
-
-    # Visualization with PyVis
-    net = Network(height="1200px", width="100%", font_color="black")
-    net.toggle_physics(False)
-
-    # Add nodes to the PyVis network with colors based on their stage
-    for node, node_attrs in G.nodes(data=True):
-        pos = node_attrs.get("pos", (0, 0))
-        x, y = pos
-        node_color = node_attrs.get(
-            "color", "#f68b24"
-        )  # Use the color assigned based on the stage
-        net.add_node(
-            node, label=node, x=x * 1700, y=-y * 1000, color=node_color, size=NODE_SIZE
-        )
+    # Display the component graph, clustered for large maps
+    show_graph(NODE_SIZE)
 
-    # Add edges to the PyVis network
-    for src, tgt in G.edges():
-        net.add_edge(src, tgt)
+    # Display GML file content (optional, for verification)
+    st.write("GML FILE CONTENT")
 
-    # Save and display the network
-    OUTPUT_PATH = "graph.html"
-    net.save_graph(OUTPUT_PATH)
-    with open(OUTPUT_PATH, "r", encoding="utf-8") as file:
-        html_content = file.read()
-    components.html(html_content, height=1200)
+    # Add a download button for the GML file
+    show_output("gml", "Download GML File", "graph.gml", "text/gml", "gml")
 
-    # Save the graph to a GML file
-    GML_FILE_PATH = "graph.gml"
-    nx.write_gml(G, GML_FILE_PATH)
+# Handle WM to PARQUET option
+elif selected == "WM to PARQUET":
+    st.title("WM to PARQUET Converter")
+    st.write("Let's convert your Wardley Map to typed columnar tables for analytics.")
 
-    # Read the GML file content
-    with open(GML_FILE_PATH, "r") as gml_file:
-        gml_data = gml_file.read()
+    from columnar import map_tables, tables_zip
 
-    # Display GML file content (optional, for verification)
-    st.write("GML FILE CONTENT")
+    with RUN.stage("convert_parquet"):
+        tables = parsed.memoize(("arrow_tables", MAP_ID), lambda pm: map_tables(pm.data, MAP_ID))
 
-    # Add a download button for the GML file
-    st.download_button(
-        label="Download GML File", data=gml_data, file_name="graph.gml", mime="text/gml"
-    )
+    for table_name, table in tables.items():
+        st.write(f"{table_name.upper()} ({table.num_rows} rows)")
+        st.dataframe(table)
 
-    st.code(gml_data, language="gml")
+    for table_format, button_label in [
+        ("parquet", "Download Parquet Tables"),
+        ("arrow", "Download Arrow Tables"),
+    ]:
+        st.download_button(
+            label=button_label,
+            data=lambda table_format=table_format: tables_zip(tables, table_format),
+            file_name=f"wardley_map_{table_format}.zip",
+            mime="application/zip",
+            on_click="ignore",
+        )
 
 # Handle WM to YAML option
 elif selected == "WM to YAML":
     st.title("WM to YAML Converter")
     st.write("Let's convert your Wardley Map in WM to YAML format.")
 
-    # Convert the parsed map to YAML
-    wardley_map_yaml = convert_owm2yaml(st.session_state.map_text)
-
     # Display YAML file content
     st.write("YAML FILE CONTENT")
 
     # Add a download button for the YAML file
-    st.download_button(
-        label="Download YAML File",
-        data=wardley_map_yaml,
-        file_name="wardley_map.yaml",
-        mime="text/yaml",
+    show_output("yaml", "Download YAML File", "wardley_map.yaml", "text/yaml", "yaml")
+
+# Convert a selection of maps at once; they are fetched concurrently and converted as they arrive
+with st.sidebar.expander("Export several maps", expanded=False):
+    if map_selection == "Select from GitHub" and "file_list" in st.session_state:
+        batch_options = {path: f"github:{path}" for path in st.session_state.file_list}
+    else:
+        batch_options = {name: f"owm:{map_id}" for name, map_id in map_dict.items()}
+    batch_maps = st.multiselect("Maps", list(batch_options), key="batch_maps")
+    batch_formats = st.multiselect(
+        "Formats", ["json", "toml", "yaml", "graph", "cypher", "gml"], default=["json"], key="batch_formats"
     )
+    if st.button("Convert maps", disabled=not batch_maps or not batch_formats):
+        from map_loader import export_batch
+
+        batch_sources = [batch_options[name] for name in batch_maps]
+        with st.spinner(f"Fetching and converting {len(batch_maps)} maps"), RUN.stage("batch_export"):
+            st.session_state["batch_export"] = (
+                batch_sources, batch_formats, *export_batch(get_map_loader(), batch_sources, batch_formats)
+            )
+    if "batch_export" in st.session_state:
+        exported_sources, exported_formats, batch_path, batch_records = st.session_state["batch_export"]
+        st.dataframe(batch_records)
+
+        # Exported again if the zip was pruned by other sessions' exports meanwhile
+        def read_batch():
+            import map_loader
+
+            try:
+                return read_file(batch_path)
+            except FileNotFoundError:
+                return read_file(map_loader.export_batch(get_map_loader(), exported_sources, exported_formats)[0])
+
+        st.download_button(
+            "Download converted maps",
+            data=read_batch,
+            file_name="wardley_maps.zip",
+            mime="application/zip",
+            on_click="ignore",
+        )
 
-    st.code(wardley_map_yaml, language="yaml")
+RUN.finish()
+
+# Optional debug panel with this rerun's stage timings and the process totals
+if DEBUG:
+    with st.sidebar.expander("Performance", expanded=False):
+        st.dataframe(RUN.records)
+        st.text("Shared caches")
+        st.dataframe([{"cache": name, **stats} for name, stats in cache_stats().items()])
+        st.button(
+            "Profile next rerun",
+            on_click=lambda: st.session_state.update(profile_run=True),
+        )
+        st.download_button(
+            "Download metrics (JSON lines)", data=RUN.to_jsonl(), file_name="wm2many_metrics.jsonl"
+        )
+        st.download_button(
+            "Download metrics (Prometheus)",
+            data=instrumentation.prometheus_text(),
+            file_name="wm2many_metrics.prom",
+        )
+        if RUN.profile_report:
+            st.text("cProfile (cumulative)")
+            st.code(RUN.profile_report["cprofile"])
+            st.text("tracemalloc (top allocations)")
+            st.code(RUN.profile_report["tracemalloc"])
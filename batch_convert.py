@@ -0,0 +1,145 @@
+"""Convert a whole directory of Wardley Maps from the command line.
+
+Walks a directory of maps (for example a local checkout of MAP-REPOSITORY)
+and writes every selected format for each one, using a process pool so all
+cores are busy. A manifest of content hashes is appended as each map
+finishes, so an interrupted run resumes where it stopped and unchanged maps
+are skipped on the next run. Outputs written under an older CACHE_VERSION,
+before a converter's output changed, are written again.
+
+    python batch_convert.py MAP-REPOSITORY out/ --formats json gml --workers 8
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from converters import CONVERTERS, EXTENSIONS
+from map_cache import CACHE_VERSION, ParsedMap, map_hash, write_chunks
+from map_files import find_maps
+
+MANIFEST_NAME = "manifest.jsonl"
+
+
+def output_path(output_dir, rel_path, fmt):
+    return os.path.join(output_dir, os.path.splitext(rel_path)[0] + EXTENSIONS[fmt])
+
+
+def load_manifest(output_dir):
+    """Return {relative path: manifest record} for maps already converted."""
+    done = {}
+    try:
+        with open(os.path.join(output_dir, MANIFEST_NAME), "r", encoding="utf-8") as manifest:
+            for line in manifest:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # A torn last line from an interrupted run
+                done[record["path"]] = record
+    except OSError:
+        pass
+    return done
+
+
+def convert_file(input_dir, output_dir, rel_path, formats):
+    """Convert one map in a worker process and return its manifest record."""
+    started = time.perf_counter()
+    with open(os.path.join(input_dir, rel_path), "r", encoding="utf-8", errors="replace") as file:
+        map_text = file.read()
+    record = {"path": rel_path, "hash": map_hash(map_text), "version": CACHE_VERSION, "formats": [], "bytes": 0}
+    try:
+        parsed = ParsedMap(map_text)
+        for fmt in formats:
+            # Stream each output straight to its file instead of building it in memory
+            written = write_chunks(output_path(output_dir, rel_path, fmt), parsed.iter_convert(fmt))
+            record["formats"].append(fmt)
+            record["bytes"] += written
+    except Exception as e:  # pylint: disable=broad-except
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["seconds"] = round(time.perf_counter() - started, 6)
+    return record
+
+
+def is_current(record, map_text_hash, formats, output_dir):
+    """Return True if a manifest record already covers this content and formats."""
+    return (
+        record is not None
+        and record["hash"] == map_text_hash
+        and record.get("version") == CACHE_VERSION
+        and "error" not in record
+        and set(formats) <= set(record["formats"])
+        and all(os.path.exists(output_path(output_dir, record["path"], f)) for f in formats)
+    )
+
+
+def run(input_dir, output_dir, formats, workers=None, force=False):
+    """Convert every map below input_dir and return a summary of the run."""
+    os.makedirs(output_dir, exist_ok=True)
+    done = {} if force else load_manifest(output_dir)
+
+    pending, skipped = [], 0
+    for rel_path in find_maps(input_dir):
+        with open(os.path.join(input_dir, rel_path), "rb") as file:
+            content_hash = map_hash(file.read().decode("utf-8", errors="replace"))
+        if is_current(done.get(rel_path), content_hash, formats, output_dir):
+            skipped += 1
+        else:
+            pending.append(rel_path)
+
+    started = time.perf_counter()
+    converted = failed = total_bytes = 0
+    with open(os.path.join(output_dir, MANIFEST_NAME), "a", encoding="utf-8") as manifest:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(convert_file, input_dir, output_dir, rel_path, formats)
+                for rel_path in pending
+            ]
+            for future in as_completed(futures):
+                record = future.result()
+                # Record each map as soon as it is written so a rerun can resume
+                manifest.write(json.dumps(record) + "\n")
+                manifest.flush()
+                if "error" in record:
+                    failed += 1
+                    print(f"Error converting {record['path']}: {record['error']}", file=sys.stderr)
+                else:
+                    converted += 1
+                    total_bytes += record["bytes"]
+                finished = converted + failed
+                if finished % 100 == 0:
+                    elapsed = time.perf_counter() - started
+                    print(f"{finished}/{len(pending)} maps, {finished / elapsed:.1f} maps/s", file=sys.stderr)
+
+    elapsed = time.perf_counter() - started
+    return {
+        "converted": converted,
+        "failed": failed,
+        "skipped": skipped,
+        "seconds": round(elapsed, 3),
+        "maps_per_second": round(converted / elapsed, 2) if elapsed else 0.0,
+        "output_mb_per_second": round(total_bytes / 1e6 / elapsed, 2) if elapsed else 0.0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a directory of Wardley Maps to many formats.")
+    parser.add_argument("input_dir", help="Directory of map files, e.g. a MAP-REPOSITORY checkout")
+    parser.add_argument("output_dir", help="Directory the converted files are written to")
+    parser.add_argument(
+        "--formats", nargs="+", choices=sorted(CONVERTERS), default=list(EXTENSIONS),
+        help="Formats to write (default: all)",
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes")
+    parser.add_argument("--force", action="store_true", help="Reconvert maps even if unchanged")
+    args = parser.parse_args(argv)
+
+    summary = run(args.input_dir, args.output_dir, args.formats, args.workers, args.force)
+    print(json.dumps(summary))
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""Freeze the predefined maps from app.py's map_dict into benchmarks/corpus.
+
+The benchmark suite reads real maps from disk so its results do not depend
+on the network or on later edits to the maps. Run this once with network
+access, and again whenever the corpus should be refreshed.
+
+    python benchmarks/freeze_corpus.py
+"""
+
+import ast
+import os
+import re
+import sys
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(os.path.dirname(BENCH_DIR), "app.py")
+CORPUS_DIR = os.path.join(BENCH_DIR, "corpus")
+OWM_API = "https://api.onlinewardleymaps.com/v1/maps/fetch?id="
+
+
+def read_map_dict():
+    """Return app.py's map_dict without running the Streamlit script."""
+    with open(APP_PATH, "r", encoding="utf-8") as file:
+        tree = ast.parse(file.read())
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+            isinstance(target, ast.Name) and target.id == "map_dict" for target in node.targets
+        ):
+            return ast.literal_eval(node.value)
+    raise LookupError("map_dict not found in app.py")
+
+
+def main():
+    os.makedirs(CORPUS_DIR, exist_ok=True)
+    failed = 0
+    for name, map_id in read_map_dict().items():
+        file_name = re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_") + ".wm"
+        try:
+            response = requests.get(OWM_API + map_id, timeout=30)
+            response.raise_for_status()
+            map_text = response.json()["text"]
+        except (requests.RequestException, ValueError, KeyError) as e:
+            print(f"Could not fetch {name} ({map_id}): {e}", file=sys.stderr)
+            failed += 1
+            continue
+        with open(os.path.join(CORPUS_DIR, file_name), "w", encoding="utf-8") as out:
+            out.write(map_text)
+        print(f"Froze {name} -> corpus/{file_name}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
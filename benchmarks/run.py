@@ -0,0 +1,178 @@
+"""Benchmark parsing, every converter and the graph views over maps of growing size.
+
+Targets run over synthetic maps (see synthetic.py) and over the frozen real
+maps in benchmarks/corpus (see freeze_corpus.py). For each target and map
+the suite reports throughput in components per second, latency percentiles
+and the peak traced memory of one run. Results can be saved as a baseline
+and later runs compared against it; any target whose median latency is
+more than --tolerance slower than the baseline fails the check.
+
+    python benchmarks/run.py --save-baseline
+    python benchmarks/run.py --sizes 10 100 1000 10000 100000 --tolerance 0.25
+"""
+
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+# pylint: disable=wrong-import-position
+import wardley_map
+from compact_map import CompactMap
+from converters import CONVERTERS
+from graph_metrics import GraphMetrics
+from map_graph import build_graph
+from render import graph_html
+from synthetic import generate_map
+
+CORPUS_DIR = os.path.join(BENCH_DIR, "corpus")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+DEFAULT_SIZES = [10, 100, 1000]
+
+
+def targets():
+    """Return {name: (prepare, run)}; prepare(map_text) builds run's argument."""
+    parsed = wardley_map.parse_wardley_map
+    benchmark_targets = {
+        "parse_wardley_map": (lambda text: text, parsed),
+        "build_graph": (parsed, build_graph),
+        "graph_metrics": (lambda text: build_graph(parsed(text)), GraphMetrics.from_graph),
+        "pyvis_html": (lambda text: build_graph(parsed(text)), graph_html),
+        "compact_map": (parsed, CompactMap),
+        "compact_graph": (lambda text: CompactMap(parsed(text)), CompactMap.graph),
+    }
+    for fmt, converter in CONVERTERS.items():
+        benchmark_targets[f"convert_{fmt}"] = (parsed, converter)
+    # The upstream converters parse again on every call, as app.py used to
+    for fmt in ["json", "toml", "yaml", "cypher", "graph", "gml"]:
+        upstream = getattr(wardley_map, f"convert_owm2{fmt}")
+        benchmark_targets[f"owm2{fmt}"] = (lambda text: text, upstream)
+    return benchmark_targets
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def bench(run, arg, repeat, n_components):
+    """Time repeat calls of run(arg), then measure peak memory of one more."""
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run(arg)
+        samples.append(time.perf_counter() - started)
+    tracemalloc.start()
+    run(arg)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    p50 = statistics.median(samples)
+    return {
+        "components": n_components,
+        "p50": p50,
+        "p95": percentile(samples, 95),
+        "p99": percentile(samples, 99),
+        "components_per_second": n_components / p50 if p50 else 0.0,
+        "peak_bytes": peak,
+    }
+
+
+def load_maps(sizes, use_corpus=True):
+    """Return {label: map_text} for the synthetic sizes and the frozen corpus."""
+    maps = {f"synthetic-{size}": generate_map(size) for size in sizes}
+    if use_corpus:
+        for path in sorted(glob.glob(os.path.join(CORPUS_DIR, "*.wm"))):
+            with open(path, "r", encoding="utf-8") as file:
+                maps["corpus-" + os.path.splitext(os.path.basename(path))[0]] = file.read()
+    return maps
+
+
+def run_suite(sizes, repeat, only=None, use_corpus=True):
+    results = {}
+    parsed_count = {}
+    for label, map_text in load_maps(sizes, use_corpus).items():
+        n_components = parsed_count.setdefault(
+            label, len(wardley_map.parse_wardley_map(map_text)["components"])
+        )
+        for name, (prepare, run) in targets().items():
+            if only and name not in only:
+                continue
+            # Fewer repeats for big maps so the suite finishes in reasonable time
+            reps = max(3, repeat if n_components <= 1000 else repeat // 5)
+            result = bench(run, prepare(map_text), reps, n_components)
+            results[f"{name}/{label}"] = result
+            print(
+                f"{name:20} {label:22} p50 {result['p50'] * 1000:10.2f} ms  "
+                f"p95 {result['p95'] * 1000:10.2f} ms  "
+                f"{result['components_per_second']:12.0f} comp/s  "
+                f"peak {result['peak_bytes'] / 1e6:8.2f} MB",
+                file=sys.stderr,
+            )
+    return results
+
+
+def compare(results, baseline, tolerance, min_delta=0.0005):
+    """Return messages for every result slower than its baseline by over tolerance.
+
+    Slowdowns smaller than min_delta seconds are ignored, since timings of
+    the smallest maps are dominated by noise.
+    """
+    regressions = []
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        allowed = max(baseline[key]["p50"] * (1 + tolerance), baseline[key]["p50"] + min_delta)
+        if result["p50"] > allowed:
+            regressions.append(
+                f"{key}: p50 {result['p50'] * 1000:.2f} ms > {allowed * 1000:.2f} ms allowed "
+                f"(baseline {baseline[key]['p50'] * 1000:.2f} ms)"
+            )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark wm2many over maps of increasing size.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Synthetic map sizes in components (up to 100000)")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per target and map")
+    parser.add_argument("--only", nargs="+", help="Only run these targets")
+    parser.add_argument("--no-corpus", action="store_true", help="Skip the frozen real maps")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline JSON to compare to")
+    parser.add_argument("--save-baseline", action="store_true", help="Overwrite the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown against the baseline, as a fraction")
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.sizes, args.repeat, args.only, not args.no_corpus)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as out:
+            json.dump(results, out, indent=2, sort_keys=True)
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as out:
+            json.dump(results, out, indent=2, sort_keys=True)
+        return 0
+
+    try:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+    except OSError:
+        print("No baseline to compare against; run with --save-baseline first", file=sys.stderr)
+        return 0
+    regressions = compare(results, baseline, args.tolerance)
+    for message in regressions:
+        print("REGRESSION " + message, file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
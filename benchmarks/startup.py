@@ -0,0 +1,65 @@
+"""Measure the cold start cost of the modules app.py imports at the top level.
+
+Each sample runs in a fresh interpreter so nothing is already imported. The
+check fails if the median import time goes over the budget, or if any of the
+heavy dependencies that app.py loads lazily sneaks back into the startup path.
+
+    python benchmarks/startup.py --runs 5 --budget 3.0
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules app.py imports before it renders anything
+STARTUP_MODULES = [
+    "streamlit", "streamlit.components.v1", "streamlit_option_menu", "map_cache", "instrumentation"
+]
+# Modules that must only be imported once a conversion needs them
+LAZY_MODULES = ["wardley_map", "networkx", "pyvis", "toml", "yaml", "matplotlib", "github"]
+
+PROBE = """
+import json, sys, time
+started = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - started
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {lazy!r} if m in sys.modules]}}))
+"""
+
+
+def measure_once():
+    probe = PROBE.format(modules=STARTUP_MODULES, lazy=LAZY_MODULES)
+    result = subprocess.run(
+        [sys.executable, "-c", probe], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure app.py cold start import time.")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters to sample")
+    parser.add_argument("--budget", type=float, default=None, help="Fail above this median (s)")
+    args = parser.parse_args(argv)
+
+    samples = [measure_once() for _ in range(args.runs)]
+    median = statistics.median(sample["seconds"] for sample in samples)
+    loaded = sorted({name for sample in samples for name in sample["loaded"]})
+    print(json.dumps({"median_seconds": round(median, 4), "eagerly_loaded": loaded}))
+
+    if loaded:
+        print(f"Heavy modules imported at startup: {', '.join(loaded)}", file=sys.stderr)
+        return 1
+    if args.budget is not None and median > args.budget:
+        print(f"Startup took {median:.3f}s, over the {args.budget:.3f}s budget", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
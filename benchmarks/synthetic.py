@@ -0,0 +1,52 @@
+"""Generate synthetic Wardley Maps of any size for benchmarking.
+
+Maps are deterministic for a given size and seed. They contain components
+at random positions, a dependency DAG of links, pipelines with members
+placed inside their bounding boxes, evolve lines, notes and annotations,
+roughly in the proportions seen in real maps.
+"""
+
+import random
+
+PIPELINE_EVERY = 50  # One pipeline per this many components
+NOTE_EVERY = 20  # One note and one annotation per this many components
+
+
+def generate_map(n_components, seed=0):
+    """Return the OWM text of a synthetic map with n_components components."""
+    rng = random.Random(seed)
+    lines = [f"title Synthetic map {n_components}", "style wardley"]
+    lines.append("anchor User [0.95, 0.5]")
+
+    positions = []
+    for i in range(n_components):
+        visibility, evolution = round(rng.uniform(0.05, 0.9), 2), round(rng.uniform(0.02, 0.98), 2)
+        positions.append((visibility, evolution))
+        lines.append(f"component C{i} [{visibility}, {evolution}]")
+
+    # Pipelines: members sit just below the pipeline component, inside its span
+    for i in range(0, n_components, PIPELINE_EVERY):
+        visibility, _ = positions[i]
+        start = round(rng.uniform(0.05, 0.5), 2)
+        end = round(start + rng.uniform(0.1, 0.45), 2)
+        lines.append(f"pipeline C{i} [{start}, {end}]")
+        for j in range(rng.randint(2, 5)):
+            member_vis = round(visibility - rng.uniform(0, 0.009), 3)
+            member_evo = round(rng.uniform(start, end), 2)
+            lines.append(f"component P{i}_{j} [{member_vis}, {member_evo}]")
+
+    # Links: every component depends on an earlier one, plus some extra edges
+    lines.append("User->C0")
+    for i in range(1, n_components):
+        lines.append(f"C{rng.randrange(i)}->C{i}")
+    for _ in range(n_components // 4):
+        a, b = sorted(rng.sample(range(n_components), 2)) if n_components > 1 else (0, 0)
+        lines.append(f"C{a}->C{b}")
+
+    for i in range(0, n_components, NOTE_EVERY):
+        visibility, evolution = positions[i]
+        lines.append(f"evolve C{i} {min(0.99, evolution + 0.1):.2f}")
+        lines.append(f"note Note about C{i} [{visibility}, {evolution}]")
+        lines.append(f"annotation {i // NOTE_EVERY + 1} [{visibility}, {evolution}] Annotation for C{i}")
+    lines.append("annotations [0.72, 0.03]")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,241 @@
+"""Columnar export of maps as Arrow tables, Parquet files or Arrow IPC files.
+
+The JSON and YAML outputs are nested documents that analytics jobs have to
+decode map by map. This module lays the maps, components, links,
+pipelines, notes and annotations of any number of maps out as typed
+tables instead, with positions as float columns rather than "[0.4, 0.7]"
+strings; x is evolution and y visibility, as in the component graph. A
+directory of maps is written as one dataset with a directory per table,
+optionally under a hive-style partition, so a whole history of maps loads
+with a single (memory-mapped) dataset read.
+
+    python columnar.py MAP-REPOSITORY dataset/ --partition 2024-06
+    python columnar.py MAP-REPOSITORY dataset/ --format arrow
+"""
+
+import argparse
+import io
+import json
+import os
+import sys
+import zipfile
+
+from map_graph import parse_pos, pipeline_span
+
+TABLES = ["maps", "components", "links", "pipelines", "notes", "annotations"]
+BATCH_MAPS = 200  # Maps buffered in memory before a row group is written
+EXTENSIONS = {"parquet": ".parquet", "arrow": ".arrow"}
+
+
+def schemas():
+    """Return the pyarrow schema of every table."""
+    import pyarrow as pa
+
+    positioned = [("x", pa.float64()), ("y", pa.float64())]
+    return {
+        "maps": pa.schema([("map", pa.string()), ("title", pa.string())]),
+        "components": pa.schema(
+            [("map", pa.string()), ("name", pa.string()), ("stage", pa.string()),
+             ("visibility", pa.string())] + positioned
+        ),
+        "links": pa.schema([("map", pa.string()), ("src", pa.string()), ("tgt", pa.string())]),
+        "pipelines": pa.schema(
+            [("map", pa.string()), ("name", pa.string()), ("start_evo", pa.float64()),
+             ("end_evo", pa.float64()), ("components", pa.list_(pa.string()))]
+        ),
+        "notes": pa.schema([("map", pa.string()), ("text", pa.string())] + positioned),
+        "annotations": pa.schema(
+            [("map", pa.string()), ("number", pa.int32()), ("text", pa.string())] + positioned
+        ),
+    }
+
+
+def _number(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def map_columns(map_id, parsed_map, columns=None):
+    """Append the rows of one parsed map to columns, {table: {column: [values]}}."""
+    if columns is None:
+        columns = {table: {name: [] for name in schema.names} for table, schema in schemas().items()}
+
+    def add(table, **row):
+        for name, values in columns[table].items():
+            values.append(row[name])
+
+    def xy(entry):
+        # A missing position is null rather than the origin
+        x, y = parse_pos(entry.get("pos"), default=(None, None))
+        return {"x": None if x is None else float(x), "y": None if y is None else float(y)}
+
+    add("maps", map=map_id, title=parsed_map["title"][0] if parsed_map["title"] else None)
+    for component in parsed_map["components"]:
+        add("components", map=map_id, name=component["name"], stage=component.get("evolution"),
+            visibility=component.get("visibility"), **xy(component))
+    for link in parsed_map["links"]:
+        add("links", map=map_id, src=link["src"], tgt=link["tgt"])
+    for pipeline in parsed_map["pipelines"]:
+        start, end = pipeline_span(pipeline)
+        add("pipelines", map=map_id, name=pipeline["name"], start_evo=float(start),
+            end_evo=float(end), components=list(pipeline["components"]))
+    for note in parsed_map["notes"]:
+        add("notes", map=map_id, text=note["name"], **xy(note))
+    for annotation in parsed_map["annotations"]:
+        add("annotations", map=map_id, number=_number(annotation.get("number")),
+            text=annotation["name"], **xy(annotation))
+    return columns
+
+
+def to_tables(columns):
+    """Return {table: pyarrow.Table} for columns built by map_columns."""
+    import pyarrow as pa
+
+    return {
+        table: pa.Table.from_pydict(columns[table], schema=schema)
+        for table, schema in schemas().items()
+    }
+
+
+def map_tables(parsed_map, map_id=""):
+    """Return the tables of a single parsed map."""
+    return to_tables(map_columns(map_id, parsed_map))
+
+
+def tables_zip(tables, fmt="parquet"):
+    """Return a zip archive holding one Parquet or Arrow IPC file per table."""
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_STORED) as bundle:
+        for table, data in tables.items():
+            buffer = io.BytesIO()
+            if fmt == "parquet":
+                pq.write_table(data, buffer)
+            else:
+                feather.write_feather(data, buffer, compression="uncompressed")
+            bundle.writestr(table + EXTENSIONS[fmt], buffer.getvalue())
+    return archive.getvalue()
+
+
+class _Writers:
+    """One open Parquet or Arrow IPC file per table, written a row group at a time.
+
+    A table directory that already holds files of the dataset raises
+    FileExistsError, unless overwrite is set and they are deleted first.
+    """
+
+    def __init__(self, output_dir, fmt, partition, overwrite=False):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        directories = {}
+        for table in schemas():
+            directory = os.path.join(output_dir, table)
+            if partition is not None:
+                directory = os.path.join(directory, f"partition={partition}")
+            directories[table] = directory
+        # Checked for every table before any file is opened, so a refusal leaves the dataset as it was
+        existing = [
+            os.path.join(directory, name)
+            for directory in directories.values() if os.path.isdir(directory)
+            for name in os.listdir(directory) if name.endswith(tuple(EXTENSIONS.values()))
+        ]
+        if existing and not overwrite:
+            raise FileExistsError(f"{existing[0]} already exists; overwrite to replace the dataset")
+        for path in existing:
+            os.remove(path)
+
+        self.files = {}
+        for table, schema in schemas().items():
+            os.makedirs(directories[table], exist_ok=True)
+            path = os.path.join(directories[table], "part-0" + EXTENSIONS[fmt])
+            if fmt == "parquet":
+                self.files[table] = pq.ParquetWriter(path, schema)
+            else:
+                # Uncompressed IPC files can be memory-mapped without decoding
+                self.files[table] = pa.ipc.new_file(path, schema)
+
+    def write(self, tables):
+        for table, data in tables.items():
+            self.files[table].write_table(data)
+
+    def close(self):
+        for writer in self.files.values():
+            writer.close()
+
+
+def write_dataset(maps, output_dir, fmt="parquet", partition=None, batch_maps=BATCH_MAPS, overwrite=False):
+    """Write maps, an iterable of (map_id, map_text), as one dataset; return the map count.
+
+    Rows are buffered for batch_maps maps at a time, so memory does not
+    grow with the number of maps. A map that fails to parse is left out
+    and the others are written. An existing dataset at the same place,
+    or in the same partition, is only replaced with overwrite.
+    """
+    from map_files import parse_map
+
+    writers = _Writers(output_dir, fmt, partition, overwrite)
+    count, columns = 0, None
+    try:
+        for map_id, map_text in maps:
+            try:
+                # Rows of one map are collected apart, so a failure leaves no partial rows behind
+                rows = map_columns(map_id, parse_map(map_text))
+            except Exception as e:  # pylint: disable=broad-except
+                print(f"Error exporting map {map_id}: {e}")
+                continue
+            if columns is None:
+                columns = rows
+            else:
+                for table, values in rows.items():
+                    for name, column in values.items():
+                        columns[table][name].extend(column)
+            count += 1
+            if count % batch_maps == 0:
+                writers.write(to_tables(columns))
+                columns = None
+        if columns is not None:
+            writers.write(to_tables(columns))
+    finally:
+        writers.close()
+    return count
+
+
+def read_dataset(output_dir, table, fmt="parquet"):
+    """Read one table of a dataset, with its partition column if it has one."""
+    import pyarrow.dataset as ds
+    from pyarrow.fs import LocalFileSystem
+
+    source = os.path.join(output_dir, table)
+    return ds.dataset(
+        source,
+        format="ipc" if fmt == "arrow" else fmt,
+        partitioning="hive",
+        filesystem=LocalFileSystem(use_mmap=True),
+    ).to_table()
+
+
+def main(argv=None):
+    from map_files import read_maps
+
+    parser = argparse.ArgumentParser(description="Write a directory of Wardley Maps as columnar tables.")
+    parser.add_argument("input_dir", help="Directory of map files, e.g. a MAP-REPOSITORY checkout")
+    parser.add_argument("output_dir", help="Dataset directory; one subdirectory per table")
+    parser.add_argument("--format", choices=sorted(EXTENSIONS), default="parquet")
+    parser.add_argument("--partition", help="Write under partition=<value>, e.g. a date")
+    parser.add_argument("--overwrite", action="store_true", help="Replace a dataset already written there")
+    args = parser.parse_args(argv)
+
+    count = write_dataset(
+        read_maps(args.input_dir), args.output_dir, args.format, args.partition, overwrite=args.overwrite
+    )
+    print(json.dumps({"maps": count, "tables": TABLES}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+"""A compact, array-backed form of a parsed map.
+
+parse_wardley_map returns a dict of lists of dicts, with every position
+kept as a "[0.4, 0.7]" string. CompactMap stores the components and links
+of a map column-wise instead: names are interned once in a name table,
+component coordinates sit in float arrays, stages and visibilities are
+small integer codes, and link endpoints are indexes into the name table.
+The remaining text fields share one string buffer each, so the original
+dict form is rebuilt exactly by to_dict. Rows are read through __slots__
+views, and positions are decoded once, so bounding box checks and graph
+building work on whole arrays.
+"""
+
+import sys
+
+import numpy as np
+
+from map_graph import DEFAULT_COLOR, EVOLUTION_COLORS, PIPELINE_HEIGHT, parse_pos, pipeline_span
+
+COMPONENT_FIELDS = ("name", "desc", "evolution", "visibility", "pos", "labelpos")
+LINK_FIELDS = ("src", "tgt")
+
+
+class StringColumn:
+    """Many strings stored as one buffer and an array of offsets."""
+
+    __slots__ = ("_text", "_offsets")
+
+    def __init__(self, values):
+        self._text = "".join(values)
+        self._offsets = np.cumsum([0] + [len(value) for value in values], dtype=np.int64)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, row):
+        return self._text[self._offsets[row]: self._offsets[row + 1]]
+
+
+class Codes:
+    """Repeated labels stored as small integer codes into a label list."""
+
+    __slots__ = ("labels", "codes")
+
+    def __init__(self, values):
+        self.labels = []
+        index = {}
+        codes = []
+        for value in values:
+            if value not in index:
+                index[value] = len(self.labels)
+                self.labels.append(value)
+            codes.append(index[value])
+        self.codes = np.array(codes, dtype=np.int16)
+
+    def __getitem__(self, row):
+        return self.labels[self.codes[row]]
+
+
+class ComponentView:
+    """One component of a CompactMap, read on demand from its arrays."""
+
+    __slots__ = ("_map", "_row")
+
+    def __init__(self, compact_map, row):
+        self._map = compact_map
+        self._row = row
+
+    @property
+    def name(self):
+        return self._map.names[self._map.component_names[self._row]]
+
+    @property
+    def stage(self):
+        return self._map.stages[self._row]
+
+    @property
+    def visibility(self):
+        return self._map.visibilities[self._row]
+
+    @property
+    def x(self):
+        return float(self._map.x[self._row])
+
+    @property
+    def y(self):
+        return float(self._map.y[self._row])
+
+    def to_dict(self):
+        row = self._row
+        return {
+            "name": self.name,
+            "desc": self._map.descs[row],
+            "evolution": self.stage,
+            "visibility": self.visibility,
+            "pos": self._map.positions[row],
+            "labelpos": self._map.label_positions[row],
+        }
+
+
+class LinkView:
+    """One link of a CompactMap."""
+
+    __slots__ = ("_map", "_row")
+
+    def __init__(self, compact_map, row):
+        self._map = compact_map
+        self._row = row
+
+    @property
+    def src(self):
+        return self._map.names[self._map.link_src[self._row]]
+
+    @property
+    def tgt(self):
+        return self._map.names[self._map.link_tgt[self._row]]
+
+    def to_dict(self):
+        return {"src": self.src, "tgt": self.tgt}
+
+
+class CompactMap:
+    """The components and links of a parsed map held in contiguous arrays."""
+
+    def __init__(self, parsed_map):
+        components = parsed_map["components"]
+        links = parsed_map["links"]
+        for entry, fields in [(c, COMPONENT_FIELDS) for c in components] + [(l, LINK_FIELDS) for l in links]:
+            if tuple(entry) != fields:
+                raise ValueError(f"Unsupported fields {sorted(entry)}; expected {list(fields)}")
+
+        self.names = []
+        name_ids = {}  # Only needed while building, so not kept
+
+        def name_id(name):
+            if name not in name_ids:
+                name_ids[name] = len(self.names)
+                self.names.append(sys.intern(name))
+            return name_ids[name]
+
+        self.component_names = np.array([name_id(c["name"]) for c in components], dtype=np.int32)
+        coordinates = [parse_pos(c["pos"]) for c in components]
+        self.x = np.array([x for x, _ in coordinates], dtype=np.float64)
+        self.y = np.array([y for _, y in coordinates], dtype=np.float64)
+        self.stages = Codes([c["evolution"] for c in components])
+        self.visibilities = Codes([c["visibility"] for c in components])
+        self.positions = StringColumn([c["pos"] for c in components])
+        self.label_positions = StringColumn([c["labelpos"] for c in components])
+        self.descs = StringColumn([c["desc"] for c in components])
+        self.link_src = np.array([name_id(l["src"]) for l in links], dtype=np.int32)
+        self.link_tgt = np.array([name_id(l["tgt"]) for l in links], dtype=np.int32)
+        # Every other section is small and kept as parsed
+        self.sections = list(parsed_map)
+        self.other = {k: v for k, v in parsed_map.items() if k not in ("components", "links")}
+
+    def __len__(self):
+        return len(self.component_names)
+
+    def components(self):
+        return [ComponentView(self, row) for row in range(len(self))]
+
+    def links(self):
+        return [LinkView(self, row) for row in range(len(self.link_src))]
+
+    def to_dict(self):
+        """Return the parse_wardley_map dict this map was built from."""
+        parsed_map = {}
+        for section in self.sections:
+            if section == "components":
+                parsed_map[section] = [view.to_dict() for view in self.components()]
+            elif section == "links":
+                parsed_map[section] = [view.to_dict() for view in self.links()]
+            else:
+                parsed_map[section] = self.other[section]
+        return parsed_map
+
+    def within(self, left, right, bottom, top):
+        """Return the rows of components inside the box, edges included."""
+        mask = (self.x >= left) & (self.x <= right) & (self.y >= bottom) & (self.y <= top)
+        return np.flatnonzero(mask)
+
+    def graph(self):
+        """Build the same component DiGraph as map_graph.build_graph from the arrays."""
+        import networkx as nx
+
+        G = nx.DiGraph()
+        names = self.names
+        for row, name_id in enumerate(self.component_names):
+            stage = self.stages[row]
+            G.add_node(
+                names[name_id],
+                stage=stage,
+                visibility=self.visibilities[row],
+                pos=(float(self.x[row]), float(self.y[row])),
+                color=EVOLUTION_COLORS.get(stage, DEFAULT_COLOR),
+            )
+
+        # Keep only links whose ends are both components, in their original order
+        present = np.zeros(len(names), dtype=bool)
+        present[self.component_names] = True
+        keep = present[self.link_src] & present[self.link_tgt]
+        G.add_edges_from(
+            (names[src], names[tgt]) for src, tgt in zip(self.link_src[keep], self.link_tgt[keep])
+        )
+
+        # The first component with a pipeline's name gives the pipeline its height,
+        # while the bounding box checks see the last position of each name
+        first_row, last_row = {}, {}
+        for row, name_id in enumerate(self.component_names):
+            first_row.setdefault(names[name_id], row)
+            last_row[name_id] = row
+        latest = np.zeros(len(self), dtype=bool)
+        latest[list(last_row.values())] = True
+        for pipeline in self.other.get("pipelines", []):
+            pipeline_name = pipeline["name"]
+            left, right = pipeline_span(pipeline)
+            row = first_row.get(pipeline_name)
+            top = float(self.y[row]) if row is not None else 0
+            if pipeline_name not in G.nodes:
+                G.add_node(pipeline_name, type="pipeline", pos=(left, top))
+            rows = self.within(left, right, top - PIPELINE_HEIGHT, top)
+            inside = {names[self.component_names[r]] for r in rows if latest[r]}
+            for component_name in pipeline["components"]:
+                if component_name != pipeline_name and component_name in inside:
+                    if not G.has_edge(pipeline_name, component_name):
+                        G.add_edge(pipeline_name, component_name, type="pipeline")
+        return G
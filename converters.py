@@ -0,0 +1,213 @@
+"""Converters that work from an already parsed Wardley Map.
+
+These mirror the convert_owm2* functions of the wardley_map package, but
+take the dictionary returned by parse_wardley_map so a map is only parsed
+once no matter how many formats are produced from it. Each converter
+imports its serialisation library when it is first used, so a session only
+pays for the formats it asks for.
+
+Every format also has a streaming converter in STREAMING_CONVERTERS that
+yields the same output in chunks, so very large outputs can be written to
+a file or a response without building the whole string in memory.
+
+Given the component graph of ParsedMap.graph(), whose nodes carry the
+dependency metrics of graph_metrics, the JSON, GRAPH, GML and CYPHER
+outputs carry them too: as node attributes in the graph formats and in
+Cypher, and as a top-level "metrics" section keyed by name in JSON. Called
+with a parsed map alone they do not compute the metrics, so a plain
+conversion does not pay for them.
+"""
+
+import json
+
+CHUNK_SIZE = 64 * 1024  # Characters per chunk yielded by the streaming converters
+
+# File extension written for each format
+EXTENSIONS = {
+    "json": ".json",
+    "toml": ".toml",
+    "yaml": ".yaml",
+    "graph": ".graph.json",
+    "cypher": ".cql",
+    "gml": ".gml",
+}
+
+
+def chunked(pieces, size=CHUNK_SIZE):
+    """Group an iterable of small strings into chunks of at least size characters."""
+    buffer, length = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield "".join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def _is_table_array(value):
+    return isinstance(value, list) and bool(value) and all(isinstance(item, dict) for item in value)
+
+
+def _component_graph(parsed_map, graph):
+    if graph is None:
+        from map_graph import build_graph
+
+        graph = build_graph(parsed_map)
+    return graph
+
+
+def node_metrics(graph):
+    """Return {node name: {metric: value}} from the metric attributes of graph's nodes.
+
+    Without a graph there are no metrics, and {} is returned.
+    """
+    if graph is None:
+        return {}
+    from graph_metrics import METRIC_ATTRIBUTES
+
+    return {
+        name: {metric: attrs[metric] for metric in METRIC_ATTRIBUTES if metric in attrs}
+        for name, attrs in graph.nodes(data=True)
+    }
+
+
+def extra_sections(fmt, graph):
+    """Return the top-level sections fmt adds after those of the parsed map given graph."""
+    return {"metrics": node_metrics(graph)} if fmt == "json" and graph is not None else {}
+
+
+# Convert a parsed map to JSON
+def to_json(parsed_map, graph=None):
+    return json.dumps({**parsed_map, **extra_sections("json", graph)}, indent=2)
+
+
+# Convert a parsed map to TOML
+def to_toml(parsed_map):
+    import toml
+
+    return toml.dumps(parsed_map)
+
+
+# Convert a parsed map to YAML
+def to_yaml(parsed_map):
+    import yaml
+
+    return yaml.dump(parsed_map, default_flow_style=False)
+
+
+def _cypher_queries(parsed_map, graph):
+    metrics = node_metrics(graph)
+
+    # Generate Cypher queries for nodes
+    for component in parsed_map["components"]:
+        properties = "".join(
+            f", {metric}: {value!r}" for metric, value in metrics.get(component["name"], {}).items()
+        )
+        yield (
+            f"CREATE (:{component['name']} {{stage: '{component['evolution']}', "
+            f"visibility: '{component['visibility']}'{properties}}})"
+        )
+
+    # Generate Cypher queries for relationships
+    for link in parsed_map["links"]:
+        yield (
+            f"MATCH (a), (b) WHERE a.name = '{link['src']}' AND b.name = '{link['tgt']}' "
+            "CREATE (a)-[:RELATES_TO]->(b)"
+        )
+
+
+# Convert a parsed map to Cypher
+def to_cypher(parsed_map, graph=None):
+    return "\n".join(_cypher_queries(parsed_map, graph))
+
+
+# Convert a parsed map to a node-link JSON graph
+def to_graph(parsed_map, graph=None):
+    from networkx.readwrite import json_graph
+
+    graph_json = json_graph.node_link_data(_component_graph(parsed_map, graph))
+    return json.dumps(graph_json, indent=2)
+
+
+# Convert a parsed map to GML
+def to_gml(parsed_map, graph=None):
+    import networkx as nx
+
+    return "\n".join(nx.generate_gml(_component_graph(parsed_map, graph))) + "\n"
+
+
+# Stream a parsed map as JSON
+def iter_json(parsed_map, graph=None):
+    document = {**parsed_map, **extra_sections("json", graph)}
+    return chunked(json.JSONEncoder(indent=2).iterencode(document))
+
+
+# Stream a parsed map as TOML, one table at a time
+def iter_toml(parsed_map):
+    import toml
+
+    # toml writes the plain values first, then each array of tables in order
+    yield toml.dumps({k: v for k, v in parsed_map.items() if not _is_table_array(v)})
+    tables = {k: v for k, v in parsed_map.items() if _is_table_array(v)}
+    yield from chunked(toml.dumps({key: [item]}) for key, items in tables.items() for item in items)
+
+
+# Stream a parsed map as YAML, one list item at a time
+def iter_yaml(parsed_map):
+    import yaml
+
+    def pieces():
+        for key in sorted(parsed_map):
+            value = parsed_map[key]
+            if isinstance(value, list) and value:
+                # Top level keys are plain section names, so need no quoting
+                yield f"{key}:\n"
+                for item in value:
+                    yield yaml.dump([item], default_flow_style=False)
+            else:
+                yield yaml.dump({key: value}, default_flow_style=False)
+
+    return chunked(pieces())
+
+
+# Stream a parsed map as Cypher
+def iter_cypher(parsed_map, graph=None):
+    queries = _cypher_queries(parsed_map, graph)
+    return chunked(("\n" if i else "") + query for i, query in enumerate(queries))
+
+
+# Stream a parsed map as a node-link JSON graph
+def iter_graph(parsed_map, graph=None):
+    from networkx.readwrite import json_graph
+
+    graph_json = json_graph.node_link_data(_component_graph(parsed_map, graph))
+    return chunked(json.JSONEncoder(indent=2).iterencode(graph_json))
+
+
+# Stream a parsed map as GML
+def iter_gml(parsed_map, graph=None):
+    import networkx as nx
+
+    return chunked(line + "\n" for line in nx.generate_gml(_component_graph(parsed_map, graph)))
+
+
+CONVERTERS = {
+    "json": to_json,
+    "toml": to_toml,
+    "yaml": to_yaml,
+    "cypher": to_cypher,
+    "graph": to_graph,
+    "gml": to_gml,
+}
+STREAMING_CONVERTERS = {
+    "json": iter_json,
+    "toml": iter_toml,
+    "yaml": iter_yaml,
+    "cypher": iter_cypher,
+    "graph": iter_graph,
+    "gml": iter_gml,
+}
+# Converters that accept the prebuilt component graph, in both tables
+GRAPH_CONVERTERS = {"json", "graph", "gml", "cypher"}
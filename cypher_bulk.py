@@ -0,0 +1,232 @@
+"""Bulk export of many maps for loading into Neo4j.
+
+convert_owm2cypher writes one statement per node and per edge, which is far
+too slow to load when hundreds of maps are merged. This module offers two
+bulk layouts instead, both written as a stream so memory does not grow with
+the number of maps:
+
+* a cypher-shell script of parameterised ``UNWIND $rows`` batches, preceded
+  by the uniqueness constraints the MERGEs rely on, and
+* node and relationship CSV files in the ``neo4j-admin database import``
+  layout.
+
+Components with the same name are merged across maps. Per-map attributes
+(stage, visibility, position) live on the (Map)-[:CONTAINS]->(Component)
+relationship.
+
+    python cypher_bulk.py MAP-REPOSITORY --script maps.cypher --batch-size 1000
+    python cypher_bulk.py MAP-REPOSITORY --csv neo4j-import/
+"""
+
+import argparse
+import csv
+import io
+import math
+import os
+import sys
+
+from map_files import parse_map, read_maps
+
+BATCH_SIZE = 1000
+
+CONSTRAINTS = [
+    "CREATE CONSTRAINT map_id IF NOT EXISTS FOR (m:Map) REQUIRE m.id IS UNIQUE",
+    "CREATE CONSTRAINT component_name IF NOT EXISTS FOR (c:Component) REQUIRE c.name IS UNIQUE",
+]
+
+# One UNWIND query per row kind, in the order the rows must be loaded
+QUERIES = {
+    "maps": "UNWIND $rows AS row MERGE (m:Map {id: row.id}) SET m.title = row.title",
+    "components": (
+        "UNWIND $rows AS row "
+        "MATCH (m:Map {id: row.map}) "
+        "MERGE (c:Component {name: row.name}) "
+        "MERGE (m)-[r:CONTAINS]->(c) "
+        "SET r.type = row.type, r.stage = row.stage, r.visibility = row.visibility, "
+        "r.x = row.x, r.y = row.y"
+    ),
+    "links": (
+        "UNWIND $rows AS row "
+        "MATCH (a:Component {name: row.src}) "
+        "MATCH (b:Component {name: row.tgt}) "
+        "MERGE (a)-[:RELATES_TO {map: row.map}]->(b)"
+    ),
+}
+
+
+def map_rows(map_id, map_text):
+    """Return the maps, components and links rows for one map.
+
+    The map is parsed with map_files.parse_map, outside the shared cache,
+    and no graph metrics are computed, since the rows do not hold them.
+    """
+    from map_graph import build_graph
+
+    parsed_map = parse_map(map_text)
+    G = build_graph(parsed_map)
+    components = []
+    for name, attrs in G.nodes(data=True):
+        x, y = attrs.get("pos", (0, 0))
+        components.append(
+            {
+                "map": map_id,
+                "name": name,
+                "type": attrs.get("type", "component"),
+                "stage": attrs.get("stage", ""),
+                "visibility": attrs.get("visibility", ""),
+                "x": float(x),
+                "y": float(y),
+            }
+        )
+    return {
+        "maps": [{"id": map_id, "title": parsed_map["title"][0] if parsed_map["title"] else "No Title"}],
+        "components": components,
+        # Only dependency links, as in converters.to_cypher; pipeline membership is not one
+        "links": [
+            {"map": map_id, "src": src, "tgt": tgt}
+            for src, tgt, kind in G.edges(data="type")
+            if kind != "pipeline"
+        ],
+    }
+
+
+def _rows(maps):
+    """Yield the map_rows of every map of (map_id, map_text); a map that fails is reported and skipped."""
+    for map_id, map_text in maps:
+        try:
+            rows = map_rows(map_id, map_text)
+        except Exception as e:  # pylint: disable=broad-except
+            print(f"Error exporting map {map_id}: {e}")
+            continue
+        yield rows
+
+
+def unwind_batches(maps, batch_size=BATCH_SIZE):
+    """Yield (query, params) pairs loading maps, an iterable of (map_id, map_text).
+
+    Rows are buffered per kind and a buffer is flushed once it holds
+    batch_size rows. Earlier kinds are always flushed first, so every link
+    batch only refers to components that have already been created.
+    """
+    buffers = {kind: [] for kind in QUERIES}
+    kinds = list(QUERIES)
+
+    def flush(upto):
+        for kind in kinds[: kinds.index(upto) + 1]:
+            if buffers[kind]:
+                yield QUERIES[kind], {"rows": buffers[kind]}
+                buffers[kind] = []
+
+    for rows_by_kind in _rows(maps):
+        for kind, rows in rows_by_kind.items():
+            for row in rows:
+                buffers[kind].append(row)
+                if len(buffers[kind]) >= batch_size:
+                    yield from flush(kind)
+    yield from flush(kinds[-1])
+
+
+def cypher_literal(value):
+    """Encode a Python value as a Cypher literal for cypher-shell's :param."""
+    if isinstance(value, dict):
+        return "{" + ", ".join(f"`{k}`: {cypher_literal(v)}" for k, v in value.items()) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ", ".join(cypher_literal(v) for v in value) + "]"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and not math.isfinite(value):
+        return "null"  # Cypher has no NaN or infinity literals
+    if isinstance(value, (int, float)):
+        return repr(value)
+    if value is None:
+        return "null"
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def write_script(maps, out, batch_size=BATCH_SIZE):
+    """Write a cypher-shell script of constraints and UNWIND batches to out."""
+    for constraint in CONSTRAINTS:
+        out.write(constraint + ";\n")
+    for query, params in unwind_batches(maps, batch_size):
+        out.write(f":param rows => {cypher_literal(params['rows'])}\n")
+        out.write(query + ";\n")
+
+
+def bulk_cypher_script(maps, batch_size=BATCH_SIZE):
+    """Return the write_script output for maps as a string."""
+    out = io.StringIO()
+    write_script(maps, out, batch_size)
+    return out.getvalue()
+
+
+def write_import_csvs(maps, output_dir):
+    """Write neo4j-admin import CSVs for maps into output_dir.
+
+    Only the set of component names already written is kept in memory, so
+    the files can be produced for any number of maps.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    headers = {
+        "maps.csv": ["id:ID(Map)", "title", ":LABEL"],
+        "components.csv": ["name:ID(Component)", ":LABEL"],
+        "contains.csv": [
+            ":START_ID(Map)", ":END_ID(Component)", "type", "stage", "visibility",
+            "x:float", "y:float", ":TYPE",
+        ],
+        "relates_to.csv": [":START_ID(Component)", ":END_ID(Component)", "map", ":TYPE"],
+    }
+    files = {name: open(os.path.join(output_dir, name), "w", newline="", encoding="utf-8") for name in headers}
+    try:
+        writers = {name: csv.writer(file) for name, file in files.items()}
+        for name, header in headers.items():
+            writers[name].writerow(header)
+
+        seen_components = set()
+        for rows in _rows(maps):
+            for row in rows["maps"]:
+                writers["maps.csv"].writerow([row["id"], row["title"], "Map"])
+            for row in rows["components"]:
+                if row["name"] not in seen_components:
+                    seen_components.add(row["name"])
+                    writers["components.csv"].writerow([row["name"], "Component"])
+                writers["contains.csv"].writerow(
+                    [row["map"], row["name"], row["type"], row["stage"], row["visibility"],
+                     row["x"], row["y"], "CONTAINS"]
+                )
+            for row in rows["links"]:
+                writers["relates_to.csv"].writerow([row["src"], row["tgt"], row["map"], "RELATES_TO"])
+    finally:
+        for file in files.values():
+            file.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk export a directory of Wardley Maps for Neo4j.")
+    parser.add_argument("input_dir", help="Directory of map files, e.g. a MAP-REPOSITORY checkout")
+    parser.add_argument("--script", help="Write a cypher-shell script of UNWIND batches to this file")
+    parser.add_argument("--csv", help="Write neo4j-admin import CSV files to this directory")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Rows per UNWIND batch")
+    args = parser.parse_args(argv)
+    if not args.script and not args.csv:
+        parser.error("one of --script or --csv is required")
+
+    if args.script:
+        with open(args.script, "w", encoding="utf-8") as out:
+            write_script(read_maps(args.input_dir), out, args.batch_size)
+    if args.csv:
+        write_import_csvs(read_maps(args.input_dir), args.csv)
+        print(
+            "neo4j-admin database import full "
+            + " ".join(
+                f"--{kind}={os.path.join(args.csv, name)}"
+                for kind, name in [
+                    ("nodes", "maps.csv"), ("nodes", "components.csv"),
+                    ("relationships", "contains.csv"), ("relationships", "relates_to.csv"),
+                ]
+            )
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
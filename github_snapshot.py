@@ -0,0 +1,188 @@
+"""Snapshot of a GitHub map repository, fetched as one archive.
+
+Instead of walking the repository with one contents API call per directory,
+the whole tree is downloaded as a single tarball and indexed as a
+path -> map text dictionary. The index is written to disk keyed by commit
+SHA, so it is shared by every session and survives process restarts. The
+head commit is revalidated with a conditional request, which GitHub does
+not count against the rate limit when nothing has changed.
+
+Once started, a daemon thread loads the index and revalidates it
+periodically, so sessions read the current snapshot from memory and never
+wait on GitHub except on the very first start with an empty cache.
+"""
+
+import os
+import tarfile
+import threading
+import time
+from bisect import bisect_left
+
+import requests
+
+from map_cache import CACHE_DIR, read_json, write_json
+from map_files import is_map_file
+
+GITHUB_API = "https://api.github.com"
+REVALIDATE_SECONDS = 300  # How often the head commit is checked for changes
+TIMEOUT = 30
+
+
+class RepoSnapshot:
+    """A path -> content index of the maps in a GitHub repository."""
+
+    def __init__(self, repo, token=None, cache_dir=CACHE_DIR, api_url=GITHUB_API, session=None):
+        self.repo = repo
+        self.api_url = api_url.rstrip("/")
+        self.cache_dir = os.path.join(cache_dir, "github", repo.replace("/", "__"))
+        self.session = session or requests.Session()
+        if token:
+            self.session.headers["Authorization"] = f"token {token}"
+        self._head = (None, {})  # The head commit SHA and its files, replaced together
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._error = None
+        self._worker = None
+        self._load_cached()
+
+    @property
+    def sha(self):
+        """The commit SHA of the snapshot, or None before the first load."""
+        return self._head[0]
+
+    @property
+    def files(self):
+        """The {path: map text} of every map in the snapshot."""
+        return self._head[1]
+
+    def _head_path(self):
+        return os.path.join(self.cache_dir, "head.json")
+
+    def _index_path(self, sha):
+        return os.path.join(self.cache_dir, f"{sha}.json")
+
+    def _load_cached(self):
+        """Serve the snapshot an earlier run left on disk until it is revalidated."""
+        sha = (read_json(self._head_path()) or {}).get("sha")
+        index = read_json(self._index_path(sha)) if sha else None
+        if index is not None:
+            self._head = (sha, index["files"])
+            self._ready.set()
+
+    def resolve_head(self):
+        """Return the commit SHA of the default branch, revalidating with its ETag."""
+        head = read_json(self._head_path()) or {}
+        headers = {"Accept": "application/vnd.github.sha"}  # Reply with the bare SHA
+        if head.get("etag"):
+            headers["If-None-Match"] = head["etag"]
+        response = self.session.get(
+            f"{self.api_url}/repos/{self.repo}/commits/HEAD", headers=headers, timeout=TIMEOUT
+        )
+        if response.status_code == 304:
+            return head["sha"]
+        response.raise_for_status()
+        sha = response.text.strip()
+        write_json(self._head_path(), {"sha": sha, "etag": response.headers.get("ETag")})
+        return sha
+
+    def download(self, sha):
+        """Fetch the tarball for sha and return the maps it contains."""
+        response = self.session.get(
+            f"{self.api_url}/repos/{self.repo}/tarball/{sha}", stream=True, timeout=TIMEOUT
+        )
+        response.raise_for_status()
+        response.raw.decode_content = True
+        files = {}
+        with tarfile.open(fileobj=response.raw, mode="r|gz") as archive:
+            for member in archive:
+                if not member.isfile():
+                    continue
+                # Drop the "owner-repo-sha/" directory GitHub wraps the tree in
+                path = member.name.split("/", 1)[-1]
+                if is_map_file(path):
+                    content = archive.extractfile(member).read()
+                    files[path] = content.decode("utf-8", errors="replace")
+        return files
+
+    def _load(self, sha):
+        index = read_json(self._index_path(sha))
+        if index is not None:
+            return index["files"]
+        files = self.download(sha)
+        write_json(self._index_path(sha), {"sha": sha, "files": files})
+        # Older snapshots are no longer needed once the new one is on disk
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".json") and name not in ("head.json", f"{sha}.json"):
+                os.remove(os.path.join(self.cache_dir, name))
+        return files
+
+    def refresh(self, force=False):
+        """Make sure the index matches the head commit and return its SHA."""
+        with self._lock:
+            if not force and self.sha and time.monotonic() - self._checked < REVALIDATE_SECONDS:
+                return self.sha
+            try:
+                sha = self.resolve_head()
+            except requests.RequestException:
+                # Keep serving the last known snapshot while GitHub is unreachable
+                sha = self.sha or (read_json(self._head_path()) or {}).get("sha")
+                if not sha:
+                    raise
+            if sha != self.sha:
+                self._head = (sha, self._load(sha))
+            self._checked = time.monotonic()
+            return sha
+
+    def start(self, interval=REVALIDATE_SECONDS):
+        """Load the index and revalidate it every interval seconds in a daemon thread."""
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(
+                    target=self._refresh_forever, args=(interval,), name="repo-snapshot", daemon=True
+                )
+                self._worker.start()
+        return self
+
+    def _refresh_forever(self, interval):
+        while True:
+            try:
+                self.refresh(force=True)
+                self._error = None
+            except Exception as e:  # pylint: disable=broad-except
+                # Streaming the tarball can fail in urllib3, tarfile or on disk as well
+                print(f"Error refreshing the {self.repo} snapshot: {e}")
+                self._error = e
+            finally:
+                self._ready.set()
+            time.sleep(interval)
+
+    def _current(self):
+        # With a background worker only the very first load is waited for
+        if self._worker is None:
+            self.refresh()
+            return
+        self._ready.wait()
+        if self.sha is None and self._error is not None:
+            raise self._error
+
+    def head(self):
+        """Return the commit SHA and the {path: map text} of the snapshot, taken together."""
+        self._current()
+        return self._head
+
+    def paths(self):
+        """Return the sorted paths of every map in the repository."""
+        self._current()
+        return sorted(self.files)
+
+    def read(self, path):
+        """Return the map text stored at path."""
+        self._current()
+        return self.files[path]
+
+    def neighbours(self, path, radius=2):
+        """Return the paths up to radius places before and after path in sorted order."""
+        paths = self.paths()
+        i = bisect_left(paths, path)
+        return paths[max(0, i - radius): i] + paths[i + 1: i + 1 + radius]
@@ -0,0 +1,134 @@
+"""Level-of-detail view of the component graph for large maps.
+
+The PyVis view sends every node and edge of a map to the browser inside a
+full vis.js HTML document, on every rerun. For maps with thousands of
+components this module groups the graph into clusters instead: each
+pipeline with its members forms one cluster, and the components outside
+pipelines are grouped by evolution stage. Clusters are computed once per
+map; a view is then a compact, column-wise JSON payload in which
+collapsed clusters are single nodes and only the expanded clusters show
+their components. Edges between shown nodes are aggregated with a count,
+using arrays, so expanding a cluster does not walk the whole graph.
+
+The payload is drawn by the small vis-network page in frontend/lod_graph,
+which is served once as a static Streamlit component and reports which
+cluster the user clicked.
+"""
+
+import math
+import os
+from functools import lru_cache
+
+import numpy as np
+
+from map_graph import DEFAULT_COLOR, EVOLUTION_COLORS
+
+LOD_NODES = 300  # Nodes shown before the user expands anything
+COMPONENT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "frontend", "lod_graph")
+
+
+class LevelOfDetail:
+    """Pipeline and evolution-stage clusters of a component graph."""
+
+    def __init__(self, G, pipelines=()):
+        self.names = list(G.nodes)
+        index = {name: i for i, name in enumerate(self.names)}
+        cluster_of = np.full(len(self.names), -1, dtype=np.int32)
+        self.clusters = []
+
+        # A pipeline cluster holds the pipeline and the members linked to it in the graph
+        for pipeline in pipelines:
+            name = pipeline["name"]
+            if name not in index or cluster_of[index[name]] >= 0:
+                continue
+            members = [name] + [c for c in pipeline["components"] if c in index and G.has_edge(name, c)]
+            rows = [index[m] for m in members if cluster_of[index[m]] < 0]
+            cluster_of[rows] = len(self.clusters)
+            self.clusters.append({"label": name, "kind": "pipeline", "rows": rows})
+
+        # Everything else is grouped by evolution stage
+        by_stage = {}
+        for row in np.flatnonzero(cluster_of < 0):
+            by_stage.setdefault(G.nodes[self.names[row]].get("stage", "unknown"), []).append(int(row))
+        for stage, rows in sorted(by_stage.items(), key=lambda item: str(item[0])):
+            cluster_of[rows] = len(self.clusters)
+            self.clusters.append({"label": str(stage), "kind": "stage", "rows": rows})
+        self.cluster_of = cluster_of
+
+        positions = [G.nodes[name].get("pos", (0, 0)) for name in self.names]
+        self.x = np.array([float(x) for x, _ in positions], dtype=np.float64)
+        self.y = np.array([float(y) for _, y in positions], dtype=np.float64)
+        self.colors = [G.nodes[name].get("color", DEFAULT_COLOR) for name in self.names]
+        for cluster in self.clusters:
+            rows = cluster["rows"]
+            cluster["x"] = float(self.x[rows].mean())
+            cluster["y"] = float(self.y[rows].mean())
+            stages = [G.nodes[self.names[row]].get("stage") for row in rows]
+            common = max(set(stages), key=stages.count, default=None)
+            cluster["color"] = EVOLUTION_COLORS.get(common, DEFAULT_COLOR)
+
+        edges = np.array([(index[u], index[v]) for u, v in G.edges()], dtype=np.int32).reshape(-1, 2)
+        self.src, self.tgt = edges[:, 0], edges[:, 1]
+
+    def default_expanded(self, budget=LOD_NODES):
+        """Return the clusters to expand first: the smallest ones that fit in budget nodes."""
+        shown = len(self.clusters)
+        expanded = set()
+        for k in sorted(range(len(self.clusters)), key=lambda k: len(self.clusters[k]["rows"])):
+            extra = len(self.clusters[k]["rows"]) - 1
+            if shown + extra > budget:
+                break
+            expanded.add(k)
+            shown += extra
+        return expanded
+
+    def payload(self, expanded, node_size=5):
+        """Return the JSON-ready view with the given clusters expanded.
+
+        Node ids are component rows, or len(names) + k for collapsed cluster k.
+        """
+        n = len(self.names)
+        is_expanded = np.zeros(len(self.clusters), dtype=bool)
+        is_expanded[[k for k in expanded if 0 <= k < len(self.clusters)]] = True
+
+        nodes = {"id": [], "label": [], "x": [], "y": [], "color": [], "size": [], "cluster": [], "count": []}
+
+        def add(node_id, label, x, y, color, size, cluster, count):
+            for column, value in zip(nodes, (node_id, label, x, y, color, size, cluster, count)):
+                nodes[column].append(value)
+
+        for k, cluster in enumerate(self.clusters):
+            rows = cluster["rows"]
+            if is_expanded[k] or len(rows) == 1:
+                for row in rows:
+                    add(row, self.names[row], round(self.x[row], 4), round(self.y[row], 4),
+                        self.colors[row], node_size, k, 0)
+            else:
+                add(n + k, f"{cluster['label']} ({len(rows)})", round(cluster["x"], 4),
+                    round(cluster["y"], 4), cluster["color"],
+                    round(node_size * (1 + math.log2(len(rows))), 1), k, len(rows))
+
+        # Map both ends of every edge to the node showing it and count the duplicates
+        singleton = np.array([len(c["rows"]) == 1 for c in self.clusters], dtype=bool)
+        shown_as_row = is_expanded | singleton
+        visible = np.where(shown_as_row[self.cluster_of], np.arange(n), n + self.cluster_of)
+        pairs = np.stack([visible[self.src], visible[self.tgt]], axis=1)
+        pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+        if len(pairs):
+            pairs, counts = np.unique(pairs, axis=0, return_counts=True)
+        else:
+            counts = np.zeros(0, dtype=np.int64)
+        edges = {"from": pairs[:, 0].tolist(), "to": pairs[:, 1].tolist(), "count": counts.tolist()}
+        return {"nodes": nodes, "edges": edges, "clusters": len(self.clusters)}
+
+
+@lru_cache(maxsize=None)
+def _component():
+    import streamlit.components.v1 as components
+
+    return components.declare_component("lod_graph", path=COMPONENT_PATH)
+
+
+def lod_graph(payload, height=1200, key=None):
+    """Draw a payload in the browser; return the last click event, if any."""
+    return _component()(payload=payload, height=height, key=key, default=None)
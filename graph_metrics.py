@@ -0,0 +1,241 @@
+"""Dependency metrics of every component, computed over whole arrays.
+
+A link A->B means A depends on B, so user needs sit at the top of the
+value chain and commodities at the bottom. For every node of a component
+graph, whether of one map or the merged graph of a repository, this module
+computes:
+
+* depth: links from the nearest node nothing depends on (an anchor or user
+  need); -1 for nodes only reachable through a cycle,
+* fan_in and fan_out: the direct dependents and dependencies,
+* dependents: the nodes that depend on it directly or transitively,
+* risk: how exposed an immature component is, from 0 to 1. It is
+  (1 - evolution) times the mean of its visibility and its criticality,
+  where criticality is log(1 + dependents) relative to the most depended
+  on node of the graph.
+
+Only dependency links count: the edges build_graph adds from a pipeline to
+its members are left out.
+
+The graph is held as CSR arrays (edge targets sorted by source, and edge
+sources sorted by target), and every pass handles a whole BFS level or a
+whole relaxation step with NumPy, so once the arrays are built no Python
+code runs per node or per edge. Building them from a networkx graph in
+GraphMetrics.from_graph still walks its nodes and edges once. Transitive dependents are counted exactly with bitsets up to
+EXACT_DEPENDENTS_NODES nodes. Above that they are estimated from SKETCH_SIZE
+minimum exponential ranks per node (Cohen's size estimator), with a
+relative error of about 1 / sqrt(SKETCH_SIZE - 2). A merged graph of 300k
+nodes without cycles takes about a second; cycles are relaxed again until
+nothing changes, so a graph of that size with many cycles takes around ten.
+
+    python graph_metrics.py --top 20 --by risk        # the merged graph of knowledge_graph.py
+    python graph_metrics.py map.owm --by dependents
+"""
+
+import argparse
+import json
+import sys
+
+import numpy as np
+
+METRIC_ATTRIBUTES = ("depth", "fan_in", "fan_out", "dependents", "risk")
+EXACT_DEPENDENTS_NODES = 1024  # Bitsets of n * n bits get slow above this
+SKETCH_SIZE = 32  # Ranks kept per node when dependents are estimated
+_POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.int64)
+
+
+def csr(src, tgt, n):
+    """Return (indptr, indices): the targets of each source's edges, sorted by source."""
+    order = np.argsort(src, kind="stable")
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    return indptr, tgt[order]
+
+
+def _neighbours(indptr, indices, rows):
+    # Concatenated neighbours of rows, gathered without a loop
+    starts = indptr[rows]
+    counts = indptr[rows + 1] - starts
+    offsets = np.repeat(starts - np.cumsum(counts) + counts, counts)
+    return indices[offsets + np.arange(counts.sum())]
+
+
+def bfs_depth(indptr, indices, roots, n):
+    """Return the BFS level of every node from roots, -1 where unreachable."""
+    depth = np.full(n, -1, dtype=np.int32)
+    frontier = np.asarray(roots, dtype=np.int64)
+    depth[frontier] = 0
+    level = 0
+    while frontier.size:
+        level += 1
+        reached = _neighbours(indptr, indices, frontier)
+        frontier = np.unique(reached[depth[reached] < 0])
+        depth[frontier] = level
+    return depth
+
+
+def _push(values, indptr, indices, rows, combine):
+    """Combine the values of rows into their successors; return (successors, pushes, changed).
+
+    Each successor gets the values of all of its predecessors among rows at
+    once through combine.reduceat, with no loop over nodes or edges.
+    """
+    counts = indptr[rows + 1] - indptr[rows]
+    sources = np.repeat(rows, counts)
+    targets = _neighbours(indptr, indices, rows)
+    order = np.argsort(targets, kind="stable")
+    heads, starts, pushes = np.unique(targets[order], return_index=True, return_counts=True)
+    if not heads.size:
+        return heads, pushes, heads
+    merged = combine(values[heads], combine.reduceat(values[sources[order]], starts, axis=0))
+    changed = merged != values[heads]
+    if changed.ndim > 1:
+        changed = changed.any(axis=1)
+    values[heads] = merged
+    return heads, pushes, heads[changed]
+
+
+def propagate(values, src, tgt, combine):
+    """Fold every node's value into all of its descendants with combine; return values.
+
+    Nodes are taken in topological order a layer at a time: once all of a
+    node's predecessors are final, its value is pushed along its edges, so
+    on an acyclic graph every edge is used once. Nodes on or below a cycle
+    never become ready; from them, values are pushed on from the nodes that
+    changed in the previous step until nothing changes.
+    """
+    n = len(values)
+    loop = src == tgt  # A node adds nothing to itself
+    indptr, indices = csr(src[~loop], tgt[~loop], n)
+    waiting = np.bincount(tgt[~loop], minlength=n)
+    frontier = np.flatnonzero(waiting == 0)
+    ready = np.zeros(n, dtype=bool)
+    while frontier.size:
+        ready[frontier] = True
+        heads, pushes, _ = _push(values, indptr, indices, frontier, combine)
+        waiting[heads] -= pushes
+        frontier = heads[waiting[heads] == 0]
+    active = np.flatnonzero(~ready)
+    while active.size:
+        _, _, active = _push(values, indptr, indices, active, combine)
+    return values
+
+
+def exact_dependents(src, tgt, n):
+    """Count every node's direct and transitive dependents with a bitset per node."""
+    rows = np.arange(n)
+    reach = np.zeros((n, (n + 7) // 8), dtype=np.uint8)
+    reach[rows, rows >> 3] = np.left_shift(1, 7 - (rows & 7)).astype(np.uint8)
+    if len(src):
+        propagate(reach, src, tgt, np.bitwise_or)
+    return _POPCOUNT[reach].sum(axis=1) - 1
+
+
+def estimated_dependents(src, tgt, n, k=SKETCH_SIZE, seed=0):
+    """Estimate every node's direct and transitive dependents from k minimum ranks."""
+    ranks = np.random.default_rng(seed).exponential(size=(n, k)).astype(np.float32)
+    if len(src):
+        propagate(ranks, src, tgt, np.minimum)
+    # The k smallest-rank minima of a set of size s sum to about (k - 1) / s
+    estimate = (k - 1) / ranks.sum(axis=1, dtype=np.float64)
+    return np.rint(estimate - 1).astype(np.int64)
+
+
+class GraphMetrics:
+    """Depth, fan-in, fan-out, transitive dependents and risk of every node of a graph."""
+
+    def __init__(self, names, src, tgt, evolution, visibility):
+        self.names = list(names)
+        n = len(self.names)
+        src = np.asarray(src, dtype=np.int64)
+        tgt = np.asarray(tgt, dtype=np.int64)
+        self.fan_out = np.bincount(src, minlength=n)
+        self.fan_in = np.bincount(tgt, minlength=n)
+
+        indptr, indices = csr(src, tgt, n)
+        self.depth = bfs_depth(indptr, indices, np.flatnonzero(self.fan_in == 0), n)
+
+        self.exact = n <= EXACT_DEPENDENTS_NODES
+        if self.exact:
+            self.dependents = exact_dependents(src, tgt, n)
+        else:
+            # Direct dependents other than the node itself bound the estimate from below
+            direct = np.bincount(tgt[src != tgt], minlength=n)
+            estimate = np.clip(estimated_dependents(src, tgt, n), direct, n - 1)
+            self.dependents = np.where(direct > 0, estimate, 0)
+
+        evolution = np.clip(np.asarray(evolution, dtype=np.float64), 0, 1)
+        visibility = np.clip(np.asarray(visibility, dtype=np.float64), 0, 1)
+        most = self.dependents.max() if n else 0
+        criticality = np.log1p(self.dependents) / np.log1p(most) if most else np.zeros(n)
+        self.risk = np.round((1 - evolution) * (visibility + criticality) / 2, 4)
+
+    @classmethod
+    def from_graph(cls, G):
+        """Compute the metrics of a DiGraph whose nodes have an (evolution, visibility) "pos".
+
+        Edges with type "pipeline" link a pipeline to its members and are not dependencies, so they are skipped.
+        """
+        index = {name: i for i, name in enumerate(G.nodes)}
+        edges = np.array(
+            [(index[u], index[v]) for u, v, kind in G.edges(data="type") if kind != "pipeline"],
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        positions = np.array(
+            [[float(v) for v in attrs.get("pos", (0, 0))] for _, attrs in G.nodes(data=True)],
+            dtype=np.float64,
+        ).reshape(-1, 2)
+        return cls(index, edges[:, 0], edges[:, 1], positions[:, 0], positions[:, 1])
+
+    def __len__(self):
+        return len(self.names)
+
+    def row(self, i):
+        """Return the metrics of node i as plain Python values."""
+        return {attribute: getattr(self, attribute)[i].item() for attribute in METRIC_ATTRIBUTES}
+
+    def as_dict(self):
+        """Return {node name: {metric: value}} for every node."""
+        columns = [getattr(self, attribute).tolist() for attribute in METRIC_ATTRIBUTES]
+        return {
+            name: dict(zip(METRIC_ATTRIBUTES, values)) for name, *values in zip(self.names, *columns)
+        }
+
+    def top(self, count=20, by="risk"):
+        """Return the count nodes with the highest value of the metric by, highest first."""
+        values = getattr(self, by)
+        order = np.argsort(-values, kind="stable")[:count]
+        return [{"name": self.names[i], **self.row(i)} for i in order]
+
+
+def annotate(G):
+    """Set the metrics of every node of G as node attributes; return G."""
+    for name, values in GraphMetrics.from_graph(G).as_dict().items():
+        G.nodes[name].update(values)
+    return G
+
+
+def main(argv=None):
+    from knowledge_graph import DB_PATH, KnowledgeGraph
+
+    parser = argparse.ArgumentParser(description="Rank components by their dependency metrics.")
+    parser.add_argument("map_file", nargs="?", help="A map to rank; by default the merged graph")
+    parser.add_argument("--db", default=DB_PATH, help="SQLite file built by knowledge_graph.py")
+    parser.add_argument("--top", type=int, default=20, help="Components to list")
+    parser.add_argument("--by", choices=METRIC_ATTRIBUTES, default="risk", help="Metric to rank by")
+    args = parser.parse_args(argv)
+
+    if args.map_file:
+        from map_cache import ParsedMap
+
+        with open(args.map_file, "r", encoding="utf-8") as file:
+            metrics = GraphMetrics.from_graph(ParsedMap(file.read()).graph())
+    else:
+        metrics = KnowledgeGraph(args.db).metrics()
+    for row in metrics.top(args.top, args.by):
+        print(json.dumps(row))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
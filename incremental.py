@@ -0,0 +1,213 @@
+"""Incremental re-parsing of a map whose text changed slightly.
+
+parse_wardley_map treats every line on its own and only afterwards works
+out which components sit inside each pipeline. IncrementalMap keeps the
+parse of every line, so a new revision of the text is diffed against the
+old one line by line and only the inserted or replaced lines are parsed
+again. The sections are then reassembled, reusing the unchanged
+statements, and pipeline membership is recomputed from a y-sorted index.
+A few lines only parse in the context of the lines before them, such as a
+component without coordinates, which takes the visibility of the previous
+component; a map holding one is always parsed in full.
+
+The JSON and YAML outputs are serialized section by section, so a new
+revision only re-serializes the sections that actually changed.
+"""
+
+import json
+from bisect import bisect_left, bisect_right
+from difflib import SequenceMatcher
+
+from map_graph import parse_pos, pipeline_span
+
+# Sections in the order parse_wardley_map returns them
+SECTIONS = [
+    "title", "anchors", "evolution", "components", "links", "evolve", "markets",
+    "pipelines", "pioneers", "notes", "blueline", "style", "annotations", "comments",
+]
+# Above this share of changed lines a full parse is cheaper than patching
+MAX_CHANGED_RATIO = 0.5
+PIPELINE_HEIGHT = 0.01
+
+
+def split_lines(map_text):
+    """Split map text into lines exactly as parse_wardley_map does."""
+    return map_text.strip().split("\n")
+
+
+class ContextError(ValueError):
+    """A line cannot be parsed without the lines before it."""
+
+
+def parse_line(line):
+    """Return {section: [entries]} for one line, as parse_wardley_map would parse it.
+
+    Raises ContextError for a line whose parse depends on earlier lines.
+    """
+    from wardley_map import parse_wardley_map
+
+    try:
+        # Comment sentinels stop parse_wardley_map from stripping the line itself
+        fragment = parse_wardley_map("//\n" + line + "\n//")
+    except Exception as e:  # pylint: disable=broad-except
+        # parse_wardley_map keeps some values from line to line, such as the visibility
+        # a component without coordinates inherits, and fails when they are missing
+        raise ContextError(f"Cannot parse {line!r} on its own: {e}") from e
+    fragment["comments"] = fragment["comments"][1:-1]
+    return {section: entries for section, entries in fragment.items() if entries}
+
+
+def assign_pipeline_members(components, pipelines):
+    """Fill each pipeline's "components" list like parse_wardley_map does."""
+    first_by_name = {}
+    entries = []
+    for order, component in enumerate(components):
+        first_by_name.setdefault(component["name"], component)
+        x, y = parse_pos(component.get("pos", "[0, 0]"))
+        entries.append((y, x, order, component["name"]))
+    entries.sort()
+    ys = [entry[0] for entry in entries]
+
+    for pipeline in pipelines:
+        matching = first_by_name.get(pipeline["name"])
+        if matching is None:
+            continue
+        _, top = parse_pos(matching["pos"])
+        left, right = pipeline_span(pipeline)
+        inside = [
+            (order, name)
+            for _, x, order, name in entries[bisect_left(ys, top - PIPELINE_HEIGHT): bisect_right(ys, top)]
+            if left <= x <= right and name != pipeline["name"]
+        ]
+        pipeline["components"].extend(name for _, name in sorted(inside))
+
+
+def json_section(key, value):
+    """Serialize one top-level section exactly as json.dumps(..., indent=2) would."""
+    return "  " + json.dumps(key) + ": " + json.dumps(value, indent=2).replace("\n", "\n  ")
+
+
+def yaml_section(key, value):
+    import yaml
+
+    return yaml.dump({key: value}, default_flow_style=False)
+
+
+def assemble_json(blocks, keys):
+    """Yield the JSON document made of the section blocks, piece by piece."""
+    yield "{\n"
+    for i, key in enumerate(keys):
+        yield (",\n" if i else "") + blocks[key]
+    yield "\n}"
+
+
+def assemble_yaml(blocks, keys):
+    for key in sorted(keys):
+        yield blocks[key]
+
+
+# Formats that can be rebuilt from per-section blocks
+SECTIONED_FORMATS = {
+    "json": (json_section, assemble_json),
+    "yaml": (yaml_section, assemble_yaml),
+}
+
+
+class IncrementalMap:
+    """The per-line parse of a map, which can be cheaply moved to a new revision."""
+
+    def __init__(self, lines, fragments, blocks=None):
+        self.lines = lines
+        self.fragments = fragments
+        self.data = self._assemble()
+        # {format: {section: serialized block}} for the sections serialized so far
+        self._blocks = blocks or {}
+
+    @classmethod
+    def from_text(cls, map_text):
+        """Parse map_text line by line; raises ContextError if a line needs the lines before it."""
+        lines = split_lines(map_text)
+        return cls(lines, [parse_line(line) for line in lines])
+
+    def _assemble(self):
+        data = {section: [] for section in SECTIONS}
+        for fragment in self.fragments:
+            for section, entries in fragment.items():
+                data[section].extend(entries)
+        # Membership is recomputed per revision, so never touch the shared fragment dicts
+        data["pipelines"] = [dict(pipeline, components=[]) for pipeline in data["pipelines"]]
+        assign_pipeline_members(data["components"], data["pipelines"])
+        return data
+
+    def updated(self, map_text):
+        """Return the IncrementalMap of a new revision.
+
+        Returns None if most lines changed, or if a changed line cannot be
+        parsed on its own.
+        """
+        new_lines = split_lines(map_text)
+        old_lines = self.lines
+
+        # Trim the common head and tail first; typical edits touch a few lines
+        head = 0
+        limit = min(len(old_lines), len(new_lines))
+        while head < limit and old_lines[head] == new_lines[head]:
+            head += 1
+        tail = 0
+        while (
+            tail < limit - head
+            and old_lines[len(old_lines) - 1 - tail] == new_lines[len(new_lines) - 1 - tail]
+        ):
+            tail += 1
+        old_mid = old_lines[head: len(old_lines) - tail]
+        new_mid = new_lines[head: len(new_lines) - tail]
+
+        fragments = list(self.fragments[:head])
+        changed = set()
+        reparsed = 0
+        matcher = SequenceMatcher(None, old_mid, new_mid, autojunk=False)
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == "equal":
+                fragments.extend(self.fragments[head + i1: head + i2])
+                continue
+            for fragment in self.fragments[head + i1: head + i2]:
+                changed.update(fragment)
+            for line in new_mid[j1:j2]:
+                try:
+                    fragment = parse_line(line)
+                except ContextError:
+                    return None
+                changed.update(fragment)
+                fragments.append(fragment)
+                reparsed += 1
+            if reparsed > MAX_CHANGED_RATIO * max(1, len(new_lines)):
+                return None
+        if tail:
+            fragments.extend(self.fragments[len(self.fragments) - tail:])
+
+        if changed & {"components", "pipelines"}:
+            changed.add("pipelines")  # Membership depends on both
+        # Carry over the serialized blocks of every section that did not change
+        blocks = {
+            fmt: {section: block for section, block in fmt_blocks.items() if section not in changed}
+            for fmt, fmt_blocks in self._blocks.items()
+        }
+        return IncrementalMap(new_lines, fragments, blocks)
+
+    def iter_serialize(self, fmt, extra=None):
+        """Yield the map in a SECTIONED_FORMATS format, reusing unchanged blocks.
+
+        extra holds sections to add after the map's own, such as the JSON
+        metrics; they depend on the whole map, so they are never reused.
+        """
+        section_serializer, assemble = SECTIONED_FORMATS[fmt]
+        blocks = self._blocks.setdefault(fmt, {})
+        for section in SECTIONS:
+            if section not in blocks:
+                blocks[section] = section_serializer(section, self.data[section])
+        extra = extra or {}
+        extra_blocks = {key: section_serializer(key, value) for key, value in extra.items()}
+        return assemble({**blocks, **extra_blocks}, SECTIONS + list(extra))
+
+    def serialize(self, fmt, extra=None):
+        return "".join(self.iter_serialize(fmt, extra))
@@ -0,0 +1,161 @@
+"""Per-stage timing and profiling for app reruns.
+
+A Run records the wall time of each named stage of a Streamlit rerun
+(fetching, parsing, plotting, graph building, rendering, ...). Peak Python
+memory per stage is recorded while tracemalloc is tracing, which a profiled
+run switches on; otherwise only the process peak RSS is available. Stage
+totals are also aggregated for the whole process and can be exported as
+Prometheus text, together with the hit, miss and eviction counters of the
+shared caches, and each run can be appended to a JSON lines file.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+# Append every run's stage records to this JSON lines file when set
+METRICS_FILE = os.environ.get("WM2MANY_METRICS_FILE")
+
+_totals = {}
+_totals_lock = threading.Lock()
+
+
+def max_rss_kb():
+    """Return the peak resident set size of the process in KiB, if known."""
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _aggregate(record):
+    with _totals_lock:
+        totals = _totals.setdefault(
+            record["stage"], {"count": 0, "seconds": 0.0, "max_seconds": 0.0, "max_peak_bytes": 0}
+        )
+        totals["count"] += 1
+        totals["seconds"] += record["seconds"]
+        totals["max_seconds"] = max(totals["max_seconds"], record["seconds"])
+        if record["peak_bytes"] is not None:
+            totals["max_peak_bytes"] = max(totals["max_peak_bytes"], record["peak_bytes"])
+
+
+def prometheus_text():
+    """Return the process-wide stage totals in the Prometheus text format."""
+    with _totals_lock:
+        totals = {stage: dict(values) for stage, values in _totals.items()}
+    lines = [
+        "# HELP wm2many_stage_seconds Wall time spent in each stage of a rerun.",
+        "# TYPE wm2many_stage_seconds summary",
+    ]
+    for stage, values in sorted(totals.items()):
+        lines.append(f'wm2many_stage_seconds_count{{stage="{stage}"}} {values["count"]}')
+        lines.append(f'wm2many_stage_seconds_sum{{stage="{stage}"}} {values["seconds"]:.6f}')
+    lines += [
+        "# HELP wm2many_stage_seconds_max Slowest single run of each stage.",
+        "# TYPE wm2many_stage_seconds_max gauge",
+    ]
+    for stage, values in sorted(totals.items()):
+        lines.append(f'wm2many_stage_seconds_max{{stage="{stage}"}} {values["max_seconds"]:.6f}')
+    lines += [
+        "# HELP wm2many_stage_peak_bytes Largest traced Python memory peak of each stage.",
+        "# TYPE wm2many_stage_peak_bytes gauge",
+    ]
+    for stage, values in sorted(totals.items()):
+        lines.append(f'wm2many_stage_peak_bytes{{stage="{stage}"}} {values["max_peak_bytes"]}')
+    from map_cache import cache_stats
+
+    caches = cache_stats()
+    for metric, kind, help_text in (
+        ("hits", "counter", "Lookups answered from each shared cache."),
+        ("misses", "counter", "Lookups each shared cache could not answer."),
+        ("evictions", "counter", "Entries dropped from each shared cache to stay within its budget."),
+        ("bytes", "gauge", "Estimated memory held by each shared cache."),
+        ("entries", "gauge", "Entries held in memory by each shared cache."),
+    ):
+        name = f"wm2many_cache_{metric}" + ("_total" if kind == "counter" else "")
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+        for cache, stats in caches.items():
+            lines.append(f'{name}{{cache="{cache}"}} {stats[metric]}')
+    rss = max_rss_kb()
+    if rss is not None:
+        lines += [
+            "# HELP wm2many_max_rss_kilobytes Peak resident set size of the process.",
+            "# TYPE wm2many_max_rss_kilobytes gauge",
+            f"wm2many_max_rss_kilobytes {rss}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+class Run:
+    """The stage records of one rerun, optionally under cProfile and tracemalloc."""
+
+    def __init__(self, profile=False):
+        self.records = []
+        self.started = time.perf_counter()
+        self.profile_report = None
+        self._profiler = None
+        self._started_tracing = False
+        if profile:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._started_tracing = True
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+
+    @contextmanager
+    def stage(self, name):
+        """Time the body of the with block as the stage called name."""
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            record = {
+                "stage": name,
+                "seconds": time.perf_counter() - started,
+                "peak_bytes": tracemalloc.get_traced_memory()[1] - baseline if tracing else None,
+                "max_rss_kb": max_rss_kb(),
+            }
+            self.records.append(record)
+            _aggregate(record)
+
+    def finish(self):
+        """Stop any profiling, write the run to METRICS_FILE and return the records."""
+        total = time.perf_counter() - self.started
+        if self._profiler is not None:
+            self._profiler.disable()
+            stats_out = io.StringIO()
+            pstats.Stats(self._profiler, stream=stats_out).sort_stats("cumulative").print_stats(30)
+            top_allocations = tracemalloc.take_snapshot().statistics("lineno")[:15]
+            self.profile_report = {
+                "cprofile": stats_out.getvalue(),
+                "tracemalloc": "\n".join(str(stat) for stat in top_allocations),
+            }
+            if self._started_tracing:
+                tracemalloc.stop()
+            self._profiler = None
+        if METRICS_FILE:
+            with open(METRICS_FILE, "a", encoding="utf-8") as metrics:
+                metrics.write(self.to_jsonl(total))
+        return self.records
+
+    def to_jsonl(self, total=None):
+        """Return the stage records as JSON lines, ending with the whole-run total."""
+        lines = [json.dumps(record) for record in self.records]
+        if total is not None:
+            lines.append(json.dumps({"stage": "total", "seconds": total, "max_rss_kb": max_rss_kb()}))
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,330 @@
+"""Convert JSON documents to TOML without loading them whole.
+
+json.loads and toml.dumps both need the entire document in memory, and an
+exported archive of maps can run to hundreds of MB. Here the top-level
+object is read in chunks and decoded one member, or one element of a
+top-level array, at a time with json.JSONDecoder.raw_decode, so memory is
+bounded by the largest single element rather than by the file. TOML wants
+plain keys before any table, so plain values are written as they arrive
+while arrays of tables are spooled to a temporary file and follow them.
+Like toml, an array is written as tables if any of its elements is one, so
+each array is spooled until its end shows which it is; the rare array that
+mixes tables and plain values is converted whole. The output is the same
+text toml.dumps gives for the whole document, and where toml.dumps fails
+a ValueError is raised.
+
+Many files are converted in parallel worker processes into one zip:
+
+    python json_toml.py maps/*.json --zip maps-toml.zip --workers 8
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from converters import CHUNK_SIZE
+from map_cache import EXPORT_CACHE_FILES, EXPORT_DIR, prune_dir, read_json, write_chunks, write_json, write_zip
+
+MAX_ELEMENT_CHARS = 64 * 1024 * 1024  # Largest single JSON element held in memory
+_WHITESPACE = " \t\n\r"
+_NUMBER_CHARS = "0123456789.eE+-"
+
+
+class _JsonReader:
+    """Reads JSON values one at a time from a text stream."""
+
+    def __init__(self, stream, chunk_size=CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self, size=None):
+        if self.pos > self.chunk_size:
+            # Drop what has been decoded so the buffer only holds the current element
+            self.buffer = self.buffer[self.pos:]
+            self.pos = 0
+        if len(self.buffer) - self.pos > MAX_ELEMENT_CHARS:
+            raise ValueError(f"A JSON element is larger than {MAX_ELEMENT_CHARS} characters")
+        chunk = self.stream.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+        self.buffer += chunk
+
+    def peek(self):
+        """Skip whitespace and return the next character, or "" at the end."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos: self.pos + 1]
+            self._fill()
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} but found {found or 'the end'!r}")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete JSON value."""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+                # Read at least as much as is buffered, so a large element is decoded O(log n) times
+                self._fill(max(self.chunk_size, len(self.buffer) - self.pos))
+                continue
+            # A number cut off by the end of the buffer may continue in the next chunk
+            number = isinstance(value, (int, float)) and not isinstance(value, bool)
+            cut = end == len(self.buffer) or (number and self.buffer[end] in _NUMBER_CHARS)
+            if cut and not self.eof:
+                self._fill()
+                continue
+            self.pos = end
+            return value
+
+    def items(self):
+        """Decode the elements of the array starting here, one at a time."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.peek() == ",":
+                self.pos += 1
+            else:
+                self.expect("]")
+                return
+
+    def members(self):
+        """Yield (key, reader) for each member of the object starting here.
+
+        The caller reads the member's value from the reader before asking
+        for the next member.
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise ValueError("Object keys must be strings")
+            self.expect(":")
+            yield key, self
+            if self.peek() == ",":
+                self.pos += 1
+            else:
+                self.expect("}")
+                return
+
+
+def _quote_key(key, encoder):
+    # Quoted the same way as toml.TomlEncoder.dump_sections
+    if re.match(r"^[A-Za-z0-9_-]+$", key):
+        return key
+    return encoder.dump_value(key)
+
+
+def _dumps_mixed(key, elements):
+    # An array mixing tables and plain values is rare, so it is converted whole
+    import toml
+
+    try:
+        return toml.dumps({key: elements})
+    except (TypeError, AttributeError) as e:
+        # toml writes every element as a table, which fails for anything but a table or []
+        raise ValueError(f"TOML cannot hold {key!r}, an array of tables and plain values") from e
+
+
+def iter_toml(stream, chunk_size=CHUNK_SIZE):
+    """Yield the TOML text of the JSON object read from a text stream, chunk by chunk."""
+    import toml
+
+    encoder = toml.TomlEncoder()
+    reader = _JsonReader(stream, chunk_size)
+    tables = {}  # Nested objects become [sections], written last as toml.dumps does
+    pending = []  # Plain text not yet yielded, flushed once it reaches chunk_size
+    pending_size = 0
+
+    def emit(text):
+        nonlocal pending_size
+        pending.append(text)
+        pending_size += len(text)
+        if pending_size >= chunk_size:
+            yield "".join(pending)
+            pending.clear()
+            pending_size = 0
+
+    def plain_and_arrays():
+        with tempfile.TemporaryFile("w+", encoding="utf-8") as arrays:
+            for key, member in reader.members():
+                quoted = _quote_key(key, encoder)
+                if member.peek() != "[":
+                    value = member.value()
+                    if isinstance(value, dict):
+                        tables[key] = value
+                    elif value is not None:
+                        yield from emit(f"{quoted} = {encoder.dump_value(value)}\n")
+                    continue
+                # toml writes an array as tables if any element is a table, so the
+                # elements are spooled until the end of the array tells which it is
+                with tempfile.TemporaryFile("w+", encoding="utf-8") as spool:
+                    kinds = set()
+                    for element in member.items():
+                        kinds.add(isinstance(element, dict))
+                        spool.write(json.dumps(element) + "\n")
+                    spool.seek(0)
+                    elements = (json.loads(line) for line in spool)
+                    if kinds == {True}:
+                        for element in elements:
+                            arrays.write(toml.dumps({key: [element]}))
+                    elif True in kinds:
+                        arrays.write(_dumps_mixed(key, list(elements)))
+                    else:
+                        yield from emit(f"{quoted} = [")
+                        for element in elements:
+                            yield from emit(f" {encoder.dump_value(element)},")
+                        yield from emit("]\n")
+            if reader.peek():
+                raise ValueError("Unexpected data after the JSON object")
+
+            yield "".join(pending)
+            arrays.seek(0)
+            yield from iter(lambda: arrays.read(chunk_size), "")
+
+    if reader.peek() != "{":
+        raise ValueError("TOML needs a JSON object at the top level")
+    last = ""
+    for chunk in plain_and_arrays():
+        if chunk:
+            last = (last + chunk)[-2:]
+            yield chunk
+    if tables:
+        # Sections follow the text before them after a blank line, as in toml.dumps
+        if last and last != "\n\n":
+            yield "\n"
+        yield toml.dumps(tables)
+
+
+def convert_file(source, target):
+    """Convert the JSON file source to the TOML file target; return a record of the run."""
+    record = {"source": source, "target": target}
+    try:
+        with open(source, "r", encoding="utf-8-sig") as stream:
+            record["chars"] = write_chunks(target, iter_toml(stream))
+    except (OSError, ValueError) as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    return record
+
+
+def convert_to_zip(sources, zip_path, workers=None):
+    """Convert many JSON files in parallel into one zip of TOML files.
+
+    sources is a list of (archive name, JSON path). Each file is converted
+    to a temporary file by a worker process and copied into the zip, so
+    neither the inputs nor the outputs are held in memory. Returns one
+    record per source, in order.
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        targets = [os.path.join(work_dir, f"{i}.toml") for i in range(len(sources))]
+        # Spawned workers are safe to start from a threaded server such as Streamlit
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            records = list(executor.map(convert_file, [path for _, path in sources], targets))
+        names = set()
+        for (name, _), record in zip(sources, records):
+            record["name"] = os.path.splitext(name)[0] + ".toml"
+            while record["name"] in names:
+                record["name"] = "_" + record["name"]  # Uploads may share a file name
+            names.add(record["name"])
+        write_zip(zip_path, [(r["name"], r["target"]) for r in records if "error" not in r])
+    for record in records:
+        del record["target"]
+    return records
+
+
+def _upload_hash(upload):
+    digest = hashlib.sha256()
+    upload.seek(0)
+    for block in iter(lambda: upload.read(CHUNK_SIZE), b""):
+        digest.update(block)
+    upload.seek(0)
+    return digest.hexdigest()
+
+
+def export_upload(upload):
+    """Convert an uploaded binary JSON file to TOML in the export cache; return the file path."""
+    path = os.path.join(EXPORT_DIR, _upload_hash(upload) + ".json.toml")
+    if os.path.exists(path):
+        os.utime(path)  # Keep recently used exports from being pruned
+        return path
+    stream = io.TextIOWrapper(upload, encoding="utf-8-sig")
+    try:
+        write_chunks(path, iter_toml(stream))
+    finally:
+        stream.detach()  # Leave the upload open for the caller
+        upload.seek(0)
+    prune_dir(EXPORT_DIR, EXPORT_CACHE_FILES)
+    return path
+
+
+def export_uploads_zip(uploads, workers=None):
+    """Convert uploaded JSON files in parallel into a zip in the export cache.
+
+    Returns the zip path and one record per upload. The same set of uploads
+    is served from the cache without converting again.
+    """
+    batch = "\n".join(f"{upload.name}:{_upload_hash(upload)}" for upload in uploads)
+    path = os.path.join(EXPORT_DIR, hashlib.sha256(batch.encode("utf-8")).hexdigest() + ".toml.zip")
+    records = read_json(path + ".json")
+    if records is not None and os.path.exists(path):
+        os.utime(path)
+        return path, records
+
+    with tempfile.TemporaryDirectory() as upload_dir:
+        sources = []
+        for i, upload in enumerate(uploads):
+            source = os.path.join(upload_dir, f"{i}.json")
+            with open(source, "wb") as file:
+                shutil.copyfileobj(upload, file, CHUNK_SIZE)
+            upload.seek(0)
+            sources.append((upload.name, source))
+        records = convert_to_zip(sources, path, workers or min(len(uploads), os.cpu_count()))
+    for record in records:
+        del record["source"]  # A temporary copy of the upload
+    write_json(path + ".json", records)
+    prune_dir(EXPORT_DIR, EXPORT_CACHE_FILES)
+    return path, records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert JSON files to TOML in bounded memory.")
+    parser.add_argument("sources", nargs="+", help="JSON files to convert")
+    parser.add_argument("--zip", required=True, help="Zip archive the TOML files are written to")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes")
+    args = parser.parse_args(argv)
+
+    records = convert_to_zip([(os.path.basename(p), p) for p in args.sources], args.zip, args.workers)
+    for record in records:
+        print(json.dumps(record))
+    return 1 if any("error" in record for record in records) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
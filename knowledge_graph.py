@@ -0,0 +1,249 @@
+"""A merged graph of every known map, stored in SQLite.
+
+Components with the same name are unified across maps, as in cypher_bulk.
+The graph lives in one SQLite file with indexes on component name,
+evolution stage and map, so questions such as "which maps use X" or "what
+is X linked to anywhere" are answered from the index instead of parsing
+every map again. Each map is stored with the hash of its text; updating
+with a new set of maps only re-ingests the maps whose text changed and
+drops the ones that disappeared.
+
+    python knowledge_graph.py MAP-REPOSITORY
+    python knowledge_graph.py --uses "Power"
+    python knowledge_graph.py --neighbours "Power"
+"""
+
+import argparse
+import json
+import os
+import sys
+
+from cypher_bulk import map_rows
+from map_cache import CACHE_DIR, connect_db, create_db
+from map_files import changed_maps, read_maps
+
+DB_PATH = os.path.join(CACHE_DIR, "knowledge.sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS maps (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    key TEXT NOT NULL,
+    title TEXT,
+    hash TEXT NOT NULL,
+    UNIQUE (source, key)
+);
+CREATE TABLE IF NOT EXISTS components (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS contains (
+    map_id INTEGER NOT NULL REFERENCES maps (id) ON DELETE CASCADE,
+    component_id INTEGER NOT NULL REFERENCES components (id),
+    type TEXT,
+    stage TEXT,
+    visibility TEXT,
+    x REAL,
+    y REAL
+);
+CREATE TABLE IF NOT EXISTS links (
+    map_id INTEGER NOT NULL REFERENCES maps (id) ON DELETE CASCADE,
+    src_id INTEGER NOT NULL REFERENCES components (id),
+    tgt_id INTEGER NOT NULL REFERENCES components (id)
+);
+CREATE INDEX IF NOT EXISTS contains_component ON contains (component_id);
+CREATE INDEX IF NOT EXISTS contains_map ON contains (map_id);
+CREATE INDEX IF NOT EXISTS contains_stage ON contains (stage);
+CREATE INDEX IF NOT EXISTS links_src ON links (src_id);
+CREATE INDEX IF NOT EXISTS links_tgt ON links (tgt_id);
+CREATE INDEX IF NOT EXISTS links_map ON links (map_id);
+"""
+
+
+class KnowledgeGraph:
+    """The merged component graph of many maps, persisted in a SQLite file."""
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        create_db(path, SCHEMA)
+
+    @staticmethod
+    def _component_ids(db, names):
+        db.executemany("INSERT OR IGNORE INTO components (name) VALUES (?)", [(n,) for n in names])
+        ids = {}
+        for name in names:
+            ids[name] = db.execute("SELECT id FROM components WHERE name = ?", (name,)).fetchone()[0]
+        return ids
+
+    def _ingest(self, db, source, key, map_text, digest):
+        rows = map_rows(key, map_text)
+        db.execute("DELETE FROM maps WHERE source = ? AND key = ?", (source, key))
+        map_id = db.execute(
+            "INSERT INTO maps (source, key, title, hash) VALUES (?, ?, ?, ?)",
+            (source, key, rows["maps"][0]["title"], digest),
+        ).lastrowid
+        ids = self._component_ids(db, {row["name"] for row in rows["components"]})
+        db.executemany(
+            "INSERT INTO contains (map_id, component_id, type, stage, visibility, x, y) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (map_id, ids[row["name"]], row["type"], row["stage"], row["visibility"], row["x"], row["y"])
+                for row in rows["components"]
+            ],
+        )
+        db.executemany(
+            "INSERT INTO links (map_id, src_id, tgt_id) VALUES (?, ?, ?)",
+            [(map_id, ids[row["src"]], ids[row["tgt"]]) for row in rows["links"]],
+        )
+
+    def update(self, source, maps, remove_missing=True):
+        """Bring the maps from source up to date; maps is an iterable of (key, map_text).
+
+        Maps whose text is unchanged are skipped. With remove_missing, maps
+        of this source that are not in maps are deleted. A map that could
+        not be fetched or fails to ingest keeps its last ingested revision.
+        Returns the number of maps ingested.
+        """
+        with connect_db(self.path) as db:
+            known = dict(db.execute("SELECT key, hash FROM maps WHERE source = ?", (source,)))
+        seen, ingested = set(), 0
+        for key, map_text, digest in changed_maps(maps, known, seen):
+            try:
+                # Each map in its own transaction, so readers see every finished map
+                with connect_db(self.path) as db:
+                    self._ingest(db, source, key, map_text, digest)
+            except Exception as e:  # pylint: disable=broad-except
+                print(f"Error ingesting map {source}:{key}: {e}")
+                continue
+            ingested += 1
+        with connect_db(self.path) as db:
+            if remove_missing:
+                db.executemany(
+                    "DELETE FROM maps WHERE source = ? AND key = ?",
+                    [(source, key) for key in set(known) - seen],
+                )
+            db.execute(
+                "DELETE FROM components WHERE id NOT IN (SELECT component_id FROM contains) "
+                "AND id NOT IN (SELECT src_id FROM links) AND id NOT IN (SELECT tgt_id FROM links)"
+            )
+        return ingested
+
+    def maps_using(self, name):
+        """Return every map containing the component called name, with its stage there."""
+        with connect_db(self.path) as db:
+            rows = db.execute(
+                "SELECT m.source, m.key, m.title, c.type, c.stage, c.visibility "
+                "FROM components k JOIN contains c ON c.component_id = k.id "
+                "JOIN maps m ON m.id = c.map_id WHERE k.name = ? ORDER BY m.source, m.key",
+                (name,),
+            ).fetchall()
+        keys = ["source", "map", "title", "type", "stage", "visibility"]
+        return [dict(zip(keys, row)) for row in rows]
+
+    def neighbours(self, name):
+        """Return the components linked to name in any map, with the maps linking them."""
+        with connect_db(self.path) as db:
+            rows = db.execute(
+                "SELECT 'out', t.name, m.source, m.key FROM components s "
+                "JOIN links l ON l.src_id = s.id JOIN components t ON t.id = l.tgt_id "
+                "JOIN maps m ON m.id = l.map_id WHERE s.name = ? "
+                "UNION ALL "
+                "SELECT 'in', s.name, m.source, m.key FROM components t "
+                "JOIN links l ON l.tgt_id = t.id JOIN components s ON s.id = l.src_id "
+                "JOIN maps m ON m.id = l.map_id WHERE t.name = ?",
+                (name, name),
+            ).fetchall()
+        merged = {}
+        for direction, neighbour, source, key in rows:
+            entry = merged.setdefault(
+                (direction, neighbour), {"direction": direction, "name": neighbour, "maps": []}
+            )
+            entry["maps"].append(f"{source}:{key}")
+        return sorted(merged.values(), key=lambda entry: (-len(entry["maps"]), entry["name"]))
+
+    def components_at(self, stage):
+        """Return (name, number of maps) for components placed at an evolution stage."""
+        with connect_db(self.path) as db:
+            return db.execute(
+                "SELECT k.name, COUNT(DISTINCT c.map_id) AS maps FROM contains c "
+                "JOIN components k ON k.id = c.component_id WHERE c.stage = ? "
+                "GROUP BY k.id ORDER BY maps DESC, k.name",
+                (stage,),
+            ).fetchall()
+
+    def names(self, prefix="", limit=50):
+        """Return component names starting with prefix, most widely used first."""
+        with connect_db(self.path) as db:
+            return [
+                row[0]
+                for row in db.execute(
+                    "SELECT k.name FROM components k JOIN contains c ON c.component_id = k.id "
+                    "WHERE k.name >= ? AND k.name < ? GROUP BY k.id "
+                    "ORDER BY COUNT(DISTINCT c.map_id) DESC, k.name LIMIT ?",
+                    (prefix, prefix + "\U0010ffff", limit),
+                )
+            ]
+
+    def metrics(self):
+        """Return the graph_metrics.GraphMetrics of the merged graph.
+
+        A component's position is its mean position over the maps containing
+        it, and a link present in several maps counts once.
+        """
+        import numpy as np
+
+        from graph_metrics import GraphMetrics
+
+        with connect_db(self.path) as db:
+            components = db.execute(
+                "SELECT k.id, k.name, AVG(c.x), AVG(c.y) FROM components k "
+                "LEFT JOIN contains c ON c.component_id = k.id GROUP BY k.id ORDER BY k.id"
+            ).fetchall()
+            links = np.array(
+                db.execute("SELECT DISTINCT src_id, tgt_id FROM links").fetchall(), dtype=np.int64
+            ).reshape(-1, 2)
+        ids = np.array([row[0] for row in components], dtype=np.int64)
+        positions = np.array([row[2:] for row in components], dtype=np.float64).reshape(-1, 2)
+        return GraphMetrics(
+            [row[1] for row in components],
+            np.searchsorted(ids, links[:, 0]),
+            np.searchsorted(ids, links[:, 1]),
+            np.nan_to_num(positions[:, 0]),
+            np.nan_to_num(positions[:, 1]),
+        )
+
+    def stats(self):
+        with connect_db(self.path) as db:
+            return {
+                table: db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("maps", "components", "contains", "links")
+            }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query the merged graph of many maps.")
+    parser.add_argument("input_dir", nargs="?", help="Directory of maps to ingest, e.g. MAP-REPOSITORY")
+    parser.add_argument("--db", default=DB_PATH, help="SQLite file holding the graph")
+    parser.add_argument("--uses", metavar="NAME", help="List the maps using a component")
+    parser.add_argument("--neighbours", metavar="NAME", help="List a component's links across maps")
+    parser.add_argument("--stage", help="List the components placed at an evolution stage")
+    args = parser.parse_args(argv)
+
+    graph = KnowledgeGraph(args.db)
+    if args.input_dir:
+        ingested = graph.update("dir", read_maps(args.input_dir))
+        print(json.dumps({"ingested": ingested, **graph.stats()}), file=sys.stderr)
+    if args.uses:
+        for row in graph.maps_using(args.uses):
+            print(json.dumps(row))
+    if args.neighbours:
+        for row in graph.neighbours(args.neighbours):
+            print(json.dumps(row))
+    if args.stage:
+        for name, maps in graph.components_at(args.stage):
+            print(json.dumps({"name": name, "maps": maps}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
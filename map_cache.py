@@ -0,0 +1,545 @@
+"""Shared cache of parsed Wardley Maps and everything derived from them.
+
+Streamlit runs every session in the same process, so a module level cache
+lets all sessions reuse a single parse of the same map text. Maps are keyed
+by a hash of their content and held in a size-bounded LRU cache.
+
+Graphs, renderings and converter outputs of every map go into one shared
+result cache keyed by content hash, result name and CACHE_VERSION. It is
+bounded by an estimate of the memory its entries hold rather than by their
+number, and text and bytes results evicted from memory are kept in a disk
+tier. Every cache counts its hits, misses and evictions for the debug panel
+and the Prometheus metrics.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import types
+import zipfile
+from collections import OrderedDict
+from contextlib import closing, contextmanager
+from itertools import islice
+
+PARSED_MAP_CACHE_SIZE = 64  # Number of distinct maps kept in memory
+# Directory for caches that are shared between processes and survive restarts
+CACHE_DIR = os.environ.get(
+    "WM2MANY_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".cache")
+)
+# Converted outputs streamed to disk, shared by every session
+EXPORT_DIR = os.path.join(CACHE_DIR, "exports")
+EXPORT_CACHE_FILES = 256  # Least recently used exports beyond this are deleted
+CACHE_VERSION = 3  # Bump when a converter's output changes, so cached results are not reused
+# Memory budget of the parsed maps and of the shared results, each
+CACHE_BYTES = int(float(os.environ.get("WM2MANY_CACHE_MB", "256")) * 1024 * 1024)
+# Text and bytes results evicted from memory are kept here unless WM2MANY_RESULT_DISK=0
+RESULT_DIR = os.path.join(CACHE_DIR, "results")
+RESULT_DISK = os.environ.get("WM2MANY_RESULT_DISK", "1") != "0"
+RESULT_DISK_FILES = 1024
+
+
+def map_hash(map_text):
+    """Return the content hash used to key a map in the caches."""
+    return hashlib.sha256(map_text.encode("utf-8")).hexdigest()
+
+
+def export_path(digest, fmt):
+    """Return the export cache file of a map's fmt output."""
+    from converters import EXTENSIONS
+
+    return os.path.join(EXPORT_DIR, f"{digest}-v{CACHE_VERSION}{EXTENSIONS[fmt]}")
+
+
+def read_json(path):
+    try:
+        with open(path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return None
+
+
+def write_json(path, data):
+    """Write data as JSON atomically so readers never see a partial file."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as file:
+        json.dump(data, file)
+    os.replace(tmp_path, path)
+
+
+def write_bytes(path, data):
+    """Write bytes to path atomically."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "wb") as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+
+
+def write_chunks(path, chunks):
+    """Write an iterable of text chunks to path atomically; return the characters written."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    written = 0
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as file:
+            for chunk in chunks:
+                file.write(chunk)
+                written += len(chunk)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+    return written
+
+
+def write_zip(path, files):
+    """Write a zip of an iterable of (archive name, file path) to path atomically.
+
+    Each file is copied into the zip in chunks, so none is held in memory.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file, zipfile.ZipFile(file, "w", zipfile.ZIP_DEFLATED) as bundle:
+            for name, source in files:
+                with open(source, "rb") as source_file, bundle.open(name, "w") as entry:
+                    shutil.copyfileobj(source_file, entry)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+
+def prune_dir(directory, keep):
+    """Delete all but the keep most recently modified files in directory."""
+    try:
+        entries = [entry for entry in os.scandir(directory) if entry.is_file()]
+    except OSError:
+        return
+    modified = []
+    for entry in entries:
+        try:
+            modified.append((entry.stat().st_mtime, entry.path))
+        except OSError:
+            pass  # Removed by another process pruning at the same time
+    modified.sort(reverse=True)
+    for _, path in modified[keep:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass  # Already removed by another process
+
+
+def count_lines(path):
+    """Count the lines of a text file without reading it into memory at once."""
+    lines, last = 0, b"\n"
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            lines += block.count(b"\n")
+            last = block[-1:]
+    return lines + (last != b"\n")
+
+
+def read_lines(path, start, count):
+    """Return count lines of a text file starting at line start (0-based)."""
+    with open(path, "r", encoding="utf-8") as file:
+        return "".join(islice(file, start, start + count))
+
+
+@contextmanager
+def connect_db(path):
+    """Open the SQLite file at path for one transaction, committed unless it raises.
+
+    Every call opens its own short-lived connection, so any thread can use
+    the database, and WAL mode keeps readers from being blocked by a writer.
+    """
+    import sqlite3
+
+    with closing(sqlite3.connect(path, timeout=30)) as db:
+        db.execute("PRAGMA journal_mode = WAL")
+        db.execute("PRAGMA foreign_keys = ON")
+        with db:
+            yield db
+
+
+def create_db(path, schema):
+    """Create the SQLite file at path and its directory, and apply schema to it."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with connect_db(path) as db:
+        db.executescript(schema)
+
+
+_MISSING = object()
+
+
+def sizeof(value):
+    """Estimate the bytes of memory held by value and everything it references.
+
+    Containers, instance attributes and slots are followed and each object
+    is counted once; objects reporting an integer nbytes, such as NumPy
+    arrays and pyarrow Tables, count that instead of being followed. Classes, modules and
+    functions are counted but not followed.
+    """
+    seen, total, stack = set(), 0, [value]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        nbytes = getattr(obj, "nbytes", None)
+        if isinstance(nbytes, int) and not isinstance(nbytes, bool):
+            total += nbytes + sys.getsizeof(obj, 0)
+            continue
+        total += sys.getsizeof(obj, 64)
+        if isinstance(obj, (str, bytes, bytearray, int, float, type, types.ModuleType, types.FunctionType)):
+            continue
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        else:
+            attributes = getattr(obj, "__dict__", None)
+            if attributes is not None:
+                stack.append(attributes)
+            for slot in getattr(type(obj), "__slots__", ()):
+                if hasattr(obj, slot):
+                    stack.append(getattr(obj, slot))
+    return total
+
+
+class LRUCache:
+    """A thread-safe least recently used cache bounded by entries and, optionally, bytes.
+
+    With maxbytes, each entry is weighed once with sizeof when it is added
+    and the least recently used entries are evicted until the total fits.
+    An entry larger than the whole budget is not kept.
+    """
+
+    def __init__(self, maxsize=None, maxbytes=None, weigh=sizeof):
+        self.maxsize = maxsize
+        self.maxbytes = maxbytes
+        self.weigh = weigh
+        self.nbytes = 0
+        self.hits = self.misses = self.evictions = 0
+        self._data = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def _evict(self):
+        while (self.maxsize is not None and len(self._data) > self.maxsize) or (
+            self.maxbytes is not None and self.nbytes > self.maxbytes
+        ):
+            key, _ = self._data.popitem(last=False)
+            self.nbytes -= self._sizes.pop(key, 0)
+            self.evictions += 1
+
+    def _insert(self, key, value, size):
+        if self.maxbytes is not None and size > self.maxbytes:
+            return value  # Would evict everything else; the caller keeps its own copy
+        if key in self._data:
+            self.nbytes -= self._sizes.pop(key, 0)
+        self._data[key] = value
+        self._sizes[key] = size
+        self.nbytes += size
+        self._data.move_to_end(key)
+        self._evict()
+        return value
+
+    def put(self, key, value):
+        # Weigh the value outside the lock; sizeof walks the whole object
+        size = self.weigh(value) if self.maxbytes is not None else 0
+        with self._lock:
+            self._insert(key, value, size)
+
+    def get_or_create(self, key, factory):
+        """Return the cached value for key, building it with factory on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            size = self.weigh(value) if self.maxbytes is not None else 0
+            with self._lock:
+                # Another session may have built the same entry meanwhile
+                if key in self._data:
+                    value = self._data[key]
+                    self._data.move_to_end(key)
+                else:
+                    self._insert(key, value, size)
+        return value
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._data),
+                "bytes": self.nbytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._sizes.clear()
+            self.nbytes = 0
+
+
+class ResultCache:
+    """Results shared by every session: a byte-bounded memory LRU over an optional disk tier.
+
+    Keys are tuples of strings and numbers, such as (map digest, result
+    name). Text and bytes results are also written to directory, so after
+    being evicted from memory, or in another process, they are read back
+    instead of being built again.
+    """
+
+    def __init__(self, maxbytes=CACHE_BYTES, directory=None, max_files=RESULT_DISK_FILES):
+        self.memory = LRUCache(maxbytes=maxbytes)
+        self.directory = directory
+        self.max_files = max_files
+        self.disk_hits = self.disk_writes = 0
+
+    def _path(self, key):
+        name = hashlib.sha256(repr((CACHE_VERSION,) + tuple(key)).encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, name)
+
+    def _load(self, key):
+        path = self._path(key)
+        for suffix, mode in ((".txt", "r"), (".bin", "rb")):
+            try:
+                with open(path + suffix, mode, **({"encoding": "utf-8"} if mode == "r" else {})) as file:
+                    value = file.read()
+            except OSError:
+                continue
+            os.utime(path + suffix)  # Mark it recently used for prune_dir
+            return value
+        return None
+
+    def _store(self, key, value):
+        path = self._path(key)
+        if isinstance(value, str):
+            write_chunks(path + ".txt", [value])
+        else:
+            write_bytes(path + ".bin", value)
+        self.disk_writes += 1
+        if self.disk_writes % 64 == 0:
+            prune_dir(self.directory, self.max_files)
+
+    def get(self, key, default=None):
+        value = self.memory.get(key, _MISSING)
+        if value is _MISSING and self.directory is not None:
+            loaded = self._load(key)
+            if loaded is not None:
+                self.disk_hits += 1
+                self.memory.put(key, loaded)
+                value = loaded
+        return default if value is _MISSING else value
+
+    def put(self, key, value):
+        self.memory.put(key, value)
+        if self.directory is not None and isinstance(value, (str, bytes)):
+            self._store(key, value)
+
+    def __contains__(self, key):
+        return key in self.memory
+
+    def stats(self):
+        stats = self.memory.stats()
+        if self.directory is not None:
+            stats["disk_hits"] = self.disk_hits
+            stats["disk_writes"] = self.disk_writes
+        return stats
+
+
+_caches = {}
+
+
+def register_cache(name, cache):
+    """Make a cache's counters part of cache_stats; return the cache registered under name.
+
+    The first cache registered under a name is kept and returned to later
+    callers, so every instance of a class shares one cache and one set of
+    counters; such callers key their entries by their own cache directory.
+    """
+    return _caches.setdefault(name, cache)
+
+
+def cache_stats():
+    """Return the counters of every registered cache by name."""
+    return {name: cache.stats() for name, cache in sorted(_caches.items())}
+
+
+class ParsedMap:
+    """A map parsed once, with its graph and converter outputs memoized in the shared results."""
+
+    def __init__(self, map_text, previous=None):
+        self.text = map_text
+        self.digest = map_hash(map_text)
+        self._incremental = None
+        if previous is not None:
+            from incremental import ContextError
+
+            try:
+                # Re-parse only the lines that differ from the previous revision
+                self._incremental = previous.incremental().updated(map_text)
+            except ContextError:
+                pass  # The previous revision can only be parsed in full
+        if self._incremental is not None:
+            self.data = self._incremental.data
+        else:
+            # wardley_map pulls in matplotlib, networkx and pyvis, so load it on first use
+            from wardley_map import parse_wardley_map
+
+            self.data = parse_wardley_map(map_text)
+        self._lock = threading.RLock()
+
+    @property
+    def title(self):
+        return self.data["title"][0] if self.data["title"] else "No Title"
+
+    def memoize(self, key, builder):
+        """Return the cached result of builder(self), building it on first use.
+
+        Results are shared by every ParsedMap of the same text, and may be
+        evicted and built again when the result cache is over its budget.
+        """
+        result_key = (self.digest, key)
+        value = _results.get(result_key, _MISSING)
+        if value is _MISSING:
+            with self._lock:
+                if result_key in _results:
+                    value = _results.get(result_key)  # Built by another thread while this one waited
+                else:
+                    value = builder(self)
+                    _results.put(result_key, value)
+        return value
+
+    def incremental(self):
+        """Return the per-line parse used to derive later revisions of this map."""
+        from incremental import IncrementalMap
+
+        with self._lock:
+            if self._incremental is None:
+                self._incremental = IncrementalMap.from_text(self.text)
+            return self._incremental
+
+    def graph(self):
+        """Return the component DiGraph shared by the graph views and converters.
+
+        Every node carries the dependency metrics of graph_metrics as attributes.
+        """
+        from graph_metrics import annotate
+        from map_graph import build_graph
+
+        return self.memoize("nx_graph", lambda pm: annotate(build_graph(pm.data)))
+
+    def graph_lod(self):
+        """Return the pipeline and stage clusters of the component graph."""
+        from graph_lod import LevelOfDetail
+
+        return self.memoize("graph_lod", lambda pm: LevelOfDetail(pm.graph(), pm.data["pipelines"]))
+
+    def graph_html(self, node_size=5, height="1200px"):
+        """Return the PyVis HTML for the component graph, cached per render options."""
+        import render
+
+        return self.memoize(
+            ("graph_html", node_size, height),
+            lambda pm: render.graph_html(pm.graph(), node_size=node_size, height=height),
+        )
+
+    def convert(self, fmt):
+        """Return the map converted to one of converters.CONVERTERS formats."""
+        import converters
+
+        from incremental import SECTIONED_FORMATS
+
+        converter = converters.CONVERTERS[fmt]
+        if self._incremental is not None and fmt in SECTIONED_FORMATS:
+            # Only the sections that changed since the previous revision are serialized
+            return self.memoize(fmt, lambda pm: pm.incremental().serialize(fmt, pm.extra_sections(fmt)))
+        if fmt in converters.GRAPH_CONVERTERS:
+            return self.memoize(fmt, lambda pm: converter(pm.data, graph=pm.graph()))
+        return self.memoize(fmt, lambda pm: converter(pm.data))
+
+    def extra_sections(self, fmt):
+        """Return the sections fmt adds after the parsed map's own, such as the JSON metrics."""
+        import converters
+
+        if fmt not in converters.GRAPH_CONVERTERS:
+            return {}
+        return converters.extra_sections(fmt, self.graph())
+
+    def iter_convert(self, fmt):
+        """Return an iterator over the chunks of the map converted to fmt."""
+        import converters
+
+        from incremental import SECTIONED_FORMATS
+
+        converter = converters.STREAMING_CONVERTERS[fmt]
+        if self._incremental is not None and fmt in SECTIONED_FORMATS:
+            return self.incremental().iter_serialize(fmt, self.extra_sections(fmt))
+        if fmt in converters.GRAPH_CONVERTERS:
+            return converter(self.data, graph=self.graph())
+        return converter(self.data)
+
+    def export(self, fmt):
+        """Return the path of a file holding the map converted to fmt.
+
+        The output is streamed to disk chunk by chunk and the file is keyed
+        by the map's content hash, so every session and process shares it
+        and no session keeps a copy of a large output in memory.
+        """
+        path = export_path(self.digest, fmt)
+        with self._lock:
+            try:
+                os.utime(path)  # Mark it recently used for prune_dir
+            except FileNotFoundError:
+                write_chunks(path, self.iter_convert(fmt))
+                prune_dir(EXPORT_DIR, EXPORT_CACHE_FILES)
+        return path
+
+    def line_count(self, fmt):
+        """Return the number of lines of the exported fmt output."""
+        return self.memoize(("line_count", fmt), lambda pm: count_lines(pm.export(fmt)))
+
+
+_parsed_maps = register_cache("parsed_maps", LRUCache(PARSED_MAP_CACHE_SIZE, CACHE_BYTES))
+_results = register_cache("results", ResultCache(CACHE_BYTES, RESULT_DIR if RESULT_DISK else None))
+
+
+def get_parsed_map(map_text, previous=None):
+    """Return the shared ParsedMap for map_text, parsing it only on a cache miss.
+
+    previous is an earlier revision of the same map; on a miss only the
+    lines that changed since then are parsed again.
+    """
+    if not isinstance(map_text, str):
+        map_text = ""  # get_owm_map returns [] when a fetch fails
+    return _parsed_maps.get_or_create(map_hash(map_text), lambda: ParsedMap(map_text, previous))
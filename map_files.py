@@ -0,0 +1,68 @@
+"""Map files in a local directory, such as a checkout of MAP-REPOSITORY.
+
+The batch converter, the bulk Cypher export, the columnar export, the
+merged graph and the search index all walk a directory of maps the same way,
+and the merged graph and the search index pick out changed maps and parse
+them the same way.
+"""
+
+import os
+import posixpath
+
+from map_cache import map_hash
+
+
+def is_map_file(path):
+    """Return True for repository files that hold a map."""
+    file_name = posixpath.basename(path)
+    # Skip files that start with a '.', have an extension, or are named 'LICENSE'
+    return (
+        not file_name.startswith(".")
+        and os.path.splitext(file_name)[1] == ""
+        and file_name.lower() != "license"
+    )
+
+
+def find_maps(input_dir):
+    """Yield the paths, relative to input_dir, of every map file below it."""
+    for root, dirs, files in os.walk(input_dir):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for file_name in sorted(files):
+            path = os.path.relpath(os.path.join(root, file_name), input_dir)
+            if is_map_file(path) or file_name.endswith(".wm"):
+                yield path
+
+
+def read_maps(input_dir):
+    """Yield (map_id, map_text) for every map below input_dir, one at a time."""
+    for rel_path in find_maps(input_dir):
+        with open(os.path.join(input_dir, rel_path), "r", encoding="utf-8", errors="replace") as file:
+            yield rel_path, file.read()
+
+
+def changed_maps(maps, known, seen):
+    """Yield (key, map_text, digest) for the maps of (key, map_text) whose digest is not known[key].
+
+    Every key is added to seen, including the keys of maps that could not
+    be fetched (whose text is not a string); those are skipped, so the
+    caller keeps their last stored revision.
+    """
+    for key, map_text in maps:
+        seen.add(key)
+        if not isinstance(map_text, str):
+            continue  # The map could not be fetched
+        digest = map_hash(map_text)
+        if known.get(key) != digest:
+            yield key, map_text, digest
+
+
+def parse_map(map_text):
+    """Parse map_text for a bulk job, without the shared cache of map_cache.
+
+    Bulk jobs read hundreds of maps once each; parsing them through
+    get_parsed_map would evict the maps interactive sessions are using and
+    keep results nobody asks for again.
+    """
+    from wardley_map import parse_wardley_map
+
+    return parse_wardley_map(map_text)
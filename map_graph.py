@@ -0,0 +1,109 @@
+"""Build the component graph of a parsed Wardley Map.
+
+The GRAPH, GML and CYPHER views and their converters all share this one
+builder. Component lookups go through a name index and pipeline bounding
+box checks through a y-sorted index, so a map with many pipelines no
+longer does pipelines x components work.
+"""
+
+import json
+from bisect import bisect_left, bisect_right
+
+import networkx as nx
+
+# Define a color mapping for evolution stages
+EVOLUTION_COLORS = {
+    "genesis": "#FF5733",
+    "custom": "#33FF57",
+    "product": "#3357FF",
+    "commodity": "#F333FF",
+}
+DEFAULT_COLOR = "#f68b24"
+PIPELINE_HEIGHT = 0.01  # Height of a pipeline's bounding box below its component
+
+
+def parse_pos(pos_str, default=(0, 0)):
+    """Decode a component "pos" string such as "[0.4, 0.7]" into (x, y).
+
+    default is returned for a missing or malformed position.
+    """
+    try:
+        x, y = json.loads(pos_str)
+    except (TypeError, ValueError):
+        x, y = default
+    return x, y
+
+
+def pipeline_span(pipeline):
+    """Return the (left, right) evolution span of a parsed pipeline."""
+    # Older wardley_map releases used "x"/"y" instead of "start_evo"/"end_evo"
+    start = pipeline.get("start_evo", pipeline.get("x", 0))
+    end = pipeline.get("end_evo", pipeline.get("y", 0))
+    return start, end
+
+
+class PositionIndex:
+    """Component positions sorted by y for bounding box queries."""
+
+    def __init__(self, positions):
+        entries = sorted((y, x, name) for name, (x, y) in positions.items())
+        self._ys = [entry[0] for entry in entries]
+        self._entries = entries
+
+    def within(self, left, right, bottom, top):
+        """Return the names of components inside the box, edges included."""
+        lo = bisect_left(self._ys, bottom)
+        hi = bisect_right(self._ys, top)
+        return {name for _, x, name in self._entries[lo:hi] if left <= x <= right}
+
+
+def build_graph(parsed_map):
+    """Build the component DiGraph with stage, visibility, position and color."""
+    G = nx.DiGraph()
+    positions = {}
+
+    # Add nodes with stage (evolution) and visibility, decoding each position once
+    for component in parsed_map["components"]:
+        x, y = parse_pos(component.get("pos", "[0, 0]"))
+        stage = component.get("evolution", "unknown")
+        positions[component["name"]] = (x, y)
+        G.add_node(
+            component["name"],
+            stage=stage,
+            visibility=component["visibility"],
+            pos=(x, y),
+            color=EVOLUTION_COLORS.get(stage, DEFAULT_COLOR),
+        )
+
+    # Add edges with a check for existence of nodes
+    for link in parsed_map["links"]:
+        src, tgt = link["src"], link["tgt"]
+        if src in G and tgt in G:
+            G.add_edge(src, tgt)
+
+    # The first component with a pipeline's name gives the pipeline its height
+    first_position = {}
+    for component in parsed_map["components"]:
+        first_position.setdefault(component["name"], component.get("pos", "[0, 0]"))
+    index = PositionIndex(positions)
+
+    for pipeline in parsed_map["pipelines"]:
+        pipeline_name = pipeline["name"]
+        pipeline_x, pipeline_right_side = pipeline_span(pipeline)
+        # A pipeline without a matching component sits at the bottom of the map
+        _, pipeline_y = parse_pos(first_position.get(pipeline_name, "[0, 0]"))
+
+        if pipeline_name not in G.nodes:
+            G.add_node(pipeline_name, type="pipeline", pos=(pipeline_x, pipeline_y))
+
+        # Link the pipeline to each of its members that sits inside its bounding box;
+        # these edges are marked, so they are not taken for dependencies
+        inside = index.within(
+            pipeline_x, pipeline_right_side, pipeline_y - PIPELINE_HEIGHT, pipeline_y
+        )
+        for component_name in pipeline["components"]:
+            if component_name != pipeline_name and component_name in inside:
+                if not G.has_edge(pipeline_name, component_name):
+                    G.add_edge(pipeline_name, component_name, type="pipeline")
+
+    return G
@@ -0,0 +1,342 @@
+"""Structural history of maps, read from a local git mirror of the map repository.
+
+Fetching every revision of a map through the GitHub API and parsing and
+graphing each one again does not scale to maps with hundreds of commits.
+Here the repository is kept as a bare mirror under .cache/git and updated
+with one fetch. The commits touching a map come from one git log, and the
+blobs of all its revisions are read through one git cat-file process.
+
+Each distinct blob is parsed once into a small snapshot of component
+stages and positions, links and pipeline members, cached in SQLite by blob
+ID. A blob that cannot be parsed is stored as an empty snapshot with its
+error; its revision records only the error, and the next revision is
+compared with the last one that could be parsed. Consecutive revisions are stored as compact deltas listing added,
+removed and moved components, stage shifts, link changes and pipeline
+membership changes. Updating a map only processes commits it has not seen.
+
+    python map_history.py research/teashop
+    python map_history.py research/teashop --component "Power"
+    python map_history.py research/teashop --diff <old commit> <new commit>
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+
+from map_cache import CACHE_DIR, connect_db, create_db
+from map_graph import parse_pos
+
+GITHUBREPO = "swardley/MAP-REPOSITORY"
+DB_PATH = os.path.join(CACHE_DIR, "history.sqlite")
+MIRROR_DIR = os.path.join(CACHE_DIR, "git")
+NO_BLOB = "0" * 40  # The blob ID git reports for a deleted file
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshots (
+    blob TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS revisions (
+    path TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    sha TEXT NOT NULL,
+    time INTEGER NOT NULL,
+    subject TEXT,
+    blob TEXT NOT NULL,
+    delta TEXT NOT NULL,
+    PRIMARY KEY (path, seq)
+);
+CREATE INDEX IF NOT EXISTS revisions_sha ON revisions (path, sha);
+"""
+
+
+def _dumps(data):
+    return json.dumps(data, separators=(",", ":"), sort_keys=True)
+
+
+def snapshot(map_text):
+    """Return the structure of a map that the history tracks, as JSON-ready data.
+
+    components maps each name to [stage, evolution, visibility], links is
+    a sorted list of [src, tgt] and pipelines maps each pipeline to its
+    sorted members.
+    """
+    from wardley_map import parse_wardley_map
+
+    parsed_map = parse_wardley_map(map_text)
+    components = {}
+    for component in parsed_map["components"]:
+        x, y = parse_pos(component.get("pos", "[0, 0]"))
+        components[component["name"]] = [component.get("evolution"), x, y]
+    links = sorted({(link["src"], link["tgt"]) for link in parsed_map["links"]})
+    pipelines = {p["name"]: sorted(set(p["components"])) for p in parsed_map["pipelines"]}
+    return {"components": components, "links": [list(link) for link in links], "pipelines": pipelines}
+
+
+EMPTY = {"components": {}, "links": [], "pipelines": {}}
+
+
+def diff(old, new):
+    """Return the delta from snapshot old to snapshot new; empty changes are left out."""
+    before, after = old["components"], new["components"]
+    delta = {
+        "added": {name: after[name] for name in after.keys() - before.keys()},
+        "removed": sorted(before.keys() - after.keys()),
+        "moved": {
+            name: after[name][1:]
+            for name in after.keys() & before.keys()
+            if after[name][1:] != before[name][1:]
+        },
+        "stage": {
+            name: [before[name][0], after[name][0]]
+            for name in after.keys() & before.keys()
+            if after[name][0] != before[name][0]
+        },
+    }
+    old_links, new_links = set(map(tuple, old["links"])), set(map(tuple, new["links"]))
+    delta["links_added"] = [list(link) for link in sorted(new_links - old_links)]
+    delta["links_removed"] = [list(link) for link in sorted(old_links - new_links)]
+
+    old_pipes, new_pipes = old["pipelines"], new["pipelines"]
+    delta["pipelines_added"] = sorted(new_pipes.keys() - old_pipes.keys())
+    delta["pipelines_removed"] = sorted(old_pipes.keys() - new_pipes.keys())
+    delta["joined"], delta["left"] = {}, {}
+    for name in old_pipes.keys() | new_pipes.keys():
+        members_before, members_after = set(old_pipes.get(name, ())), set(new_pipes.get(name, ()))
+        if members_after - members_before:
+            delta["joined"][name] = sorted(members_after - members_before)
+        if members_before - members_after:
+            delta["left"][name] = sorted(members_before - members_after)
+    return {key: value for key, value in delta.items() if value}
+
+
+class GitMirror:
+    """A bare mirror of a git repository, read with plain git commands."""
+
+    def __init__(self, url=f"https://github.com/{GITHUBREPO}.git", path=None):
+        self.url = url
+        self.path = path or os.path.join(MIRROR_DIR, url.rstrip("/").split("/")[-1])
+
+    def _git(self, *args):
+        return subprocess.run(
+            ["git", "--git-dir", self.path, *args],
+            check=True, capture_output=True, text=True, encoding="utf-8",
+        ).stdout
+
+    def update(self):
+        """Clone the mirror on first use, otherwise fetch new commits."""
+        if os.path.isdir(self.path):
+            self._git("fetch", "--prune", "--quiet", "origin")
+        else:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            subprocess.run(
+                ["git", "clone", "--mirror", "--quiet", self.url, self.path],
+                check=True, capture_output=True,
+            )
+
+    def log(self, path, ref="HEAD"):
+        """Return (sha, time, subject, blob) for each commit changing path, oldest first.
+
+        Renames are followed along the first-parent history, and blob is the
+        file's content after the commit.
+        """
+        output = self._git(
+            "log", "--first-parent", "--diff-merges=first-parent", "--follow", "--no-abbrev", "--raw",
+            "--format=%x1e%H%x1f%ct%x1f%s", ref, "--", path,
+        )
+        commits = []
+        for record in output.split("\x1e")[1:]:
+            header, _, raw = record.partition("\n")
+            sha, time, subject = header.split("\x1f", 2)
+            blobs = [line.split()[3] for line in raw.splitlines() if line.startswith(":")]
+            if blobs:  # :old_mode new_mode old_blob new_blob status
+                commits.append((sha, int(time), subject, blobs[-1]))
+        commits.reverse()
+        return commits
+
+    def read_blobs(self, blobs):
+        """Return {blob: text} for many blobs through a single git cat-file process."""
+        texts = {}
+        if not blobs:
+            return texts
+        with subprocess.Popen(
+            ["git", "--git-dir", self.path, "cat-file", "--batch"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+        ) as process:
+            # Requests are written from a thread so a full stdout pipe cannot block them
+            def write_requests():
+                process.stdin.write("".join(f"{blob}\n" for blob in blobs).encode("ascii"))
+                process.stdin.close()
+
+            writer = threading.Thread(target=write_requests, daemon=True)
+            writer.start()
+            for blob in blobs:
+                header = process.stdout.readline().split()
+                if len(header) < 3 or header[1] != b"blob":
+                    continue  # Missing or not a file
+                size = int(header[2])
+                texts[blob] = process.stdout.read(size).decode("utf-8", errors="replace")
+                process.stdout.read(1)  # The newline after each object
+            writer.join()
+        return texts
+
+
+class MapHistory:
+    """Revisions of maps as cached snapshots and compact deltas in SQLite."""
+
+    def __init__(self, mirror=None, path=DB_PATH):
+        self.mirror = mirror or GitMirror()
+        self.path = path
+        create_db(path, SCHEMA)
+
+    def _snapshots(self, db, blobs):
+        """Return {blob: snapshot}, parsing and storing the blobs not seen before."""
+        found = {}
+        for blob in set(blobs) - {NO_BLOB}:
+            row = db.execute("SELECT data FROM snapshots WHERE blob = ?", (blob,)).fetchone()
+            if row:
+                found[blob] = json.loads(row[0])
+        missing = [blob for blob in set(blobs) - {NO_BLOB} if blob not in found]
+        for blob, text in self.mirror.read_blobs(missing).items():
+            try:
+                found[blob] = snapshot(text)
+            except Exception as e:  # pylint: disable=broad-except
+                # Kept with its error, so the blob is not parsed again and the rest of the history is kept
+                found[blob] = dict(EMPTY, error=f"{type(e).__name__}: {e}")
+            db.execute("INSERT OR REPLACE INTO snapshots (blob, data) VALUES (?, ?)", (blob, _dumps(found[blob])))
+        found[NO_BLOB] = EMPTY
+        return found
+
+    def _last_readable(self, db, blobs):
+        """Return the snapshot of the last of blobs that could be parsed, or EMPTY."""
+        for blob in reversed(blobs):
+            found = self._snapshots(db, [blob]).get(blob, EMPTY)
+            if "error" not in found:
+                return found
+        return EMPTY
+
+    def update(self, path, ref="HEAD"):
+        """Record the revisions of path not seen yet; return how many were added.
+
+        If the stored history is no longer a prefix of the log, for example
+        after a force push, the history of path is rebuilt.
+        """
+        commits = self.mirror.log(path, ref)
+        with connect_db(self.path) as db:
+            known = [row[0] for row in db.execute(
+                "SELECT sha FROM revisions WHERE path = ? ORDER BY seq", (path,)
+            )]
+            if known != [sha for sha, _, _, _ in commits[:len(known)]]:
+                db.execute("DELETE FROM revisions WHERE path = ?", (path,))
+                known = []
+            new = commits[len(known):]
+            if not new:
+                return 0
+            previous = self._last_readable(db, [blob for _, _, _, blob in commits[:len(known)]])
+            snapshots = self._snapshots(db, [blob for _, _, _, blob in new])
+            rows = []
+            for seq, (sha, time, subject, blob) in enumerate(new, start=len(known)):
+                current = snapshots.get(blob, EMPTY)
+                if "error" in current:
+                    # Only the error is recorded; the next revision is compared with the last readable one
+                    delta = {"error": current["error"]}
+                else:
+                    delta = diff(previous, current)
+                    previous = current
+                rows.append((path, seq, sha, time, subject, blob, _dumps(delta)))
+            db.executemany(
+                "INSERT INTO revisions (path, seq, sha, time, subject, blob, delta) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        return len(new)
+
+    def revisions(self, path):
+        """Return the recorded revisions of path, oldest first, with their deltas."""
+        with connect_db(self.path) as db:
+            rows = db.execute(
+                "SELECT seq, sha, time, subject, delta FROM revisions WHERE path = ? ORDER BY seq", (path,)
+            ).fetchall()
+        keys = ["seq", "commit", "time", "subject"]
+        return [dict(zip(keys, row[:4]), delta=json.loads(row[4])) for row in rows]
+
+    def _blob(self, db, path, commit):
+        row = db.execute(
+            "SELECT blob FROM revisions WHERE path = ? AND sha LIKE ? ORDER BY seq DESC LIMIT 1",
+            (path, commit + "%"),
+        ).fetchone()
+        if row is None:
+            raise KeyError(f"{commit} is not a recorded revision of {path}")
+        return row[0]
+
+    def snapshot(self, path, commit):
+        """Return the snapshot of path as of a recorded commit (a full or abbreviated SHA)."""
+        with connect_db(self.path) as db:
+            blob = self._blob(db, path, commit)
+            return self._snapshots(db, [blob])[blob]
+
+    def diff(self, path, old_commit, new_commit):
+        """Return the delta between two recorded revisions of path."""
+        with connect_db(self.path) as db:
+            old_blob, new_blob = self._blob(db, path, old_commit), self._blob(db, path, new_commit)
+            snapshots = self._snapshots(db, [old_blob, new_blob])
+        return diff(snapshots[old_blob], snapshots[new_blob])
+
+    def component_history(self, path, name):
+        """Return the revisions of path that changed the component called name, and how."""
+        changes = []
+        for revision in self.revisions(path):
+            delta = revision["delta"]
+            change = {}
+            if name in delta.get("added", {}):
+                change["added"] = delta["added"][name]
+            if name in delta.get("removed", []):
+                change["removed"] = True
+            if name in delta.get("moved", {}):
+                change["moved"] = delta["moved"][name]
+            if name in delta.get("stage", {}):
+                change["stage"] = delta["stage"][name]
+            for key in ("links_added", "links_removed"):
+                links = [link for link in delta.get(key, []) if name in link]
+                if links:
+                    change[key] = links
+            for key in ("joined", "left"):
+                pipelines = [p for p, members in delta.get(key, {}).items() if name in members]
+                if pipelines:
+                    change[key] = pipelines
+            if change:
+                changes.append({k: revision[k] for k in ("seq", "commit", "time", "subject")} | change)
+        return changes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Track the structural history of a map in a git repository.")
+    parser.add_argument("path", help="Path of the map in the repository, e.g. research/teashop")
+    parser.add_argument("--url", default=f"https://github.com/{GITHUBREPO}.git", help="Repository to mirror")
+    parser.add_argument("--db", default=DB_PATH, help="SQLite file holding snapshots and deltas")
+    parser.add_argument("--no-fetch", action="store_true", help="Use the mirror as it is")
+    parser.add_argument("--component", metavar="NAME", help="Show only the changes to one component")
+    parser.add_argument("--diff", nargs=2, metavar=("OLD", "NEW"), help="Diff two revisions")
+    args = parser.parse_args(argv)
+
+    history = MapHistory(GitMirror(args.url), args.db)
+    if not args.no_fetch:
+        history.mirror.update()
+    added = history.update(args.path)
+    print(json.dumps({"new_revisions": added}), file=sys.stderr)
+    if args.diff:
+        print(json.dumps(history.diff(args.path, *args.diff)))
+    elif args.component:
+        for change in history.component_history(args.path, args.component):
+            print(json.dumps(change))
+    else:
+        for revision in history.revisions(args.path):
+            print(json.dumps(revision))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,107 @@
+"""Pre-rendered sidebar images of maps, cached in memory and on disk.
+
+Drawing a map with matplotlib is the slowest part of a rerun, yet the
+picture only depends on the map text. MapImages keeps the PNG or SVG bytes
+of every drawing, with the warnings raised while drawing it, keyed by the
+content hash of the map. Images are shared by every session and by every
+process using the same cache directory, and can be drawn ahead of time in
+a background thread.
+"""
+
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from map_cache import CACHE_DIR, LRUCache, map_hash, prune_dir, read_json, register_cache, write_bytes, write_json
+
+RENDER_VERSION = 1  # Bump when the drawing changes so stale images are not served
+IMAGE_CACHE_SIZE = 128  # Images kept in memory
+IMAGE_DISK_FILES = 3000  # Files kept on disk; every image has a warnings file too
+DPI = 100
+MIME_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+
+class MapImages:
+    """Render maps to image bytes once and serve them from memory or disk after that."""
+
+    def __init__(self, cache_dir=CACHE_DIR, memory_size=IMAGE_CACHE_SIZE):
+        self.cache_dir = os.path.join(cache_dir, "images")
+        self._images = register_cache("map_images", LRUCache(memory_size))
+        # pyplot keeps global state, so only one map is drawn at a time
+        self._render_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="map-images")
+
+    def _paths(self, digest, fmt):
+        base = os.path.join(self.cache_dir, f"{digest}-v{RENDER_VERSION}")
+        return f"{base}.{fmt}", f"{base}.json"
+
+    def _load(self, digest, fmt):
+        image_path, warnings_path = self._paths(digest, fmt)
+        warnings = read_json(warnings_path)
+        if warnings is None:
+            return None
+        try:
+            with open(image_path, "rb") as file:
+                return file.read(), warnings
+        except OSError:
+            return None
+
+    def _render(self, map_text, digest, fmt):
+        import matplotlib.pyplot as plt
+        from wardley_map import create_wardley_map_plot
+
+        with self._render_lock:
+            # Another thread may have drawn this map while we waited
+            cached = self._load(digest, fmt)
+            if cached is not None:
+                return cached
+            wardley_map, figure = create_wardley_map_plot(map_text)
+            try:
+                buffer = io.BytesIO()
+                figure.savefig(buffer, format=fmt, dpi=DPI, bbox_inches="tight")
+            finally:
+                plt.close(figure)
+        image, warnings = buffer.getvalue(), list(wardley_map.warnings)
+
+        image_path, warnings_path = self._paths(digest, fmt)
+        write_bytes(image_path, image)
+        write_json(warnings_path, warnings)
+        prune_dir(self.cache_dir, IMAGE_DISK_FILES)
+        return image, warnings
+
+    def get(self, map_text, fmt="png"):
+        """Return (image bytes, drawing warnings) for map_text, drawing it only on a miss."""
+        digest = map_hash(map_text)
+        key = self._paths(digest, fmt)[0]  # Shared by all instances, so keyed by the file of this one
+        cached = self._images.get(key)
+        if cached is None:
+            cached = self._load(digest, fmt) or self._render(map_text, digest, fmt)
+            self._images.put(key, cached)
+        return cached
+
+    def _prewarm_one(self, load, fmt):
+        try:
+            map_text = load()
+            if isinstance(map_text, str):
+                digest = map_hash(map_text)
+                if self._paths(digest, fmt)[0] not in self._images and self._load(digest, fmt) is None:
+                    self._render(map_text, digest, fmt)
+        except Exception as e:  # pylint: disable=broad-except
+            # One map that fails to draw must not stop the others; name it by the loader's arguments
+            print(f"Error pre-rendering map {getattr(load, 'args', (load,))[0]}: {e}")
+
+    def _prewarm(self, loaders, fmt):
+        try:
+            for load in loaders:
+                self._prewarm_one(load, fmt)
+        except Exception as e:  # pylint: disable=broad-except
+            print(f"Error listing maps to pre-render: {e}")
+
+    def prewarm(self, loaders, fmt="png"):
+        """Draw maps in the background; loaders is an iterable of callables returning map text.
+
+        The iterable itself is consumed in the background too, so it may be a
+        generator that lists the maps lazily.
+        """
+        return self._executor.submit(self._prewarm, loaders, fmt)
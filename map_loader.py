@@ -0,0 +1,330 @@
+"""Load many maps at once from OWM IDs and repository paths.
+
+OWMClient.get and RepoSnapshot.read load one map per call, so converting a
+selection of maps one after another takes the sum of every fetch. Here the
+requests of a whole selection run on an asyncio event loop instead, each
+one in a pooled requests session on a worker thread, with at most
+`concurrency` in flight. A failed request is retried with exponential
+backoff and jitter. Every host's X-RateLimit-Remaining / X-RateLimit-Reset
+and Retry-After headers are honoured, so requests pause while GitHub's quota
+is spent instead of failing. Maps are handed on, and optionally parsed, as
+soon as each one arrives, so loading a selection of up to `concurrency`
+maps takes about as long as its slowest fetch.
+
+Sources are "owm:<map id>" or "github:<path in the repository>"; a source
+without a prefix is an OWM map ID. A map already in the OWM client's cache or
+in the repository snapshot is served without a request.
+
+    python map_loader.py owm:<map id> github:research/teashop --formats json gml --zip maps.zip
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+from functools import partial
+from urllib.parse import quote, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from converters import EXTENSIONS
+from map_cache import CACHE_DIR, CACHE_VERSION, get_parsed_map, prune_dir, write_chunks, write_zip
+from owm_client import OWM_API
+
+GITHUB_API = "https://api.github.com"
+GITHUB_REPO = "swardley/MAP-REPOSITORY"
+CONCURRENCY = 32  # Requests in flight at once
+RETRIES = 3
+BACKOFF_SECONDS = 0.5  # First retry delay, doubled on every further retry
+MAX_WAIT_SECONDS = 60  # A map needing a longer rate limit pause than this fails instead
+RATE_LIMIT_RESERVE = 5  # Requests of the quota left for the app's own index refreshes
+TIMEOUT = 15
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BATCH_DIR = os.path.join(CACHE_DIR, "batches")  # Zips of exported selections
+BATCH_CACHE_FILES = 16
+
+
+def parse_source(source):
+    """Split "owm:<id>" or "github:<path>" into (kind, key); a bare source is an OWM ID."""
+    kind, _, key = source.partition(":")
+    if kind in ("owm", "github") and key:
+        return kind, key
+    return "owm", source
+
+
+def _seconds(retry_after):
+    # Retry-After is either a number of seconds or an HTTP date
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return 0.0
+
+
+class RateLimit:
+    """The request quota of one host, as reported by its response headers."""
+
+    def __init__(self, reserve=RATE_LIMIT_RESERVE):
+        self.reserve = reserve
+        self.remaining = None
+        self.resume_at = 0.0
+
+    def delay(self):
+        """Return how long to wait before the next request, claiming one from the quota."""
+        wait = max(0.0, self.resume_at - time.time())
+        if self.remaining is not None and not wait:
+            # Count requests already in flight, before their responses update the quota
+            self.remaining -= 1
+        return wait
+
+    def update(self, response):
+        headers = response.headers
+        if headers.get("X-RateLimit-Remaining") is not None:
+            self.remaining = int(headers["X-RateLimit-Remaining"])
+            if self.remaining <= self.reserve and headers.get("X-RateLimit-Reset"):
+                self.resume_at = max(self.resume_at, float(headers["X-RateLimit-Reset"]))
+        if headers.get("Retry-After") and response.status_code in (403, 429, 503):
+            self.resume_at = max(self.resume_at, time.time() + _seconds(headers["Retry-After"]))
+
+    def exhausted(self, response):
+        """Return True if response refused a request because the quota was spent."""
+        if response.status_code == 429:
+            return True
+        # GitHub answers 403 for both its primary and its secondary rate limits
+        return response.status_code == 403 and (
+            response.headers.get("X-RateLimit-Remaining") == "0" or "Retry-After" in response.headers
+        )
+
+
+class MapLoader:
+    """Fetch many maps concurrently through one connection pool."""
+
+    def __init__(
+        self,
+        owm_url=OWM_API,
+        repo=GITHUB_REPO,
+        github_api=GITHUB_API,
+        token=None,
+        owm_client=None,
+        snapshot=None,
+        concurrency=CONCURRENCY,
+        retries=RETRIES,
+        backoff=BACKOFF_SECONDS,
+        max_wait=MAX_WAIT_SECONDS,
+        timeout=TIMEOUT,
+        session=None,
+    ):
+        self.owm_url = owm_url
+        self.repo = repo
+        self.github_api = github_api.rstrip("/")
+        self.token = token
+        self.owm_client = owm_client
+        self.snapshot = snapshot
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.max_wait = max_wait
+        self.timeout = timeout
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=concurrency)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._limits = {}
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="map-loader")
+
+    async def _get(self, url, headers, semaphore):
+        """GET url with retries, waiting out the host's rate limit; return the response."""
+        limit = self._limits.setdefault(urlsplit(url).netloc, RateLimit())
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            wait = limit.delay()
+            if wait > self.max_wait:
+                raise requests.HTTPError(f"Rate limited by {urlsplit(url).netloc} for {wait:.0f}s")
+            await asyncio.sleep(wait)
+            async with semaphore:
+                try:
+                    response = await loop.run_in_executor(
+                        self._executor, partial(self.session.get, url, headers=headers, timeout=self.timeout)
+                    )
+                except requests.RequestException as e:
+                    response, error = None, e
+            if response is not None:
+                limit.update(response)
+                if response.ok:
+                    return response
+                error = requests.HTTPError(f"{response.status_code} {response.reason} for {url}")
+                if response.status_code not in RETRY_STATUSES and not limit.exhausted(response):
+                    raise error
+            if attempt == self.retries:
+                raise error
+            await asyncio.sleep(self.backoff * 2 ** attempt * (1 + random.random()))
+            attempt += 1
+
+    async def _fetch_owm(self, map_id, semaphore):
+        if self.owm_client is not None:
+            map_text = self.owm_client.cached(map_id)
+            if map_text is not None:
+                return map_text
+        response = await self._get(self.owm_url + quote(map_id, safe=""), {}, semaphore)
+        map_text = response.json()["text"]
+        if self.owm_client is not None:
+            self.owm_client.store(map_id, map_text, response.headers)
+        return map_text
+
+    async def _fetch_github(self, path, semaphore):
+        if self.snapshot is not None and path in self.snapshot.files:
+            return self.snapshot.files[path]
+        headers = {"Accept": "application/vnd.github.raw"}  # The file itself, not JSON
+        if self.token:
+            headers["Authorization"] = f"token {self.token}"
+        url = f"{self.github_api}/repos/{self.repo}/contents/{quote(path)}"
+        response = await self._get(url, headers, semaphore)
+        response.encoding = "utf-8"
+        return response.text
+
+    async def _load(self, index, source, semaphore, parse):
+        kind, key = parse_source(source)
+        record = {"source": source}
+        started = time.perf_counter()
+        try:
+            fetch = self._fetch_github if kind == "github" else self._fetch_owm
+            record["text"] = await fetch(key, semaphore)
+            if parse:
+                # Parse on the default executor, so fetch threads stay free for requests
+                record["parsed"] = await asyncio.get_running_loop().run_in_executor(
+                    None, get_parsed_map, record["text"]
+                )
+        except Exception as e:  # pylint: disable=broad-except
+            # A map that cannot be fetched or parsed fails alone, not the whole selection
+            record["error"] = f"{type(e).__name__}: {e}"
+        record["seconds"] = round(time.perf_counter() - started, 4)
+        return index, record
+
+    async def iter_loaded(self, sources, parse=False):
+        """Yield (index in sources, record) for every source as soon as it is loaded.
+
+        A record has the "source" and either its "text" (and its ParsedMap as
+        "parsed" when parse is set) or an "error".
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = [asyncio.ensure_future(self._load(i, s, semaphore, parse)) for i, s in enumerate(sources)]
+        try:
+            for task in asyncio.as_completed(tasks):
+                yield await task
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def load(self, sources, parse=False, on_result=None):
+        """Load every source; return the records in the order of sources.
+
+        on_result(index, record) is called as each record arrives, on the
+        thread that called load.
+        """
+
+        async def run():
+            records = [None] * len(sources)
+            async for index, record in self.iter_loaded(sources, parse):
+                records[index] = record
+                if on_result is not None:
+                    on_result(index, record)
+            return records
+
+        return asyncio.run(run())
+
+    def export_zip(self, sources, formats, zip_path):
+        """Load, convert and zip many maps; return one record per source.
+
+        Each map is converted on a worker thread as soon as it arrives, while
+        the others are still being fetched. Outputs are streamed to a private
+        temporary directory rather than the shared export cache, whose pruning
+        could delete them before a large selection is zipped. The zip holds
+        one file per map and format and is replaced atomically. A map that
+        cannot be fetched, parsed or converted is left out, with an "error"
+        in its record.
+        """
+        converting = []
+        with tempfile.TemporaryDirectory() as work_dir:
+            pool = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="map-export")
+
+            def convert(index, record):
+                if "parsed" in record:
+                    paths = {fmt: os.path.join(work_dir, f"{index}{EXTENSIONS[fmt]}") for fmt in formats}
+                    futures = {
+                        fmt: pool.submit(_write_output, record["parsed"], fmt, path) for fmt, path in paths.items()
+                    }
+                    converting.append((index, futures))
+
+            with pool:
+                records = self.load(sources, parse=True, on_result=convert)
+                exports = {}
+                for index, futures in converting:
+                    try:
+                        exports[index] = {fmt: future.result() for fmt, future in futures.items()}
+                    except Exception as e:  # pylint: disable=broad-except
+                        records[index]["error"] = f"{type(e).__name__}: {e}"
+
+            files, names = [], set()
+            for index, record in enumerate(records):
+                record.pop("text", None)
+                record.pop("parsed", None)
+                if index not in exports:
+                    continue
+                name = parse_source(record["source"])[1].replace("/", "_")
+                while name in names:
+                    name = "_" + name  # Sources may share a file name
+                names.add(name)
+                record["files"] = [name + EXTENSIONS[fmt] for fmt in exports[index]]
+                files.extend(zip(record["files"], exports[index].values()))
+            write_zip(zip_path, files)
+        return records
+
+
+def _write_output(parsed_map, fmt, path):
+    write_chunks(path, parsed_map.iter_convert(fmt))
+    return path
+
+
+def export_batch(loader, sources, formats):
+    """Export sources in formats to a zip in the batch cache; return the zip path and records.
+
+    Batch zips are kept apart from the per-map export cache, so converting
+    single maps does not prune them. A caller that finds the zip gone
+    should export the batch again.
+    """
+    batch = "\n".join([f"v{CACHE_VERSION}", ",".join(formats)] + list(sources))
+    path = os.path.join(BATCH_DIR, hashlib.sha256(batch.encode("utf-8")).hexdigest() + ".zip")
+    records = loader.export_zip(sources, formats, path)
+    prune_dir(BATCH_DIR, BATCH_CACHE_FILES)
+    return path, records
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch and convert many maps concurrently.")
+    parser.add_argument("sources", nargs="+", help='Maps as "owm:<id>" or "github:<path>"')
+    parser.add_argument("--formats", nargs="+", choices=sorted(EXTENSIONS), default=["json"])
+    parser.add_argument("--zip", required=True, help="Zip archive the converted maps are written to")
+    parser.add_argument("--repo", default=GITHUB_REPO, help="GitHub repository of github: sources")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="Requests in flight at once")
+    args = parser.parse_args(argv)
+
+    loader = MapLoader(repo=args.repo, token=os.environ.get("GITHUB_TOKEN"), concurrency=args.concurrency)
+    records = loader.export_zip(args.sources, args.formats, args.zip)
+    for record in records:
+        print(json.dumps(record))
+    return 1 if any("error" in record for record in records) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""Cached client for maps hosted on onlinewardleymaps.com.
+
+Fetched maps are kept in memory and on disk, so they are shared between
+sessions and survive restarts. A cached map is served as-is for TTL_SECONDS
+and is then revalidated with its ETag / Last-Modified validators. Within the
+stale window the cached copy is returned immediately while a background
+refresh runs. Concurrent requests for the same map share a single fetch.
+A map that failed to fetch is not asked for again for FAILURE_BACKOFF_SECONDS;
+its cached copy, or nothing, is served meanwhile, so an API outage does not
+block every rerun on a request.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from map_cache import CACHE_DIR, LRUCache, read_json, register_cache, write_json
+
+OWM_API = "https://api.onlinewardleymaps.com/v1/maps/fetch?id="
+TTL_SECONDS = 600  # Serve a cached map without asking the API for this long
+MAX_STALE_SECONDS = 7 * 24 * 3600  # Serve stale maps while revalidating for this long
+FAILURE_BACKOFF_SECONDS = 60  # Do not ask the API again for a map that just failed
+POOL_SIZE = 8
+TIMEOUT = 15
+
+
+class OWMClient:
+    """Fetch map text by ID through a pooled session and a revalidating cache."""
+
+    def __init__(
+        self,
+        api_url=OWM_API,
+        cache_dir=CACHE_DIR,
+        ttl=TTL_SECONDS,
+        max_stale=MAX_STALE_SECONDS,
+        stale_while_revalidate=True,
+        session=None,
+        failure_backoff=FAILURE_BACKOFF_SECONDS,
+    ):
+        self.api_url = api_url
+        self.cache_dir = os.path.join(cache_dir, "owm")
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.stale_while_revalidate = stale_while_revalidate
+        self.failure_backoff = failure_backoff
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._entries = register_cache("owm_maps", LRUCache(1024))
+        self._failures = LRUCache(1024)  # map_id -> when its last fetch failed
+        self._inflight = {}
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="owm")
+
+    def _entry_path(self, map_id):
+        return os.path.join(self.cache_dir, hashlib.sha256(map_id.encode("utf-8")).hexdigest() + ".json")
+
+    def _load_entry(self, map_id):
+        path = self._entry_path(map_id)
+        entry = self._entries.get(path)
+        if entry is None:
+            entry = read_json(path)
+            if entry is not None:
+                self._entries.put(path, entry)
+        return entry
+
+    def _store_entry(self, map_id, entry):
+        path = self._entry_path(map_id)
+        self._entries.put(path, entry)  # Shared by all clients, so keyed by the file of this one
+        write_json(path, entry)
+
+    def cached(self, map_id):
+        """Return the text of map_id if it was fetched within the TTL, else None."""
+        entry = self._load_entry(str(map_id))
+        if entry and time.time() - entry["fetched_at"] < self.ttl:
+            return entry["text"]
+        return None
+
+    def store(self, map_id, map_text, headers):
+        """Cache map text fetched elsewhere, with the validators of its response headers."""
+        self._store_entry(
+            str(map_id),
+            {
+                "text": map_text,
+                "etag": headers.get("ETag"),
+                "last_modified": headers.get("Last-Modified"),
+                "fetched_at": time.time(),
+            },
+        )
+
+    def _fetch(self, map_id, entry):
+        """Fetch or revalidate one map and return its text, or None on failure."""
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        try:
+            response = self.session.get(
+                self.api_url + quote(map_id, safe=""), headers=headers, timeout=TIMEOUT
+            )
+            if response.status_code == 304 and entry:
+                entry = dict(entry, fetched_at=time.time())
+                self._store_entry(map_id, entry)
+                return entry["text"]
+            response.raise_for_status()
+            map_text = response.json()["text"]
+        except (requests.RequestException, ValueError, KeyError) as e:
+            print(f"Error: Could not fetch map {map_id}: {e}")
+            self._failures.put(map_id, time.time())
+            return entry["text"] if entry else None
+
+        self.store(map_id, map_text, response.headers)
+        return map_text
+
+    def _fetch_shared(self, map_id, entry):
+        """Start a fetch of map_id, or join the one already in flight."""
+        with self._lock:
+            future = self._inflight.get(map_id)
+            if future is None:
+                future = self._executor.submit(self._fetch, map_id, entry)
+                self._inflight[map_id] = future
+                future.add_done_callback(lambda _: self._forget(map_id))
+            return future
+
+    def _forget(self, map_id):
+        with self._lock:
+            self._inflight.pop(map_id, None)
+
+    def _backing_off(self, map_id):
+        """Return whether the last fetch of map_id failed within the backoff."""
+        failed_at = self._failures.get(map_id)
+        return failed_at is not None and time.time() - failed_at < self.failure_backoff
+
+    def get(self, map_id):
+        """Return the text of map_id, or [] if it cannot be fetched (like get_owm_map)."""
+        if not map_id:
+            return []
+        map_id = str(map_id)
+        entry = self._load_entry(map_id)
+        if entry:
+            age = time.time() - entry["fetched_at"]
+            if age < self.ttl or self._backing_off(map_id):
+                return entry["text"]
+            if self.stale_while_revalidate and age < self.ttl + self.max_stale:
+                self._fetch_shared(map_id, entry)
+                return entry["text"]
+        elif self._backing_off(map_id):
+            return []
+        map_text = self._fetch_shared(map_id, entry).result()
+        return map_text if map_text is not None else []
+
+    def prefetch(self, map_ids):
+        """Warm the cache for map_ids in the background."""
+        for map_id in map_ids:
+            map_id = str(map_id)
+            entry = self._load_entry(map_id)
+            if self._backing_off(map_id):
+                continue
+            if not entry or time.time() - entry["fetched_at"] >= self.ttl:
+                self._fetch_shared(map_id, entry)
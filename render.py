@@ -0,0 +1,38 @@
+"""Render the component graph for display, entirely in memory.
+
+PyVis normally saves its HTML to a file before it can be read back. Going
+through fixed paths in the working directory costs disk I/O on every rerun
+and lets concurrent sessions overwrite each other's output, so the HTML is
+generated straight into a string instead.
+"""
+
+from pyvis.network import Network
+
+from map_graph import DEFAULT_COLOR
+
+NODE_SIZE = 5  # Adjust this value as needed to make the nodes smaller or larger
+HEIGHT = "1200px"
+
+
+def graph_html(G, node_size=NODE_SIZE, height=HEIGHT):
+    """Return the PyVis HTML document for the component graph G."""
+    net = Network(height=height, width="100%", font_color="black")
+    net.toggle_physics(False)
+
+    # Add nodes to the PyVis network with colors based on their stage
+    for node, node_attrs in G.nodes(data=True):
+        x, y = node_attrs.get("pos", (0, 0))
+        net.add_node(
+            node,
+            label=node,
+            x=x * 1700,
+            y=-y * 1000,
+            color=node_attrs.get("color", DEFAULT_COLOR),
+            size=node_size,
+        )
+
+    # Add edges to the PyVis network
+    for src, tgt in G.edges():
+        net.add_edge(src, tgt)
+
+    return net.generate_html()
@@ -0,0 +1,206 @@
+"""Full-text and attribute search over many maps.
+
+Titles, component and anchor names, pipelines, notes and annotations of
+every map go into an SQLite FTS5 inverted index; each component's
+evolution stage and position go into an indexed table beside it, so maps
+can also be filtered by where a component sits. The index is stored on
+disk and updated incrementally: when the commit SHA of a source is
+unchanged nothing is read at all, and otherwise only maps whose text
+changed are indexed again.
+
+    python search_index.py MAP-REPOSITORY
+    python search_index.py --query "power" --stage commodity
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+
+from map_cache import CACHE_DIR, connect_db, create_db
+from map_files import changed_maps, parse_map, read_maps
+from map_graph import parse_pos
+
+DB_PATH = os.path.join(CACHE_DIR, "search.sqlite")
+FIELDS = ["title", "components", "pipelines", "notes", "annotations"]
+SEARCH_LIMIT = 50  # Maps returned per search
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS maps (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    key TEXT NOT NULL,
+    title TEXT,
+    hash TEXT NOT NULL,
+    UNIQUE (source, key)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS map_text USING fts5(
+    {", ".join(FIELDS)}, tokenize = 'unicode61', prefix = '2 3'
+);
+CREATE TABLE IF NOT EXISTS placements (
+    map_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    stage TEXT,
+    evolution REAL,
+    visibility REAL
+);
+CREATE INDEX IF NOT EXISTS placements_map ON placements (map_id);
+CREATE INDEX IF NOT EXISTS placements_stage ON placements (stage, evolution);
+CREATE INDEX IF NOT EXISTS placements_name ON placements (name);
+CREATE TABLE IF NOT EXISTS commits (
+    source TEXT PRIMARY KEY,
+    sha TEXT NOT NULL
+);
+"""
+
+
+def document(parsed_map):
+    """Return the text of each indexed field of a parsed map."""
+    def names(section):
+        return "\n".join(entry["name"] for entry in parsed_map[section])
+
+    return {
+        "title": "\n".join(parsed_map["title"]),
+        "components": "\n".join(parsed_map["anchors"]) + "\n" + names("components"),
+        "pipelines": names("pipelines"),
+        "notes": names("notes"),
+        "annotations": names("annotations"),
+    }
+
+
+def match_expression(query):
+    """Turn free text into an FTS5 query matching every word as a prefix."""
+    words = re.findall(r"\w+", query)
+    return " ".join(f'"{word}"*' for word in words)
+
+
+class SearchIndex:
+    """An on-disk inverted index of map text with component placements."""
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        create_db(path, SCHEMA)
+
+    @staticmethod
+    def _delete(db, map_ids):
+        for table, column in (("map_text", "rowid"), ("placements", "map_id"), ("maps", "id")):
+            db.executemany(f"DELETE FROM {table} WHERE {column} = ?", [(i,) for i in map_ids])
+
+    def _index(self, db, source, key, map_text, digest):
+        parsed_map = parse_map(map_text)
+        old = db.execute("SELECT id FROM maps WHERE source = ? AND key = ?", (source, key)).fetchall()
+        self._delete(db, [row[0] for row in old])
+        title = parsed_map["title"][0] if parsed_map["title"] else ""
+        map_id = db.execute(
+            "INSERT INTO maps (source, key, title, hash) VALUES (?, ?, ?, ?)",
+            (source, key, title, digest),
+        ).lastrowid
+        fields = document(parsed_map)
+        db.execute(
+            f"INSERT INTO map_text (rowid, {', '.join(FIELDS)}) VALUES (?{', ?' * len(FIELDS)})",
+            [map_id] + [fields[field] for field in FIELDS],
+        )
+        placements = []
+        for component in parsed_map["components"]:
+            evolution, visibility = parse_pos(component.get("pos", "[0, 0]"))
+            placements.append((map_id, component["name"], component.get("evolution"), evolution, visibility))
+        db.executemany(
+            "INSERT INTO placements (map_id, name, stage, evolution, visibility) VALUES (?, ?, ?, ?, ?)",
+            placements,
+        )
+
+    def update(self, source, maps, sha=None, remove_missing=True):
+        """Index the maps from source, an iterable of (key, map_text); return how many changed.
+
+        When sha is given and matches the commit last indexed for source,
+        maps is not even iterated. Otherwise unchanged maps are skipped and,
+        with remove_missing, maps no longer in source are dropped. A map that
+        could not be fetched or fails to index keeps its last indexed revision.
+        """
+        with connect_db(self.path) as db:
+            if sha is not None:
+                row = db.execute("SELECT sha FROM commits WHERE source = ?", (source,)).fetchone()
+                if row and row[0] == sha:
+                    return 0
+            known = {key: (map_id, digest) for map_id, key, digest in db.execute(
+                "SELECT id, key, hash FROM maps WHERE source = ?", (source,)
+            )}
+        seen, indexed = set(), 0
+        hashes = {key: digest for key, (_, digest) in known.items()}
+        for key, map_text, digest in changed_maps(maps, hashes, seen):
+            try:
+                with connect_db(self.path) as db:
+                    self._index(db, source, key, map_text, digest)
+            except Exception as e:  # pylint: disable=broad-except
+                print(f"Error indexing map {source}:{key}: {e}")
+                continue
+            indexed += 1
+        with connect_db(self.path) as db:
+            if remove_missing:
+                self._delete(db, [known[key][0] for key in set(known) - seen])
+            if sha is not None:
+                db.execute("INSERT OR REPLACE INTO commits (source, sha) VALUES (?, ?)", (source, sha))
+        return indexed
+
+    def search(self, query="", stage=None, evolution=None, source=None, limit=SEARCH_LIMIT):
+        """Return the best matching maps as dicts of source, key, title and snippet.
+
+        query is free text matched as word prefixes in any field. stage and
+        evolution, a (low, high) range, keep only maps with a component
+        placed there.
+        """
+        expression = match_expression(query)
+        filters, params = [], []
+        if source is not None:
+            filters.append("m.source = ?")
+            params.append(source)
+        if stage is not None or evolution is not None:
+            placement = ["p.map_id = m.id"]
+            if stage is not None:
+                placement.append("p.stage = ?")
+                params.append(stage)
+            if evolution is not None:
+                placement.append("p.evolution BETWEEN ? AND ?")
+                params.extend(evolution)
+            filters.append(f"EXISTS (SELECT 1 FROM placements p WHERE {' AND '.join(placement)})")
+
+        with connect_db(self.path) as db:
+            if expression:
+                sql = (
+                    "SELECT m.source, m.key, m.title, snippet(map_text, -1, '[', ']', '...', 8) "
+                    "FROM map_text JOIN maps m ON m.id = map_text.rowid WHERE map_text MATCH ? "
+                )
+                params.insert(0, expression)
+                order = " ORDER BY bm25(map_text)"
+            else:
+                sql = "SELECT m.source, m.key, m.title, '' FROM maps m WHERE 1 "
+                order = " ORDER BY m.source, m.key"
+            sql += "".join(" AND " + f for f in filters) + order + " LIMIT ?"
+            rows = db.execute(sql, params + [limit]).fetchall()
+        return [dict(zip(["source", "key", "title", "snippet"], row)) for row in rows]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and query the search index of many maps.")
+    parser.add_argument("input_dir", nargs="?", help="Directory of maps to index, e.g. MAP-REPOSITORY")
+    parser.add_argument("--db", default=DB_PATH, help="SQLite file holding the index")
+    parser.add_argument("--query", default="", help="Words to find in titles, components and notes")
+    parser.add_argument("--stage", help="Only maps with a component at this evolution stage")
+    parser.add_argument("--evolution", type=float, nargs=2, metavar=("LOW", "HIGH"),
+                        help="Only maps with a component whose evolution is in this range")
+    parser.add_argument("--limit", type=int, default=SEARCH_LIMIT)
+    args = parser.parse_args(argv)
+
+    index = SearchIndex(args.db)
+    if args.input_dir:
+        indexed = index.update("dir", read_maps(args.input_dir))
+        print(json.dumps({"indexed": indexed}), file=sys.stderr)
+    if args.query or args.stage or args.evolution:
+        for row in index.search(args.query, args.stage, args.evolution, limit=args.limit):
+            print(json.dumps(row))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
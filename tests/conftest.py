@@ -0,0 +1,10 @@
+"""Run the tests against the modules at the repository root, with a throwaway cache."""
+
+import os
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Set before map_cache is imported, so no test reads or writes the app's own cache
+os.environ.setdefault("WM2MANY_CACHE_DIR", tempfile.mkdtemp(prefix="wm2many-tests-"))
@@ -0,0 +1,61 @@
+"""Stand-ins for requests sessions and responses, so clients are tested without a network."""
+
+import io
+import json
+
+import requests
+
+
+class StubResponse:
+    """The parts of requests.Response the clients use."""
+
+    def __init__(self, status_code=200, body=b"", headers=None, url="http://stub/"):
+        self.status_code = status_code
+        self.content = body.encode("utf-8") if isinstance(body, str) else body
+        self.headers = requests.structures.CaseInsensitiveDict(headers or {})
+        self.url = url
+        self.reason = "OK" if self.ok else "Error"
+        self.encoding = "utf-8"
+        self.raw = io.BytesIO(self.content)
+
+    @property
+    def ok(self):
+        return self.status_code < 400
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding)
+
+    def json(self):
+        return json.loads(self.content)
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.HTTPError(f"{self.status_code} for {self.url}", response=self)
+
+
+class StubSession:
+    """Answer each GET with the next response of a per-URL script.
+
+    routes maps a URL to a list of StubResponse objects or exceptions; the
+    last one is repeated once the others are used up. Every call is kept in
+    calls as (url, headers).
+    """
+
+    def __init__(self, routes):
+        self.routes = {url: list(responses) for url, responses in routes.items()}
+        self.headers = {}
+        self.calls = []
+
+    def get(self, url, headers=None, **_):
+        self.calls.append((url, dict(headers or {})))
+        script = self.routes[url]
+        answer = script.pop(0) if len(script) > 1 else script[0]
+        if isinstance(answer, BaseException):
+            raise answer
+        answer.url = url
+        answer.raw = io.BytesIO(answer.content)  # Rewound for every request that repeats it
+        return answer
+
+    def mount(self, prefix, adapter):
+        pass
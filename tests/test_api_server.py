@@ -0,0 +1,221 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import Future
+
+import pytest
+
+import map_cache
+from api_server import ConversionService, make_server
+from map_loader import GITHUB_REPO, MapLoader
+from stubs import StubResponse, StubSession
+
+TEA = "title Tea\ncomponent Tea [0.63, 0.81]\ncomponent Kettle [0.43, 0.35]\nTea->Kettle\n"
+KETTLE = "title Kettle\ncomponent Kettle [0.43, 0.35]\ncomponent Power [0.1, 0.7]\nKettle->Power\n"
+
+
+class StubOWM:
+    """OWMClient.get and the cache methods MapLoader uses, over a fixed set of maps."""
+
+    maps = {"tea": TEA}
+
+    def get(self, map_id):
+        return self.maps.get(map_id, [])
+
+    def cached(self, map_id):
+        return self.maps.get(map_id)
+
+    def store(self, map_id, map_text, headers):
+        pass
+
+
+class StubRepo:
+    files = {"research/kettle": KETTLE}
+
+    def read(self, path):
+        return self.files[path]
+
+
+@pytest.fixture(scope="module", name="service")
+def service_fixture():
+    # Every map but the missing one is served from the stub OWM cache or the stub snapshot
+    session = StubSession({f"https://api.test/repos/{GITHUB_REPO}/contents/missing": [StubResponse(404)]})
+    loader = MapLoader(
+        owm_url="https://owm.test/?id=", github_api="https://api.test", owm_client=StubOWM(), snapshot=StubRepo(),
+        session=session,
+    )
+    conversions = ConversionService(StubOWM(), StubRepo(), workers=2, loader=loader)
+    yield conversions
+    conversions.close()
+
+
+@pytest.fixture(scope="module", name="api")
+def api_fixture(service):
+    server = make_server("127.0.0.1", 0, service)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    def request(path, data=None, headers=None):
+        if isinstance(data, dict):
+            data = json.dumps(data).encode("utf-8")
+            headers = {"Content-Type": "application/json", **(headers or {})}
+        try:
+            with urllib.request.urlopen(urllib.request.Request(base + path, data, headers or {})) as response:
+                return response.status, response.headers, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.headers, e.read()
+
+    yield request
+    server.shutdown()
+    server.server_close()
+
+
+def test_lists_formats(api):
+    status, _, body = api("/formats")
+    assert status == 200
+    assert json.loads(body)["formats"] == ["cypher", "gml", "graph", "json", "toml", "yaml"]
+
+
+def test_converts_posted_map_text(api):
+    status, headers, body = api("/convert/json", TEA.encode("utf-8"))
+
+    assert status == 200
+    assert headers["Content-Type"] == "application/json; charset=utf-8"
+    assert json.loads(body)["title"] == ["Tea"]
+    assert headers["ETag"] == f'"{headers["X-Content-Hash"]}-json"'
+
+
+def test_answers_a_matching_etag_with_not_modified(api):
+    _, headers, _ = api("/convert/yaml", TEA.encode("utf-8"))
+    status, _, body = api("/convert/yaml", TEA.encode("utf-8"), {"If-None-Match": headers["ETag"]})
+
+    assert (status, body) == (304, b"")
+
+
+def test_converts_maps_by_id_and_path(api):
+    assert api("/convert/gml?map_id=tea")[0] == 200
+    status, _, body = api("/convert/toml?path=research/kettle")
+    assert status == 200
+    assert b'title = [ "Kettle",]' in body
+
+
+@pytest.mark.parametrize(
+    "path, data, status",
+    [
+        ("/convert/json?map_id=unknown", None, 404),
+        ("/convert/json?path=missing", None, 404),
+        ("/convert/pdf", TEA.encode("utf-8"), 404),
+        ("/convert/json", {"nothing": 1}, 400),
+        ("/nowhere", None, 404),
+    ],
+)
+def test_reports_errors_with_a_status(api, path, data, status):
+    code, _, body = api(path, data)
+    assert code == status
+    assert "error" in json.loads(body)
+
+
+def test_bulk_converts_every_map_and_isolates_failures(api):
+    maps = [
+        {"id": "text", "text": TEA},
+        {"id": "owm", "map_id": "tea"},
+        {"id": "repo", "path": "research/kettle"},
+        {"id": "gone", "path": "missing"},
+        {"id": "unknown", "map_id": "unknown"},
+    ]
+    status, _, body = api("/bulk", {"formats": ["json", "cypher"], "maps": maps})
+
+    results = {result["id"]: result for result in json.loads(body)["results"]}
+    assert status == 200
+    assert list(results) == ["text", "owm", "repo", "gone", "unknown"]
+    assert results["text"]["outputs"] == results["owm"]["outputs"]
+    assert json.loads(results["repo"]["outputs"]["json"])["title"] == ["Kettle"]
+    assert "404" in results["gone"]["error"]
+    assert "outputs" not in results["unknown"]
+
+
+class ManualPool:
+    """A process pool stand-in whose conversions run only when run_all is called."""
+
+    def __init__(self, immediate=False):
+        self.immediate = immediate
+        self.submitted = []
+
+    def submit(self, fn, *args):
+        future = Future()
+        self.submitted.append((future, fn, args))
+        if self.immediate:
+            self.run_all()
+        return future
+
+    def run_all(self):
+        for future, fn, args in self.submitted:
+            if not future.done():
+                try:
+                    future.set_result(fn(*args))
+                except Exception as e:  # pylint: disable=broad-except
+                    future.set_exception(e)
+
+    def shutdown(self, **_):
+        pass
+
+
+def manual_service(pool):
+    conversions = ConversionService(workers=1)
+    conversions._pool.shutdown()  # pylint: disable=protected-access
+    conversions._pool = pool  # pylint: disable=protected-access
+    return conversions
+
+
+def test_concurrent_requests_share_one_conversion():
+    pool = ManualPool()
+    conversions = manual_service(pool)
+    map_text = TEA + "component Milk [0.5, 0.5]\n"
+
+    digest, first = conversions.submit(map_text, "graph")
+    same_digest, second = conversions.submit(map_text, "graph")
+    assert (same_digest, second) == (digest, first)
+    assert len(pool.submitted) == 1
+
+    pool.run_all()
+    # Once on disk, the export is served without the pool
+    third = conversions.submit(map_text, "graph")[1]
+    assert third.result() == first.result()
+    assert len(pool.submitted) == 1
+
+
+def test_a_conversion_that_finishes_at_once_does_not_deadlock():
+    conversions = manual_service(ManualPool(immediate=True))
+    map_text = TEA + "component Sugar [0.7, 0.5]\n"
+
+    _, future = conversions.submit(map_text, "cypher")
+
+    assert future.done()
+    assert not conversions._inflight  # pylint: disable=protected-access
+
+
+def test_bulk_reads_every_output_before_the_export_cache_prunes_it(monkeypatch):
+    monkeypatch.setattr(map_cache, "EXPORT_CACHE_FILES", 2)
+    conversions = manual_service(ManualPool(immediate=True))
+    maps = [{"text": TEA + f"component Cup{i} [0.6, 0.{i}]\n"} for i in range(5)]
+
+    results = conversions.bulk({"formats": ["json", "cypher", "gml"], "maps": maps})
+    assert all(sorted(result["outputs"]) == ["cypher", "gml", "json"] for result in results)
+    assert not [result for result in results if "errors" in result]
+
+
+def test_bulk_reports_every_failed_format(monkeypatch):
+    iter_convert = map_cache.ParsedMap.iter_convert
+
+    def failing_iter_convert(parsed_map, fmt):
+        if fmt in ("toml", "yaml"):
+            raise RuntimeError(f"no {fmt}")
+        return iter_convert(parsed_map, fmt)
+
+    monkeypatch.setattr(map_cache.ParsedMap, "iter_convert", failing_iter_convert)
+    conversions = manual_service(ManualPool(immediate=True))
+
+    result = conversions.bulk({"formats": ["json", "toml", "yaml"], "maps": [{"text": TEA + "component Jug\n"}]})[0]
+    assert list(result["outputs"]) == ["json"]
+    assert result["errors"] == {"toml": "RuntimeError: no toml", "yaml": "RuntimeError: no yaml"}
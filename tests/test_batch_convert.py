@@ -0,0 +1,38 @@
+import json
+import os
+
+import batch_convert
+from batch_convert import MANIFEST_NAME, run
+
+TEA = "title Tea\ncomponent Tea [0.63, 0.81]\ncomponent Kettle [0.43, 0.35]\nTea->Kettle\n"
+
+
+def write_maps(input_dir, maps):
+    for path, text in maps.items():
+        os.makedirs(os.path.dirname(os.path.join(input_dir, path)), exist_ok=True)
+        with open(os.path.join(input_dir, path), "w", encoding="utf-8") as file:
+            file.write(text)
+
+
+def test_converts_then_skips_unchanged_maps(tmp_path):
+    write_maps(tmp_path / "maps", {"research/tea": TEA, "research/kettle": "title Kettle\n"})
+
+    first = run(str(tmp_path / "maps"), str(tmp_path / "out"), ["json", "yaml"], workers=1)
+    second = run(str(tmp_path / "maps"), str(tmp_path / "out"), ["json", "yaml"], workers=1)
+
+    assert (first["converted"], first["skipped"]) == (2, 0)
+    assert (second["converted"], second["skipped"]) == (0, 2)
+    with open(tmp_path / "out" / "research" / "tea.json", encoding="utf-8") as file:
+        assert json.load(file)["title"] == ["Tea"]
+
+
+def test_reconverts_outputs_of_an_older_cache_version(tmp_path, monkeypatch):
+    write_maps(tmp_path / "maps", {"research/tea": TEA})
+    run(str(tmp_path / "maps"), str(tmp_path / "out"), ["json"], workers=1)
+
+    monkeypatch.setattr(batch_convert, "CACHE_VERSION", batch_convert.CACHE_VERSION + 1)
+    summary = run(str(tmp_path / "maps"), str(tmp_path / "out"), ["json"], workers=1)
+
+    assert (summary["converted"], summary["skipped"]) == (1, 0)
+    with open(tmp_path / "out" / MANIFEST_NAME, encoding="utf-8") as manifest:
+        assert len(manifest.readlines()) == 2
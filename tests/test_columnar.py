@@ -0,0 +1,52 @@
+import pytest
+from wardley_map import parse_wardley_map
+
+from columnar import map_tables, read_dataset, write_dataset
+
+TEA = (
+    "title Tea\nanchor Business [0.95, 0.63]\ncomponent Tea [0.63, 0.81]\ncomponent Kettle [0.43, 0.35]\n"
+    "Tea->Kettle\npipeline Kettle [0.2, 0.9]\nnote Hot water [0.5, 0.5]\nannotation 1 [0.4, 0.6] Boils\n"
+)
+# Grid has no position; the parser also drops the last letter of such a name
+POWER = "title Power\ncomponent Power [0.1, 0.7]\ncomponent Grid\n"
+BROKEN = "title Broken\nevolve Kettle\n"  # parse_wardley_map raises on an evolve without a position
+MAPS = [("tea", TEA), ("broken", BROKEN), ("power", POWER)]
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_round_trips_every_table_and_skips_a_broken_map(tmp_path, fmt, capsys):
+    assert write_dataset(MAPS, str(tmp_path), fmt, batch_maps=1) == 2
+    assert "Error exporting map broken" in capsys.readouterr().out
+
+    maps = read_dataset(str(tmp_path), "maps", fmt).to_pylist()
+    assert maps == [{"map": "tea", "title": "Tea"}, {"map": "power", "title": "Power"}]
+    components = {row["name"]: row for row in read_dataset(str(tmp_path), "components", fmt).to_pylist()}
+    assert (components["Kettle"]["x"], components["Kettle"]["y"]) == (0.35, 0.43)
+    assert components["Kettle"]["stage"] == "custom"
+    assert components["Gri"]["x"] is None and components["Gri"]["y"] is None
+    assert read_dataset(str(tmp_path), "links", fmt).to_pylist() == [{"map": "tea", "src": "Tea", "tgt": "Kettle"}]
+    [note] = read_dataset(str(tmp_path), "notes", fmt).to_pylist()
+    assert note["text"] == "Hot water"
+    [annotation] = read_dataset(str(tmp_path), "annotations", fmt).to_pylist()
+    assert (annotation["number"], annotation["text"]) == (1, "Boils")
+
+
+def test_matches_the_tables_of_a_single_map(tmp_path):
+    write_dataset([("tea", TEA)], str(tmp_path))
+
+    for table, data in map_tables(parse_wardley_map(TEA), "tea").items():
+        assert read_dataset(str(tmp_path), table).to_pylist() == data.to_pylist()
+
+
+def test_partitions_are_kept_apart_and_not_overwritten_silently(tmp_path):
+    write_dataset([("tea", TEA)], str(tmp_path), partition="2024-05")
+    write_dataset([("power", POWER)], str(tmp_path), partition="2024-06")
+    with pytest.raises(FileExistsError):
+        write_dataset([("power", POWER)], str(tmp_path), partition="2024-06")
+
+    maps = read_dataset(str(tmp_path), "maps").to_pylist()
+    assert sorted((row["map"], row["partition"]) for row in maps) == [("power", "2024-06"), ("tea", "2024-05")]
+
+    write_dataset([("tea", TEA)], str(tmp_path), partition="2024-06", overwrite=True)
+    maps = read_dataset(str(tmp_path), "maps").to_pylist()
+    assert sorted((row["map"], row["partition"]) for row in maps) == [("tea", "2024-05"), ("tea", "2024-06")]
@@ -0,0 +1,55 @@
+import pytest
+from wardley_map import parse_wardley_map
+
+from compact_map import CompactMap
+from map_graph import build_graph
+
+TEA = (
+    "title Tea Shop\n"
+    "anchor Business [0.95, 0.63]\n"
+    "component Cup of Tea [0.79, 0.61] label [19, -4]\n"
+    "component Tea [0.63, 0.81]\n"
+    "component Kettle [0.43, 0.35]\n"
+    "component Electric [0.43, 0.6]\n"
+    "component Gas [0.43, 0.3]\n"
+    "component Grid\n"  # No position
+    "component Kettle [0.43, 0.4]\n"  # The same name again
+    "pipeline Kettle [0.2, 0.9]\n"
+    "Business->Cup of Tea\nCup of Tea->Tea\nTea->Kettle\nKettle->Gas\nKettle->Nowhere\n"
+    "note Hot water [0.5, 0.5]\n"
+    "evolve Tea 0.9\n"
+)
+MAPS = [TEA, "title Kettle\ncomponent Kettle [0.43, 0.35]\n", "title Empty\n"]
+
+
+@pytest.mark.parametrize("map_text", MAPS)
+def test_round_trips_the_parsed_map(map_text):
+    parsed_map = parse_wardley_map(map_text)
+
+    assert CompactMap(parsed_map).to_dict() == parsed_map
+
+
+@pytest.mark.parametrize("map_text", MAPS)
+def test_builds_the_same_graph(map_text):
+    parsed_map = parse_wardley_map(map_text)
+    expected = build_graph(parsed_map)
+    G = CompactMap(parsed_map).graph()
+
+    assert list(G.nodes(data=True)) == list(expected.nodes(data=True))
+    assert list(G.edges(data=True)) == list(expected.edges(data=True))
+
+
+def test_reads_rows_through_views():
+    compact = CompactMap(parse_wardley_map(TEA))
+    kettle = compact.components()[2]
+
+    assert (kettle.name, kettle.stage, kettle.x, kettle.y) == ("Kettle", "custom", 0.35, 0.43)
+    assert [(link.src, link.tgt) for link in compact.links()][:2] == [("Business", "Cup of Tea"), ("Cup of Tea", "Tea")]
+
+
+def test_rejects_unknown_fields():
+    parsed_map = parse_wardley_map(TEA)
+    parsed_map["components"][0]["extra"] = 1
+
+    with pytest.raises(ValueError, match="Unsupported fields"):
+        CompactMap(parsed_map)
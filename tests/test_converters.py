@@ -0,0 +1,28 @@
+import json
+
+from wardley_map import parse_wardley_map
+
+from converters import CONVERTERS, STREAMING_CONVERTERS
+from map_cache import ParsedMap
+
+TEA = "title Tea\ncomponent Tea [0.63, 0.81]\ncomponent Kettle [0.43, 0.35]\nTea->Kettle\n"
+
+
+def test_plain_conversions_leave_the_metrics_out():
+    parsed = parse_wardley_map(TEA)
+
+    assert "metrics" not in json.loads(CONVERTERS["json"](parsed))
+    assert "risk" not in CONVERTERS["cypher"](parsed)
+    assert "risk" not in CONVERTERS["gml"](parsed)
+
+
+def test_the_annotated_graph_adds_the_metrics():
+    parsed_map = ParsedMap(TEA)
+    graph = parsed_map.graph()
+
+    document = json.loads(parsed_map.convert("json"))
+    assert document["metrics"]["Kettle"]["fan_in"] == 1
+    assert "risk:" in parsed_map.convert("cypher")
+    for fmt in ("json", "cypher", "graph", "gml"):
+        streamed = "".join(STREAMING_CONVERTERS[fmt](parsed_map.data, graph=graph))
+        assert streamed == CONVERTERS[fmt](parsed_map.data, graph=graph) == parsed_map.convert(fmt)
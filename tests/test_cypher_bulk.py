@@ -0,0 +1,75 @@
+import csv
+
+from cypher_bulk import bulk_cypher_script, cypher_literal, map_rows, write_import_csvs
+
+TEA = "title Tea's Shop\ncomponent Tea [0.63, 0.81]\ncomponent Kettle [0.43, 0.35]\nTea->Kettle\n"
+KETTLE = "title Kettle\ncomponent Kettle [0.43, 0.35]\ncomponent Power [0.1, 0.7]\nKettle->Power\n"
+BROKEN = "title Broken\nevolve Kettle\n"  # parse_wardley_map raises on an evolve without a position
+MAPS = [("maps/tea", TEA), ("maps/broken", BROKEN), ("maps/kettle", KETTLE)]
+
+
+def read_csv(path):
+    with open(path, newline="", encoding="utf-8") as file:
+        return list(csv.reader(file))
+
+
+def test_map_rows():
+    rows = map_rows("maps/tea", TEA)
+
+    assert rows["maps"] == [{"id": "maps/tea", "title": "Tea's Shop"}]
+    kettle = next(row for row in rows["components"] if row["name"] == "Kettle")
+    assert kettle == {
+        "map": "maps/tea", "name": "Kettle", "type": "component", "stage": "custom",
+        "visibility": "medium", "x": 0.35, "y": 0.43,
+    }
+    assert rows["links"] == [{"map": "maps/tea", "src": "Tea", "tgt": "Kettle"}]
+
+
+def test_cypher_literals_are_escaped_and_valid():
+    assert cypher_literal({"name": "Tea's \\ pot", "n": [1, 2.5, True, None]}) == (
+        "{`name`: 'Tea\\'s \\\\ pot', `n`: [1, 2.5, true, null]}"
+    )
+    assert cypher_literal(float("nan")) == "null"
+    assert cypher_literal(float("inf")) == "null"
+
+
+def test_script_creates_constraints_then_batches_in_order(capsys):
+    script = bulk_cypher_script(MAPS, batch_size=2)
+    assert "Error exporting map maps/broken" in capsys.readouterr().out
+
+    lines = script.splitlines()
+    assert lines[0].startswith("CREATE CONSTRAINT map_id")
+    queries = [line for line in lines if line.startswith("UNWIND")]
+    params = [line for line in lines if line.startswith(":param rows => ")]
+    assert len(queries) == len(params)
+    assert "`title`: 'Tea\\'s Shop'" in script
+    # Every link batch follows the batches creating its components
+    first_link = next(i for i, query in enumerate(queries) if "RELATES_TO" in query)
+    assert all("MATCH (m:Map" in query or "MERGE (m:Map" in query for query in queries[:first_link])
+
+
+def test_import_csvs_have_neo4j_headers_and_unique_ids(tmp_path, capsys):
+    write_import_csvs(MAPS, str(tmp_path))
+    assert "Error exporting map maps/broken" in capsys.readouterr().out
+
+    maps = read_csv(tmp_path / "maps.csv")
+    assert maps == [
+        ["id:ID(Map)", "title", ":LABEL"], ["maps/tea", "Tea's Shop", "Map"], ["maps/kettle", "Kettle", "Map"]
+    ]
+    components = read_csv(tmp_path / "components.csv")
+    assert components[0] == ["name:ID(Component)", ":LABEL"]
+    assert sorted(row[0] for row in components[1:]) == ["Kettle", "Power", "Tea"]  # Kettle once across maps
+    contains = read_csv(tmp_path / "contains.csv")
+    assert contains[0][5:] == ["x:float", "y:float", ":TYPE"]
+    assert ["maps/kettle", "Power", "component", "commodity", "low", "0.7", "0.1", "CONTAINS"] in contains
+    assert read_csv(tmp_path / "relates_to.csv") == [
+        [":START_ID(Component)", ":END_ID(Component)", "map", ":TYPE"],
+        ["Tea", "Kettle", "maps/tea", "RELATES_TO"],
+        ["Kettle", "Power", "maps/kettle", "RELATES_TO"],
+    ]
+
+
+def test_links_leave_out_pipeline_membership():
+    pipeline = KETTLE + "component Gas [0.43, 0.3]\npipeline Kettle [0.2, 0.9]\n"
+
+    assert map_rows("kettle", pipeline)["links"] == [{"map": "kettle", "src": "Kettle", "tgt": "Power"}]
@@ -0,0 +1,88 @@
+import os
+import tarfile
+import time
+
+import pytest
+import requests
+
+from github_snapshot import RepoSnapshot
+from map_files import is_map_file
+from stubs import StubResponse, StubSession
+
+REPO = "swardley/MAP-REPOSITORY"
+API = "https://api.test"
+HEAD_URL = f"{API}/repos/{REPO}/commits/HEAD"
+SHA = "abc1234"
+TARBALL_URL = f"{API}/repos/{REPO}/tarball/{SHA}"
+# A GitHub tarball of a two map repository, as recorded from the archive endpoint
+with open(os.path.join(os.path.dirname(__file__), "fixtures", "repo.tar.gz"), "rb") as fixture:
+    TARBALL = fixture.read()
+
+
+def snapshot(tmp_path, head, tarball):
+    session = StubSession({HEAD_URL: head, TARBALL_URL: tarball})
+    return RepoSnapshot(REPO, cache_dir=str(tmp_path), api_url=API, session=session), session
+
+
+def test_is_map_file():
+    assert is_map_file("research/teashop")
+    assert not is_map_file("README.md")
+    assert not is_map_file("LICENSE")
+    assert not is_map_file("research/.hidden")
+
+
+def test_indexes_the_maps_of_the_tarball(tmp_path):
+    repo, _ = snapshot(tmp_path, [StubResponse(body=SHA, headers={"ETag": '"1"'})], [StubResponse(body=TARBALL)])
+
+    assert repo.refresh() == SHA
+    assert repo.paths() == ["research/kettle", "research/teashop"]
+    assert repo.read("research/kettle") == "title Kettle\ncomponent Kettle [0.43, 0.35]\n"
+    assert repo.neighbours("research/kettle") == ["research/teashop"]
+    sha, files = repo.head()
+    assert sha == SHA and sorted(files) == repo.paths()
+
+
+def test_revalidates_the_head_and_reuses_the_index_on_disk(tmp_path):
+    repo, session = snapshot(
+        tmp_path,
+        [StubResponse(body=SHA, headers={"ETag": '"1"'}), StubResponse(304)],
+        [StubResponse(body=TARBALL)],
+    )
+    repo.refresh()
+    assert repo.refresh(force=True) == SHA
+    assert session.calls[-1] == (HEAD_URL, {"Accept": "application/vnd.github.sha", "If-None-Match": '"1"'})
+    assert [url for url, _ in session.calls].count(TARBALL_URL) == 1
+
+    # A new process serves the snapshot on disk before it has been revalidated
+    restarted = RepoSnapshot(REPO, cache_dir=str(tmp_path), api_url=API, session=StubSession({}))
+    assert restarted.sha == SHA
+    assert sorted(restarted.files) == ["research/kettle", "research/teashop"]
+
+
+def test_keeps_serving_the_last_snapshot_while_github_is_unreachable(tmp_path):
+    repo, _ = snapshot(
+        tmp_path,
+        [StubResponse(body=SHA), requests.ConnectionError("offline")],
+        [StubResponse(body=TARBALL)],
+    )
+    repo.refresh()
+    assert repo.refresh(force=True) == SHA
+    assert repo.paths() == ["research/kettle", "research/teashop"]
+
+
+def test_worker_reports_a_broken_tarball_and_keeps_retrying(tmp_path):
+    repo, _ = snapshot(
+        tmp_path,
+        [StubResponse(body=SHA)],
+        [StubResponse(body=b"not a tarball"), StubResponse(body=TARBALL)],
+    )
+    repo.start(interval=0.3)
+
+    # The first start has no snapshot to fall back on, so the error is raised, not an empty repository
+    with pytest.raises(tarfile.ReadError):
+        repo.paths()
+
+    deadline = time.monotonic() + 5
+    while repo.sha is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert repo.paths() == ["research/kettle", "research/teashop"]
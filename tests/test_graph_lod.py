@@ -0,0 +1,60 @@
+import networkx as nx
+import pytest
+
+from graph_lod import LevelOfDetail
+
+PIPELINES = [{"name": "Kettle", "components": ["Electric", "Gas", "Missing"]}]
+
+
+@pytest.fixture(name="lod")
+def fixture_lod():
+    G = nx.DiGraph()
+    for name, stage, pos in [
+        ("Kettle", "custom", (0.2, 0.4)),
+        ("Electric", "product", (0.6, 0.4)),
+        ("Gas", "product", (0.3, 0.4)),
+        ("Tea", "product", (0.6, 0.8)),
+        ("Cup", "product", (0.7, 0.9)),
+        ("Shop", "product", (0.5, 1.0)),
+        ("Power", "commodity", (0.9, 0.1)),
+    ]:
+        G.add_node(name, stage=stage, pos=pos, color="#000")
+    G.add_edge("Kettle", "Electric", type="pipeline")
+    G.add_edge("Kettle", "Gas", type="pipeline")
+    for src, tgt in [("Tea", "Electric"), ("Cup", "Electric"), ("Tea", "Power"), ("Shop", "Cup")]:
+        G.add_edge(src, tgt)
+    return LevelOfDetail(G, PIPELINES)
+
+
+def test_clusters_pipelines_then_stages(lod):
+    clusters = [(c["kind"], c["label"], [lod.names[row] for row in c["rows"]]) for c in lod.clusters]
+
+    assert clusters == [
+        ("pipeline", "Kettle", ["Kettle", "Electric", "Gas"]),
+        ("stage", "commodity", ["Power"]),
+        ("stage", "product", ["Tea", "Cup", "Shop"]),
+    ]
+    assert (lod.clusters[2]["x"], lod.clusters[2]["y"]) == pytest.approx((0.6, 0.9))
+
+
+def test_expands_the_smallest_clusters_within_the_budget(lod):
+    assert lod.default_expanded(budget=3) == {1}  # Expanding a singleton shows no extra node
+    assert lod.default_expanded(budget=5) == {0, 1}
+    assert lod.default_expanded(budget=7) == {0, 1, 2}
+
+
+def test_collapsed_clusters_are_one_node_with_aggregated_edges(lod):
+    n = len(lod.names)
+    payload = lod.payload({0})
+    nodes = payload["nodes"]
+
+    assert nodes["label"] == ["Kettle", "Electric", "Gas", "Power", "product (3)"]
+    assert nodes["id"] == [0, 1, 2, 6, n + 2]
+    assert nodes["count"] == [0, 0, 0, 0, 3]
+    edges = sorted(zip(payload["edges"]["from"], payload["edges"]["to"], payload["edges"]["count"]))
+    # Tea->Electric and Cup->Electric become one edge of count 2; Shop->Cup is inside the cluster
+    assert edges == [(0, 1, 1), (0, 2, 1), (n + 2, 1, 2), (n + 2, 6, 1)]
+
+
+def test_ignores_unknown_clusters(lod):
+    assert lod.payload({99})["nodes"]["label"] == ["Kettle (3)", "Power", "product (3)"]
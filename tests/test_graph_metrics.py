@@ -0,0 +1,24 @@
+from wardley_map import parse_wardley_map
+
+from graph_metrics import GraphMetrics
+from map_graph import build_graph
+
+TEA = (
+    "title Tea\ncomponent Tea [0.9, 0.5]\ncomponent Kettle [0.43, 0.35]\n"
+    "component Electric [0.43, 0.6]\ncomponent Gas [0.43, 0.3]\npipeline Kettle [0.2, 0.9]\n"
+    "Tea->Kettle\nKettle->Gas\n"
+)
+
+
+def test_pipeline_members_are_not_dependents():
+    G = build_graph(parse_wardley_map(TEA))
+    assert G.edges["Kettle", "Electric"]["type"] == "pipeline"
+    assert "type" not in G.edges["Kettle", "Gas"]  # A link stays a dependency when it is also a membership
+
+    metrics = GraphMetrics.from_graph(G).as_dict()
+
+    assert metrics["Electric"]["fan_in"] == 0
+    assert metrics["Electric"]["depth"] == 0
+    assert metrics["Electric"]["dependents"] == 0
+    assert metrics["Kettle"]["fan_out"] == 1
+    assert metrics["Gas"]["dependents"] == 2
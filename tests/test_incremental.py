@@ -0,0 +1,71 @@
+import json
+
+import pytest
+from wardley_map import parse_wardley_map
+
+from incremental import ContextError, IncrementalMap
+from map_cache import get_parsed_map
+
+TEA_SHOP = """title Tea Shop
+anchor Business [0.95, 0.63]
+anchor Public [0.95, 0.78]
+component Cup of Tea [0.79, 0.61]
+component Tea [0.63, 0.81]
+component Kettle [0.43, 0.35]
+component Power [0.1, 0.7]
+pipeline Kettle [0.2, 0.8]
+component Electric Kettle [0.43, 0.6]
+Business->Cup of Tea
+Cup of Tea->Tea
+Tea->Kettle
+Kettle->Power
+evolve Kettle 0.62
+// A comment
+note Standardising power allows Kettles to evolve faster [0.30, 0.49]
+"""
+EDITS = [
+    TEA_SHOP.replace("[0.63, 0.81]", "[0.64, 0.8]"),
+    TEA_SHOP.replace("Tea->Kettle\n", ""),
+    TEA_SHOP + "component Water [0.38, 0.82]\nTea->Water\n",
+    TEA_SHOP.replace("title Tea Shop", "title Tea House"),
+    TEA_SHOP.replace("component Electric Kettle [0.43, 0.6]", "component Electric Kettle [0.43, 0.1]"),
+]
+
+
+@pytest.mark.parametrize("edited", EDITS)
+def test_updated_matches_a_full_parse(edited):
+    incremental = IncrementalMap.from_text(TEA_SHOP).updated(edited)
+
+    assert incremental is not None
+    assert incremental.data == parse_wardley_map(edited)
+    assert json.loads(incremental.serialize("json")) == parse_wardley_map(edited)
+
+
+def test_from_text_matches_a_full_parse():
+    assert IncrementalMap.from_text(TEA_SHOP).data == parse_wardley_map(TEA_SHOP)
+
+
+def test_a_component_without_coordinates_needs_the_lines_before_it():
+    # It takes the visibility of the component before it, so cannot be parsed on its own
+    positionless = TEA_SHOP + "component Water\n"
+
+    with pytest.raises(ContextError):
+        IncrementalMap.from_text(positionless)
+    assert IncrementalMap.from_text(TEA_SHOP).updated(positionless) is None
+
+
+@pytest.mark.parametrize(
+    "first, second",
+    [
+        (TEA_SHOP, TEA_SHOP + "component Water\n"),
+        (TEA_SHOP + "component Water\n", TEA_SHOP + "component Water\ncomponent Milk [0.5, 0.5]\n"),
+    ],
+    ids=["added", "edited after"],
+)
+def test_get_parsed_map_falls_back_to_a_full_parse(first, second):
+    revised = get_parsed_map(second, previous=get_parsed_map(first))
+
+    assert revised.data == parse_wardley_map(second)
+    components = revised.data["components"]
+    water = components[[c["name"] for c in components].index("Electric Kettle") + 1]
+    assert (water["pos"], water["visibility"]) == ("", "medium")  # Inherited from Electric Kettle
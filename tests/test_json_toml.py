@@ -0,0 +1,70 @@
+import io
+import json
+import random
+
+import pytest
+import toml
+
+from json_toml import iter_toml
+
+
+def random_value(rng, depth):
+    kind = rng.choice(["int", "float", "str", "bool", "list", "tables", "mixed", "dict"] if depth else ["int", "str"])
+    if kind == "int":
+        return rng.randint(-10**6, 10**6)
+    if kind == "float":
+        return rng.choice([0.5, -2.25, 1e20, 3.0e-7, rng.random()])
+    if kind == "str":
+        return rng.choice(["", "tea", "a \"quoted\" word", "line\nbreak", "café", "x" * 40])
+    if kind == "bool":
+        return rng.random() < 0.5
+    if kind == "list":
+        return [random_value(rng, 0) for _ in range(rng.randint(0, 4))]
+    if kind == "tables":
+        return [random_document(rng, depth - 1) for _ in range(rng.randint(1, 3))]
+    if kind == "mixed":
+        items = [random_document(rng, depth - 1), rng.choice([[], 1, "tea"])]
+        rng.shuffle(items)
+        return items
+    return random_document(rng, depth - 1)
+
+
+def random_document(rng, depth=2):
+    return {f"k{i}": random_value(rng, depth) for i in range(rng.randint(0, 4))}
+
+
+def stream_toml(document, chunk_size=7):
+    return "".join(iter_toml(io.StringIO(json.dumps(document)), chunk_size))
+
+
+@pytest.mark.parametrize(
+    "document",
+    [
+        {"title": ["Tea"], "components": [{"name": "Tea", "pos": "[0.5, 0.5]"}], "links": []},
+        {"key1": [{"k0": 1e20, "k1": {}, "k2": []}, []]},
+        {"key1": [[], {"a": 1}]},
+        {"plain": [1, 2, 3], "nested": {"inner": {"x": "y"}}, "after": True},
+        {"spaced key": "value", "empty": {}},
+    ],
+)
+def test_matches_toml_dumps(document):
+    assert stream_toml(document) == toml.dumps(document)
+
+
+def test_matches_toml_dumps_on_random_documents():
+    rng = random.Random(2024)
+    for _ in range(2000):
+        document = random_document(rng)
+        try:
+            expected = toml.dumps(document)
+        except Exception:  # pylint: disable=broad-except
+            # toml cannot write every mix of tables and plain values; neither can the stream
+            with pytest.raises(Exception):
+                stream_toml(document)
+            continue
+        assert stream_toml(document) == expected, document
+
+
+def test_rejects_a_top_level_array():
+    with pytest.raises(ValueError):
+        stream_toml([1, 2])
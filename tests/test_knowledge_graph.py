@@ -0,0 +1,42 @@
+from knowledge_graph import KnowledgeGraph
+from map_cache import cache_stats
+
+TEA = "title Tea\ncomponent Tea [0.63, 0.81]\ncomponent Kettle [0.43, 0.35]\nTea->Kettle\n"
+KETTLE = "title Kettle\ncomponent Kettle [0.43, 0.35]\ncomponent Power [0.1, 0.7]\nKettle->Power\n"
+BROKEN = "title Broken\nevolve Kettle\n"  # parse_wardley_map raises on an evolve without a position
+
+
+def test_merges_components_across_maps(tmp_path):
+    graph = KnowledgeGraph(str(tmp_path / "graph.sqlite"))
+
+    assert graph.update("dir", [("tea", TEA), ("kettle", KETTLE)]) == 2
+    assert [row["map"] for row in graph.maps_using("Kettle")] == ["kettle", "tea"]
+    assert {entry["name"] for entry in graph.neighbours("Kettle")} == {"Tea", "Power"}
+    assert graph.update("dir", [("tea", TEA), ("kettle", KETTLE)]) == 0
+
+
+def test_a_broken_map_does_not_stop_the_others(tmp_path, capsys):
+    graph = KnowledgeGraph(str(tmp_path / "graph.sqlite"))
+
+    assert graph.update("dir", [("tea", TEA), ("broken", BROKEN), ("kettle", KETTLE)]) == 2
+    assert "Error ingesting map dir:broken" in capsys.readouterr().out
+    assert graph.stats()["maps"] == 2
+
+
+def test_keeps_maps_that_could_not_be_fetched(tmp_path):
+    graph = KnowledgeGraph(str(tmp_path / "graph.sqlite"))
+    graph.update("owm", [("tea", TEA), ("kettle", KETTLE)])
+
+    graph.update("owm", [("tea", []), ("kettle", KETTLE)])  # OWMClient.get returns [] on failure
+    assert [row["map"] for row in graph.maps_using("Tea")] == ["tea"]
+
+    graph.update("owm", [("kettle", KETTLE)])
+    assert graph.maps_using("Tea") == []
+
+
+def test_leaves_the_shared_parse_cache_alone(tmp_path):
+    before = cache_stats()["parsed_maps"]
+    KnowledgeGraph(str(tmp_path / "graph.sqlite")).update("dir", [("tea", TEA), ("kettle", KETTLE)])
+    after = cache_stats()["parsed_maps"]
+
+    assert (after["entries"], after["misses"]) == (before["entries"], before["misses"])
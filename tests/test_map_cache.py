@@ -0,0 +1,53 @@
+import os
+import sys
+
+import numpy
+import pyarrow
+
+from map_cache import LRUCache, cache_stats, prune_dir, register_cache, sizeof
+from map_images import MapImages
+from owm_client import OWMClient
+
+
+def test_sizeof_counts_buffers_that_report_nbytes():
+    array = numpy.zeros(100_000)
+    table = pyarrow.table({"x": array})
+
+    assert sizeof(array) >= array.nbytes
+    assert sizeof(table) >= table.nbytes > 0
+    assert sizeof({"table": table}) >= table.nbytes
+    assert sizeof("tea") == sys.getsizeof("tea")
+
+
+def test_register_cache_keeps_one_cache_per_name():
+    first = register_cache("test_cache", LRUCache(4))
+    assert register_cache("test_cache", LRUCache(4)) is first
+    first.put("key", "value")
+    assert cache_stats()["test_cache"] == first.stats()
+
+
+def test_instances_share_one_cache_without_sharing_entries(tmp_path):
+    clients = [OWMClient(cache_dir=str(tmp_path / name)) for name in ("a", "b")]
+    images = [MapImages(cache_dir=str(tmp_path / name)) for name in ("a", "b")]
+    assert clients[0]._entries is clients[1]._entries  # pylint: disable=protected-access
+    assert images[0]._images is images[1]._images  # pylint: disable=protected-access
+
+    clients[0]._store_entry("tea", {"text": "title Tea"})  # pylint: disable=protected-access
+    assert clients[1].cached("tea") is None
+
+
+def test_prune_dir_skips_files_removed_by_another_pruner(tmp_path, monkeypatch):
+    for i in range(4):
+        path = tmp_path / f"{i}.txt"
+        path.write_text("x")
+        os.utime(path, (i, i))
+    scandir = os.scandir
+
+    def scandir_then_remove(directory):
+        entries = list(scandir(directory))
+        os.remove(tmp_path / "3.txt")  # Gone before it is stat'ed
+        return iter(entries)
+
+    monkeypatch.setattr(os, "scandir", scandir_then_remove)
+    prune_dir(str(tmp_path), 2)
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["1.txt", "2.txt"]
@@ -0,0 +1,94 @@
+import subprocess
+
+import pytest
+
+from map_history import EMPTY, GitMirror, MapHistory, diff, snapshot
+
+V1 = "title Tea\ncomponent Tea [0.6, 0.8]\ncomponent Kettle [0.4, 0.3]\nTea->Kettle\n"
+V2 = (
+    "title Tea\ncomponent Tea [0.6, 0.8]\ncomponent Kettle [0.4, 0.5]\ncomponent Power [0.4, 0.7]\n"
+    "Tea->Kettle\nKettle->Power\npipeline Kettle [0.2, 0.9]\n"
+)
+BROKEN = "title Tea\nevolve Kettle\n"  # parse_wardley_map raises on an evolve without a position
+V3 = "title Tea\ncomponent Tea [0.6, 0.8]\ncomponent Power [0.4, 0.7]\n"
+
+
+def test_diff_lists_every_kind_of_change():
+    delta = diff(snapshot(V1), snapshot(V2))
+
+    assert delta["added"] == {"Power": ["commodity", 0.7, 0.4]}
+    assert delta["moved"] == {"Kettle": [0.5, 0.4]}
+    assert delta["stage"] == {"Kettle": ["custom", "product"]}
+    assert delta["links_added"] == [["Kettle", "Power"]]
+    assert delta["pipelines_added"] == ["Kettle"]
+    assert delta["joined"] == {"Kettle": ["Power"]}
+    assert "removed" not in delta and "links_removed" not in delta
+
+
+def test_diff_of_a_map_with_itself_is_empty():
+    assert not diff(snapshot(V2), snapshot(V2))
+    assert diff(EMPTY, snapshot(V1))["added"].keys() == {"Tea", "Kettle"}
+    assert diff(snapshot(V1), EMPTY) == {"removed": ["Kettle", "Tea"], "links_removed": [["Tea", "Kettle"]]}
+
+
+@pytest.fixture(name="repo")
+def fixture_repo(tmp_path):
+    """A local git repository of one map; commit(text) adds a revision of it."""
+    work = tmp_path / "work"
+    work.mkdir()
+
+    def git(*args):
+        subprocess.run(
+            ["git", "-c", "user.name=Test", "-c", "user.email=test@example.com", *args],
+            cwd=work, check=True, capture_output=True,
+        )
+
+    def commit(text, subject):
+        (work / "teashop").write_text(text, encoding="utf-8")
+        git("add", "teashop")
+        git("commit", "--quiet", "-m", subject)
+
+    git("init", "--quiet")
+    return str(work / ".git"), commit
+
+
+def test_records_revisions_and_component_history(repo, tmp_path):
+    mirror_path, commit = repo
+    for i, text in enumerate([V1, V2, V3]):
+        commit(text, f"Revision {i}")
+    history = MapHistory(GitMirror(path=mirror_path), str(tmp_path / "history.sqlite"))
+
+    assert history.update("teashop") == 3
+    assert history.update("teashop") == 0
+    revisions = history.revisions("teashop")
+    assert [r["subject"] for r in revisions] == [f"Revision {i}" for i in range(3)]
+
+    changes = history.component_history("teashop", "Kettle")
+    assert [change["seq"] for change in changes] == [0, 1, 2]
+    assert changes[1]["moved"] == [0.5, 0.4]
+    assert changes[2]["removed"] is True
+    assert history.component_history("teashop", "Power")[0]["joined"] == ["Kettle"]
+
+    first, second = revisions[0]["commit"], revisions[1]["commit"]
+    assert history.diff("teashop", first[:8], second) == diff(snapshot(V1), snapshot(V2))
+    with pytest.raises(KeyError):
+        history.snapshot("teashop", "f" * 40)
+
+
+@pytest.mark.parametrize("separate_updates", [False, True])
+def test_a_broken_revision_records_only_its_error(repo, tmp_path, separate_updates):
+    mirror_path, commit = repo
+    history = MapHistory(GitMirror(path=mirror_path), str(tmp_path / "history.sqlite"))
+    for i, text in enumerate([V1, V2, BROKEN, V3]):
+        commit(text, f"Revision {i}")
+        if separate_updates:
+            history.update("teashop")  # The revision after the broken one is compared in a later update
+    history.update("teashop")
+
+    deltas = [revision["delta"] for revision in history.revisions("teashop")]
+    assert list(deltas[2]) == ["error"] and deltas[2]["error"].startswith("IndexError")
+    # Compared with the last readable revision, so nothing is removed and added again
+    assert deltas[3] == diff(snapshot(V2), snapshot(V3))
+    assert "added" not in deltas[3]
+    assert [change["seq"] for change in history.component_history("teashop", "Tea")] == [0, 3]
+    assert [change["seq"] for change in history.component_history("teashop", "Kettle")] == [0, 1, 3]
@@ -0,0 +1,22 @@
+from functools import partial
+
+from map_images import MapImages
+
+TEA = "title Tea\ncomponent Tea [0.63, 0.81]\ncomponent Kettle [0.43, 0.35]\nTea->Kettle\n"
+KETTLE = "title Kettle\ncomponent Kettle [0.43, 0.35]\n"
+
+
+def fail(map_id):
+    raise RuntimeError(f"cannot load {map_id}")
+
+
+def test_prewarm_draws_the_remaining_maps_after_a_failure(tmp_path, capsys):
+    images = MapImages(cache_dir=str(tmp_path))
+
+    images.prewarm([partial(str, TEA), partial(fail, "broken"), partial(str, KETTLE)]).result()
+
+    assert "Error pre-rendering map broken" in capsys.readouterr().out
+    for text in (TEA, KETTLE):
+        image, _ = images.get(text)
+        assert image.startswith(b"\x89PNG")
+    assert len(list((tmp_path / "images").glob("*.png"))) == 2
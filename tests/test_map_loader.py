@@ -0,0 +1,138 @@
+import json
+import time
+import zipfile
+
+import pytest
+
+from converters import EXTENSIONS
+from map_cache import EXPORT_CACHE_FILES, ParsedMap
+from map_loader import MapLoader, RateLimit
+from stubs import StubResponse, StubSession
+
+OWM = "https://owm.test/fetch?id="
+GITHUB = "https://github.test"
+TEA = "title Tea\ncomponent Tea [0.63, 0.81]\ncomponent Kettle [0.43, 0.35]\nTea->Kettle\n"
+KETTLE = "title Kettle\ncomponent Kettle [0.43, 0.35]\n"
+BROKEN = "title Broken\nevolve Kettle\n"  # parse_wardley_map raises on an evolve without a position
+
+
+def owm_map(text, status=200, headers=None):
+    return StubResponse(status, json.dumps({"text": text}), headers)
+
+
+def loader_for(routes, **options):
+    session = StubSession(routes)
+    options = {"backoff": 0, "concurrency": 4, **options}
+    return MapLoader(owm_url=OWM, github_api=GITHUB, repo="org/maps", session=session, **options), session
+
+
+def test_retries_a_failed_request():
+    loader, session = loader_for({OWM + "tea": [StubResponse(503), StubResponse(502), owm_map(TEA)]})
+
+    [record] = loader.load(["owm:tea"])
+    assert record["text"] == TEA
+    assert len(session.calls) == 3
+
+
+def test_gives_up_after_the_retries_and_on_a_missing_map():
+    loader, session = loader_for(
+        {OWM + "down": [StubResponse(503)], GITHUB + "/repos/org/maps/contents/gone": [StubResponse(404)]}, retries=2
+    )
+
+    down, gone = loader.load(["down", "github:gone"])
+    assert down["error"].startswith("HTTPError: 503") and gone["error"].startswith("HTTPError: 404")
+    assert [url for url, _ in session.calls].count(OWM + "down") == 3
+    assert [url for url, _ in session.calls].count(GITHUB + "/repos/org/maps/contents/gone") == 1
+
+
+def test_waits_for_retry_after():
+    loader, _ = loader_for({OWM + "tea": [StubResponse(429, headers={"Retry-After": "0.3"}), owm_map(TEA)]})
+
+    started = time.monotonic()
+    [record] = loader.load(["tea"])
+    assert record["text"] == TEA
+    assert time.monotonic() - started >= 0.25
+
+
+def test_fails_instead_of_waiting_longer_than_max_wait():
+    loader, session = loader_for(
+        {OWM + "tea": [StubResponse(429, headers={"Retry-After": "120"}), owm_map(TEA)]}, max_wait=1
+    )
+
+    [record] = loader.load(["tea"])
+    assert "Rate limited by owm.test" in record["error"]
+    assert len(session.calls) == 1
+
+
+def test_pauses_when_the_quota_is_nearly_spent():
+    limit = RateLimit(reserve=5)
+    reset = time.time() + 30
+    limit.update(StubResponse(headers={"X-RateLimit-Remaining": "10", "X-RateLimit-Reset": str(reset)}))
+    assert limit.delay() == 0 and limit.remaining == 9
+
+    limit.update(StubResponse(headers={"X-RateLimit-Remaining": "5", "X-RateLimit-Reset": str(reset)}))
+    assert 25 < limit.delay() <= 30
+    assert limit.exhausted(StubResponse(403, headers={"X-RateLimit-Remaining": "0"}))
+    assert not limit.exhausted(StubResponse(403))
+
+
+def test_a_map_that_cannot_be_parsed_fails_alone():
+    loader, _ = loader_for({OWM + "tea": [owm_map(TEA)], OWM + "broken": [owm_map(BROKEN)]})
+
+    tea, broken = loader.load(["tea", "broken"], parse=True)
+    assert tea["parsed"].data["title"] == ["Tea"]
+    assert broken["error"].startswith("IndexError")
+    assert "parsed" not in broken
+
+
+@pytest.fixture(name="failing_kettle_export")
+def fixture_failing_kettle_export(monkeypatch):
+    iter_convert = ParsedMap.iter_convert
+
+    def failing_iter_convert(parsed_map, fmt):
+        if parsed_map.text == KETTLE:
+            raise OSError("disk full")
+        return iter_convert(parsed_map, fmt)
+
+    monkeypatch.setattr(ParsedMap, "iter_convert", failing_iter_convert)
+
+
+@pytest.mark.usefixtures("failing_kettle_export")
+def test_export_zip_leaves_out_only_the_maps_that_failed(tmp_path):
+    loader, _ = loader_for({
+        OWM + "tea": [owm_map(TEA)],
+        OWM + "kettle": [owm_map(KETTLE)],
+        OWM + "broken": [owm_map(BROKEN)],
+        GITHUB + "/repos/org/maps/contents/research/tea": [StubResponse(body=TEA)],
+    })
+    zip_path = str(tmp_path / "maps.zip")
+
+    tea, kettle, broken, repo_tea = loader.export_zip(
+        ["tea", "kettle", "broken", "github:research/tea"], ["json", "gml"], zip_path
+    )
+    assert tea["files"] == ["tea.json", "tea.gml"]
+    assert repo_tea["files"] == ["research_tea.json", "research_tea.gml"]
+    assert kettle["error"] == "OSError: disk full" and "files" not in kettle
+    assert broken["error"].startswith("IndexError")
+    with zipfile.ZipFile(zip_path) as bundle:
+        assert sorted(bundle.namelist()) == ["research_tea.gml", "research_tea.json", "tea.gml", "tea.json"]
+        assert json.loads(bundle.read("tea.json"))["title"] == ["Tea"]
+
+
+class StubSnapshot:
+    """The files of a repository snapshot, served without a request."""
+
+    def __init__(self, files):
+        self.files = files
+
+
+def test_export_zip_holds_more_outputs_than_the_export_cache(tmp_path):
+    files = {f"maps/{i}": f"title Map {i}\ncomponent Tea [0.5, 0.{i:03d}]\n" for i in range(EXPORT_CACHE_FILES // 5)}
+    loader, session = loader_for({}, snapshot=StubSnapshot(files))
+    zip_path = str(tmp_path / "maps.zip")
+
+    records = loader.export_zip([f"github:{path}" for path in files], sorted(EXTENSIONS), zip_path)
+    assert not [record for record in records if "error" in record]
+    assert not session.calls
+    with zipfile.ZipFile(zip_path) as bundle:
+        assert len(bundle.namelist()) == len(files) * len(EXTENSIONS) > EXPORT_CACHE_FILES
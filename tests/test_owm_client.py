@@ -0,0 +1,141 @@
+import json
+import threading
+import time
+
+from owm_client import OWMClient
+from stubs import StubResponse, StubSession
+
+API = "https://owm.test/fetch?id="
+MAP_URL = API + "tea"
+TEXT = "title Tea\ncomponent Tea [0.5, 0.5]\n"
+
+
+def owm(tmp_path, responses, **options):
+    session = StubSession({MAP_URL: responses})
+    return OWMClient(api_url=API, cache_dir=str(tmp_path), session=session, **options), session
+
+
+def map_response(text, etag='"v1"'):
+    return StubResponse(body=json.dumps({"text": text}), headers={"ETag": etag})
+
+
+def wait_idle(client):
+    deadline = time.monotonic() + 5
+    while client._inflight and time.monotonic() < deadline:  # pylint: disable=protected-access
+        time.sleep(0.01)
+
+
+def test_serves_a_fresh_map_from_the_cache(tmp_path):
+    client, session = owm(tmp_path, [map_response(TEXT)])
+
+    assert client.get("tea") == TEXT
+    assert client.get("tea") == TEXT
+    assert client.cached("tea") == TEXT
+    assert len(session.calls) == 1
+
+
+def test_revalidates_an_expired_map_with_its_etag(tmp_path):
+    client, session = owm(tmp_path, [map_response(TEXT), StubResponse(304)], ttl=0, stale_while_revalidate=False)
+
+    assert client.get("tea") == TEXT
+    assert client.get("tea") == TEXT
+    assert session.calls[1] == (MAP_URL, {"If-None-Match": '"v1"'})
+
+
+def test_a_new_client_revalidates_the_map_on_disk(tmp_path):
+    client, _ = owm(tmp_path, [map_response(TEXT)])
+    client.get("tea")
+
+    restarted, session = owm(tmp_path, [map_response("title Changed\n", etag='"v2"')], ttl=0)
+    assert restarted.get("tea") == TEXT  # Stale, served while the refresh runs
+    wait_idle(restarted)
+    assert session.calls == [(MAP_URL, {"If-None-Match": '"v1"'})]
+    assert restarted.get("tea") == "title Changed\n"
+
+
+def test_serves_a_stale_map_while_it_is_revalidated(tmp_path):
+    updated = "title Tea\ncomponent Tea [0.6, 0.5]\n"
+    client, session = owm(tmp_path, [map_response(TEXT), map_response(updated, etag='"v2"')], ttl=0)
+
+    assert client.get("tea") == TEXT
+    assert client.get("tea") == TEXT
+    wait_idle(client)
+    assert len(session.calls) == 2
+    assert client.get("tea") == updated
+
+
+def test_falls_back_to_the_cached_copy_when_the_api_fails(tmp_path):
+    client, _ = owm(tmp_path, [map_response(TEXT), StubResponse(503)], ttl=0, stale_while_revalidate=False)
+
+    assert client.get("tea") == TEXT
+    assert client.get("tea") == TEXT
+
+
+def test_does_not_ask_again_for_a_map_that_just_failed(tmp_path):
+    client, session = owm(tmp_path, [map_response(TEXT), StubResponse(503)], ttl=0)
+
+    assert client.get("tea") == TEXT
+    assert client.get("tea") == TEXT  # Stale, revalidated in the background, which fails
+    wait_idle(client)
+    assert client.get("tea") == TEXT
+    assert client.get("tea") == TEXT
+    wait_idle(client)
+    assert len(session.calls) == 2
+
+
+def test_does_not_ask_again_for_a_missing_map_that_just_failed(tmp_path):
+    client, session = owm(tmp_path, [StubResponse(503), map_response(TEXT)])
+
+    assert client.get("tea") == []
+    assert client.get("tea") == []
+    client.prefetch(["tea"])
+    assert len(session.calls) == 1
+
+
+def test_asks_again_once_the_backoff_is_over(tmp_path):
+    client, session = owm(tmp_path, [StubResponse(503), map_response(TEXT)], failure_backoff=0)
+
+    assert client.get("tea") == []
+    assert client.get("tea") == TEXT
+    assert len(session.calls) == 2
+
+
+def test_prefetch_takes_numeric_ids(tmp_path):
+    session = StubSession({API + "42": [map_response(TEXT)]})
+    client = OWMClient(api_url=API, cache_dir=str(tmp_path), session=session)
+
+    client.prefetch([42])
+    wait_idle(client)
+    assert client.cached(42) == TEXT
+    assert client.get(42) == TEXT
+    assert len(session.calls) == 1
+
+
+def test_returns_an_empty_list_when_a_map_cannot_be_fetched(tmp_path):
+    client, _ = owm(tmp_path, [StubResponse(404)])
+
+    assert client.get("tea") == []
+    assert client.get("") == []
+
+
+def test_concurrent_requests_share_one_fetch(tmp_path):
+    release = threading.Event()
+
+    class SlowSession(StubSession):
+        def get(self, url, headers=None, **_):
+            release.wait(5)
+            return super().get(url, headers)
+
+    session = SlowSession({MAP_URL: [map_response(TEXT)]})
+    client = OWMClient(api_url=API, cache_dir=str(tmp_path), session=session)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(client.get("tea"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == [TEXT] * 8
+    assert len(session.calls) == 1
@@ -0,0 +1,48 @@
+from map_cache import cache_stats
+from search_index import SearchIndex
+
+TEA = "title Tea Shop\ncomponent Tea [0.63, 0.81]\ncomponent Kettle [0.43, 0.35]\nTea->Kettle\n"
+POWER = "title Power Grid\ncomponent Power [0.1, 0.7]\nnote Kettles need power [0.3, 0.5]\n"
+BROKEN = "title Broken\nevolve Kettle\n"  # parse_wardley_map raises on an evolve without a position
+
+
+def keys(hits):
+    return [hit["key"] for hit in hits]
+
+
+def test_finds_maps_by_word_prefix_and_stage(tmp_path):
+    index = SearchIndex(str(tmp_path / "search.sqlite"))
+    index.update("github", [("tea", TEA), ("power", POWER)])
+
+    assert sorted(keys(index.search("kettle"))) == ["power", "tea"]
+    assert keys(index.search("gri")) == ["power"]
+    assert keys(index.search(stage="custom")) == ["tea"]
+    assert keys(index.search("tea", limit=1)) == ["tea"]
+
+
+def test_a_broken_map_does_not_stop_the_others_or_the_commit(tmp_path, capsys):
+    index = SearchIndex(str(tmp_path / "search.sqlite"))
+
+    assert index.update("github", [("tea", TEA), ("broken", BROKEN), ("power", POWER)], sha="a1") == 2
+    assert "Error indexing map github:broken" in capsys.readouterr().out
+    assert sorted(keys(index.search())) == ["power", "tea"]
+    # The commit is recorded, so the next sync of the same commit reads nothing
+    assert index.update("github", iter(()), sha="a1") == 0
+    assert sorted(keys(index.search())) == ["power", "tea"]
+
+
+def test_keeps_maps_that_could_not_be_fetched(tmp_path):
+    index = SearchIndex(str(tmp_path / "search.sqlite"))
+    index.update("owm", [("tea", TEA), ("power", POWER)])
+
+    index.update("owm", [("tea", []), ("power", POWER)])
+    assert sorted(keys(index.search())) == ["power", "tea"]
+
+
+def test_indexing_leaves_the_shared_parse_cache_alone(tmp_path):
+    index = SearchIndex(str(tmp_path / "search.sqlite"))
+    before = cache_stats()["parsed_maps"]
+
+    index.update("github", [(f"map{i}", f"title Map {i}\ncomponent Tea [0.5, 0.5]\n") for i in range(10)])
+    after = cache_stats()["parsed_maps"]
+    assert (after["entries"], after["misses"]) == (before["entries"], before["misses"])